@@ -14,6 +14,8 @@ class COMMAND:
     CMD_START = "Start"
     CMD_STOP = "Stop"
     CMD_MODE ="CMD_MODE"
+    CMD_BRAKE = "CMD_BRAKE"
+    CMD_MAP = "CMD_MAP"
     def __init__(self):
         pass
         #self.intervalChar
@@ -48,6 +48,7 @@ class mywindow(QMainWindow, Ui_Client):
         file.close()
         self.h = self.IP.text()
         self.TCP = VideoStreaming()
+        self.occupancy = []    # [(bearing, free cm or None if unknown), ...] from CMD_MAP
         self.servo1 = 90
         self.servo2 = 90
         self.label_FineServo2.setText("0")
@@ -832,9 +833,17 @@ class mywindow(QMainWindow, Ui_Client):
                     l = "Left:" + Massage[1] + 'V' + ' ' + "Right:" + Massage[2] + 'V'
                     self.L.send(l)
                 elif cmd.CMD_POWER in Massage:
-                    percent_power = int((float(Massage[1]) - 7) / 1.40 * 100)
+                    if len(Massage) > 2:
+                        percent_power = int(Massage[2])    # the car's load-compensated estimate
+                    else:
+                        percent_power = int((float(Massage[1]) - 7) / 1.40 * 100)
                     # self.progress_Power.setValue(percent_power)
                     self.Pb.send(percent_power)
+                elif cmd.CMD_MAP in Massage:
+                    # bearing step, range step, then one hex byte of range cells per bearing, ff unknown
+                    bearing_step, range_step = int(Massage[1]), int(Massage[2])
+                    self.occupancy = [(i * bearing_step, None if cell == 255 else cell * range_step)
+                                      for i, cell in enumerate(bytes.fromhex(Massage[3]))]
 
     def is_valid_jpg(self, jpg_file):
         try:
@@ -1,6 +1,7 @@
 import socket
 import pygame
 import threading
+from Kinematics import Mecanum
 
 class PS5Controller:
     def __init__(self, server_ip, control_port, stop_event):
@@ -8,6 +9,7 @@ class PS5Controller:
         self.control_port = control_port
         self.stop_event = stop_event
         self.current_command = None
+        self.kinematics = Mecanum()
         self.client_socket = self._connect()
         self.joystick = self._initialize_joystick()
         self.servo_0_angle = 90  # Default servo 0 angle
@@ -60,9 +62,9 @@ class PS5Controller:
             turn_speed = int(left_right * 1500)
 
             if forward_speed != 0 or turn_speed != 0:
-                left_motor = forward_speed + turn_speed
-                right_motor = forward_speed - turn_speed
-                self.send_command(f"CMD_MOTOR#{left_motor}#{left_motor}#{right_motor}#{right_motor}\n")
+                # Turning right is clockwise, a negative spin
+                FL, BL, FR, BR = self.kinematics.wheels(0, forward_speed, -turn_speed)
+                self.send_command(f"CMD_MOTOR#{FL}#{BL}#{FR}#{BR}\n")
             else:
                 self.send_command("CMD_MOTOR#0#0#0#0\n")
 
@@ -91,4 +91,77 @@ static int convert_iarray(PyObject *input, uint8_t *ptr, int size) {
     {
         return &ws->channel[channelnum];
     }
+
+    PyObject *ws2811_leds_set(ws2811_channel_t *channel, int start, PyObject *colors)
+    {
+        // Copy a C-contiguous buffer of 32-bit colors, e.g. an array('I') or a NumPy
+        // uint32 array, into the channel from LED start on. Returns whether any changed.
+        Py_buffer view;
+        int changed = 0;
+
+        if (PyObject_GetBuffer(colors, &view, PyBUF_C_CONTIGUOUS) != 0)
+        {
+            return NULL;
+        }
+        if (view.itemsize != sizeof(ws2811_led_t))
+        {
+            PyBuffer_Release(&view);
+            PyErr_SetString(PyExc_TypeError, "Expecting a buffer of 32-bit colors");
+            return NULL;
+        }
+        if (channel->leds == NULL)
+        {
+            PyBuffer_Release(&view);
+            PyErr_SetString(PyExc_RuntimeError, "LEDs not allocated, call begin() first");
+            return NULL;
+        }
+        if (start < 0 || start + view.len / view.itemsize > channel->count)
+        {
+            PyBuffer_Release(&view);
+            PyErr_SetString(PyExc_IndexError, "Colors run past the LEDs of the channel");
+            return NULL;
+        }
+        if (memcmp(&channel->leds[start], view.buf, view.len) != 0)
+        {
+            memcpy(&channel->leds[start], view.buf, view.len);
+            changed = 1;
+        }
+        PyBuffer_Release(&view);
+
+        return PyBool_FromLong(changed);
+    }
+
+    PyObject *ws2811_leds_get(ws2811_channel_t *channel, int start, PyObject *colors)
+    {
+        // Copy the channel's colors from LED start on into a writable buffer of 32-bit values.
+        Py_buffer view;
+
+        if (PyObject_GetBuffer(colors, &view, PyBUF_C_CONTIGUOUS | PyBUF_WRITABLE) != 0)
+        {
+            return NULL;
+        }
+        if (view.itemsize != sizeof(ws2811_led_t))
+        {
+            PyBuffer_Release(&view);
+            PyErr_SetString(PyExc_TypeError, "Expecting a buffer of 32-bit colors");
+            return NULL;
+        }
+        if (channel->leds == NULL)
+        {
+            PyBuffer_Release(&view);
+            PyErr_SetString(PyExc_RuntimeError, "LEDs not allocated, call begin() first");
+            return NULL;
+        }
+        if (start < 0 || start + view.len / view.itemsize > channel->count)
+        {
+            PyBuffer_Release(&view);
+            PyErr_SetString(PyExc_IndexError, "Colors run past the LEDs of the channel");
+            return NULL;
+        }
+        memcpy(view.buf, &channel->leds[start], view.len);
+        PyBuffer_Release(&view);
+
+        Py_INCREF(Py_None);
+        return Py_None;
+    }
 %}
@@ -215,6 +215,14 @@ ws2811_led_set = _rpi_ws281x.ws2811_led_set
 def ws2811_channel_get(*args):
   return _rpi_ws281x.ws2811_channel_get(*args)
 ws2811_channel_get = _rpi_ws281x.ws2811_channel_get
+
+def ws2811_leds_set(*args):
+  return _rpi_ws281x.ws2811_leds_set(*args)
+ws2811_leds_set = _rpi_ws281x.ws2811_leds_set
+
+def ws2811_leds_get(*args):
+  return _rpi_ws281x.ws2811_leds_get(*args)
+ws2811_leds_get = _rpi_ws281x.ws2811_leds_get
 # This file is compatible with both classic and new-style classes.
 
 
@@ -2,6 +2,7 @@
 # Author: Tony DiCola (tony@tonydicola.com), Jeremy Garff (jer@jers.net)
 import _rpi_ws281x as ws
 import atexit
+from array import array
 
 
 try:
@@ -9,6 +10,23 @@ try:
 except NameError:
     xrange = range
 
+# Builds from before the bulk copy only have the per-LED accessors
+_BULK = hasattr(ws, 'ws2811_leds_set')
+
+
+def _color_buffer(colors):
+    """Return colors as something exposing a C-contiguous buffer of unsigned
+    32-bit values, without a copy when it already is one (an array('I') or a
+    NumPy uint32 array).
+    """
+    try:
+        view = memoryview(colors)
+    except TypeError:
+        return array('I', colors)
+    if view.itemsize == 4 and view.c_contiguous and view.format.lstrip('@=<') == 'I':
+        return colors
+    return array('I', view.tolist())
+
 
 def Color(red, green, blue, white=0):
     """Convert the provided red, green, blue color to a 24-bit color value.
@@ -25,6 +43,8 @@ class _LED_Data(object):
     def __init__(self, channel, size):
         self.size = size
         self.channel = channel
+        # Set by any write, so the strip can skip rendering an unchanged buffer
+        self.dirty = True
 
     def __getitem__(self, pos):
         """Return the 24-bit RGB color value at the provided position or slice
@@ -33,7 +53,12 @@ class _LED_Data(object):
         # Handle if a slice of positions are passed in by grabbing all the values
         # and returning them in a list.
         if isinstance(pos, slice):
-            return [ws.ws2811_led_get(self.channel, n) for n in xrange(*pos.indices(self.size))]
+            start, stop, step = pos.indices(self.size)
+            if _BULK and step == 1 and stop > start:
+                colors = array('I', bytes(4 * (stop - start)))
+                ws.ws2811_leds_get(self.channel, start, colors)
+                return colors.tolist()
+            return [ws.ws2811_led_get(self.channel, n) for n in xrange(start, stop, step)]
         # Else assume the passed in value is a number to the position.
         else:
             return ws.ws2811_led_get(self.channel, pos)
@@ -45,14 +70,42 @@ class _LED_Data(object):
         # Handle if a slice of positions are passed in by setting the appropriate
         # LED data values to the provided values.
         if isinstance(pos, slice):
+            start, stop, step = pos.indices(self.size)
+            if _BULK and step == 1 and len(value) == stop - start:
+                self.set(start, value)
+                return
             index = 0
-            for n in xrange(*pos.indices(self.size)):
+            for n in xrange(start, stop, step):
                 ws.ws2811_led_set(self.channel, n, value[index])
                 index += 1
+            self.dirty = True
         # Else assume the passed in value is a number to the position.
         else:
+            self.dirty = True
             return ws.ws2811_led_set(self.channel, pos, value)
 
+    def set(self, start, colors):
+        """Copy colors into the LEDs from start on, in one native call when the
+        library has it. Only marks the data dirty if a color actually changed.
+        """
+        if not _BULK:
+            for n, color in enumerate(colors, start):
+                ws.ws2811_led_set(self.channel, n, color)
+            self.dirty = True
+            return
+        if ws.ws2811_leds_set(self.channel, start, _color_buffer(colors)):
+            self.dirty = True
+
+    def get(self, start, colors):
+        """Copy the LEDs from start on into colors, a writable buffer of 32-bit
+        values such as an array('I') or a NumPy uint32 array.
+        """
+        if not _BULK:
+            for index in xrange(len(colors)):
+                colors[index] = ws.ws2811_led_get(self.channel, start + index)
+            return
+        ws.ws2811_leds_get(self.channel, start, colors)
+
 
 class PixelStrip(object):
     def __init__(self, num, pin, freq_hz=800000, dma=10, invert=False,
@@ -119,6 +172,7 @@ class PixelStrip(object):
     def setGamma(self, gamma):
         if type(gamma) is list and len(gamma) == 256:
             ws.ws2811_channel_t_gamma_set(self._channel, gamma)
+            self._led_data.dirty = True
 
     def begin(self):
         """Initialize library, must be called once before other functions are
@@ -129,13 +183,21 @@ class PixelStrip(object):
         if resp != 0:
             str_resp = ws.ws2811_get_return_t_str(resp)
             raise RuntimeError('ws2811_init failed with code {0} ({1})'.format(resp, str_resp))
+        self._led_data.dirty = True
 
-    def show(self):
-        """Update the display with the data from the LED buffer."""
+    def show(self, force=False):
+        """Update the display with the data from the LED buffer. Does nothing
+        if no pixel, the brightness or the gamma changed since the last update,
+        unless force is set. Returns whether it rendered.
+        """
+        if not (force or self._led_data.dirty):
+            return False
         resp = ws.ws2811_render(self._leds)
         if resp != 0:
             str_resp = ws.ws2811_get_return_t_str(resp)
             raise RuntimeError('ws2811_render failed with code {0} ({1})'.format(resp, str_resp))
+        self._led_data.dirty = False
+        return True
 
     def setPixelColor(self, n, color):
         """Set LED at position n to the provided 24-bit color value (in RGB order).
@@ -149,6 +211,22 @@ class PixelStrip(object):
         """
         self.setPixelColor(n, Color(red, green, blue, white))
 
+    def setPixelBuffer(self, colors, start=0):
+        """Set the LEDs from start on to colors, a sequence of 24-bit color values.
+        An array('I') or a NumPy uint32 array is copied in one native call,
+        anything else is converted to one first.
+        """
+        self._led_data.set(start, colors)
+
+    def getPixelBuffer(self, colors=None, start=0):
+        """Return the LED colors from start on in colors, a writable buffer of
+        32-bit values, or in a new array('I') reaching to the end of the strip.
+        """
+        if colors is None:
+            colors = array('I', bytes(4 * (self.numPixels() - start)))
+        self._led_data.get(start, colors)
+        return colors
+
     def getBrightness(self):
         return ws.ws2811_channel_t_brightness_get(self._channel)
 
@@ -157,6 +235,7 @@ class PixelStrip(object):
         of 0 is the darkest and 255 is the brightest.
         """
         ws.ws2811_channel_t_brightness_set(self._channel, brightness)
+        self._led_data.dirty = True
 
     def getPixels(self):
         """Return an object which allows access to the LED display data as if
@@ -174,17 +253,19 @@ class PixelStrip(object):
 
     def getPixelColorRGB(self, n):
         c = lambda: None
-        setattr(c, 'r', self._led_data[n] >> 16 & 0xff)
-        setattr(c, 'g', self._led_data[n] >> 8  & 0xff)
-        setattr(c, 'b', self._led_data[n]    & 0xff)
+        color = self._led_data[n]
+        setattr(c, 'r', color >> 16 & 0xff)
+        setattr(c, 'g', color >> 8  & 0xff)
+        setattr(c, 'b', color    & 0xff)
         return c
     
     def getPixelColorRGBW(self, n):
         c = lambda: None
-        setattr(c, 'w', self._led_data[n] >> 24 & 0xff)
-        setattr(c, 'r', self._led_data[n] >> 16 & 0xff)
-        setattr(c, 'g', self._led_data[n] >> 8  & 0xff)
-        setattr(c, 'b', self._led_data[n]    & 0xff)
+        color = self._led_data[n]
+        setattr(c, 'w', color >> 24 & 0xff)
+        setattr(c, 'r', color >> 16 & 0xff)
+        setattr(c, 'g', color >> 8  & 0xff)
+        setattr(c, 'b', color    & 0xff)
         return c
 
 # Shim for back-compatibility
@@ -3375,6 +3375,79 @@ SWIG_FromCharPtr(const char *cptr)
         return &ws->channel[channelnum];
     }
 
+    PyObject *ws2811_leds_set(ws2811_channel_t *channel, int start, PyObject *colors)
+    {
+        // Copy a C-contiguous buffer of 32-bit colors, e.g. an array('I') or a NumPy
+        // uint32 array, into the channel from LED start on. Returns whether any changed.
+        Py_buffer view;
+        int changed = 0;
+
+        if (PyObject_GetBuffer(colors, &view, PyBUF_C_CONTIGUOUS) != 0)
+        {
+            return NULL;
+        }
+        if (view.itemsize != sizeof(ws2811_led_t))
+        {
+            PyBuffer_Release(&view);
+            PyErr_SetString(PyExc_TypeError, "Expecting a buffer of 32-bit colors");
+            return NULL;
+        }
+        if (channel->leds == NULL)
+        {
+            PyBuffer_Release(&view);
+            PyErr_SetString(PyExc_RuntimeError, "LEDs not allocated, call begin() first");
+            return NULL;
+        }
+        if (start < 0 || start + view.len / view.itemsize > channel->count)
+        {
+            PyBuffer_Release(&view);
+            PyErr_SetString(PyExc_IndexError, "Colors run past the LEDs of the channel");
+            return NULL;
+        }
+        if (memcmp(&channel->leds[start], view.buf, view.len) != 0)
+        {
+            memcpy(&channel->leds[start], view.buf, view.len);
+            changed = 1;
+        }
+        PyBuffer_Release(&view);
+
+        return PyBool_FromLong(changed);
+    }
+
+    PyObject *ws2811_leds_get(ws2811_channel_t *channel, int start, PyObject *colors)
+    {
+        // Copy the channel's colors from LED start on into a writable buffer of 32-bit values.
+        Py_buffer view;
+
+        if (PyObject_GetBuffer(colors, &view, PyBUF_C_CONTIGUOUS | PyBUF_WRITABLE) != 0)
+        {
+            return NULL;
+        }
+        if (view.itemsize != sizeof(ws2811_led_t))
+        {
+            PyBuffer_Release(&view);
+            PyErr_SetString(PyExc_TypeError, "Expecting a buffer of 32-bit colors");
+            return NULL;
+        }
+        if (channel->leds == NULL)
+        {
+            PyBuffer_Release(&view);
+            PyErr_SetString(PyExc_RuntimeError, "LEDs not allocated, call begin() first");
+            return NULL;
+        }
+        if (start < 0 || start + view.len / view.itemsize > channel->count)
+        {
+            PyBuffer_Release(&view);
+            PyErr_SetString(PyExc_IndexError, "Colors run past the LEDs of the channel");
+            return NULL;
+        }
+        memcpy(view.buf, &channel->leds[start], view.len);
+        PyBuffer_Release(&view);
+
+        Py_INCREF(Py_None);
+        return Py_None;
+    }
+
 #ifdef __cplusplus
 extern "C" {
 #endif
@@ -4572,6 +4645,72 @@ fail:
   return NULL;
 }
 
+SWIGINTERN PyObject *_wrap_ws2811_leds_set(PyObject *SWIGUNUSEDPARM(self), PyObject *args) {
+  PyObject *resultobj = 0;
+  ws2811_channel_t *arg1 = (ws2811_channel_t *) 0 ;
+  int arg2 ;
+  PyObject *arg3 = (PyObject *) 0 ;
+  void *argp1 = 0 ;
+  int res1 = 0 ;
+  int val2 ;
+  int ecode2 = 0 ;
+  PyObject * obj0 = 0 ;
+  PyObject * obj1 = 0 ;
+  PyObject * obj2 = 0 ;
+  PyObject *result = 0 ;
+  
+  if (!PyArg_ParseTuple(args,(char *)"OOO:ws2811_leds_set",&obj0,&obj1,&obj2)) SWIG_fail;
+  res1 = SWIG_ConvertPtr(obj0, &argp1,SWIGTYPE_p_ws2811_channel_t, 0 |  0 );
+  if (!SWIG_IsOK(res1)) {
+    SWIG_exception_fail(SWIG_ArgError(res1), "in method '" "ws2811_leds_set" "', argument " "1"" of type '" "ws2811_channel_t *""'"); 
+  }
+  arg1 = (ws2811_channel_t *)(argp1);
+  ecode2 = SWIG_AsVal_int(obj1, &val2);
+  if (!SWIG_IsOK(ecode2)) {
+    SWIG_exception_fail(SWIG_ArgError(ecode2), "in method '" "ws2811_leds_set" "', argument " "2"" of type '" "int""'");
+  } 
+  arg2 = (int)(val2);
+  arg3 = obj2;
+  result = (PyObject *)ws2811_leds_set(arg1,arg2,arg3);
+  resultobj = result;
+  return resultobj;
+fail:
+  return NULL;
+}
+
+SWIGINTERN PyObject *_wrap_ws2811_leds_get(PyObject *SWIGUNUSEDPARM(self), PyObject *args) {
+  PyObject *resultobj = 0;
+  ws2811_channel_t *arg1 = (ws2811_channel_t *) 0 ;
+  int arg2 ;
+  PyObject *arg3 = (PyObject *) 0 ;
+  void *argp1 = 0 ;
+  int res1 = 0 ;
+  int val2 ;
+  int ecode2 = 0 ;
+  PyObject * obj0 = 0 ;
+  PyObject * obj1 = 0 ;
+  PyObject * obj2 = 0 ;
+  PyObject *result = 0 ;
+  
+  if (!PyArg_ParseTuple(args,(char *)"OOO:ws2811_leds_get",&obj0,&obj1,&obj2)) SWIG_fail;
+  res1 = SWIG_ConvertPtr(obj0, &argp1,SWIGTYPE_p_ws2811_channel_t, 0 |  0 );
+  if (!SWIG_IsOK(res1)) {
+    SWIG_exception_fail(SWIG_ArgError(res1), "in method '" "ws2811_leds_get" "', argument " "1"" of type '" "ws2811_channel_t *""'"); 
+  }
+  arg1 = (ws2811_channel_t *)(argp1);
+  ecode2 = SWIG_AsVal_int(obj1, &val2);
+  if (!SWIG_IsOK(ecode2)) {
+    SWIG_exception_fail(SWIG_ArgError(ecode2), "in method '" "ws2811_leds_get" "', argument " "2"" of type '" "int""'");
+  } 
+  arg2 = (int)(val2);
+  arg3 = obj2;
+  result = (PyObject *)ws2811_leds_get(arg1,arg2,arg3);
+  resultobj = result;
+  return resultobj;
+fail:
+  return NULL;
+}
+
 
 static PyMethodDef SwigMethods[] = {
 	 { (char *)"SWIG_PyInstanceMethod_New", (PyCFunction)SWIG_PyInstanceMethod_New, METH_O, NULL},
@@ -4623,6 +4762,8 @@ static PyMethodDef SwigMethods[] = {
 	 { (char *)"ws2811_led_get", _wrap_ws2811_led_get, METH_VARARGS, NULL},
 	 { (char *)"ws2811_led_set", _wrap_ws2811_led_set, METH_VARARGS, NULL},
 	 { (char *)"ws2811_channel_get", _wrap_ws2811_channel_get, METH_VARARGS, NULL},
+	 { (char *)"ws2811_leds_set", _wrap_ws2811_leds_set, METH_VARARGS, NULL},
+	 { (char *)"ws2811_leds_get", _wrap_ws2811_leds_get, METH_VARARGS, NULL},
 	 { NULL, NULL, 0, NULL }
 };
 
@@ -1,13 +1,14 @@
 import time
-from gpiozero import Buzzer
+import Hardware
 from Command import COMMAND as cmd
-buzzer = Buzzer(17)
 class Buzzer:
+    def __init__(self):
+        self.buzzer = Hardware.Buzzer(17)
     def run(self,command):
         if command!="0":
-            buzzer.on()
+            self.buzzer.on()
         else:
-            buzzer.off()
+            self.buzzer.off()
 if __name__=='__main__':
     B=Buzzer()
     B.run('1')
@@ -10,5 +10,7 @@ class COMMAND:
     CMD_LIGHT = "CMD_LIGHT"
     CMD_POWER = "CMD_POWER" 
     CMD_MODE ="CMD_MODE"
+    CMD_BRAKE = "CMD_BRAKE"
+    CMD_MAP = "CMD_MAP"
     def __init__(self):
         pass
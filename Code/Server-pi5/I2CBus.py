@@ -0,0 +1,247 @@
+import time
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from Hardware import SMBus
+from Metrics import Histogram
+
+# Request priorities for the scheduler, most urgent first
+ESTOP = 0
+MOTOR = 1
+SERVO = 2
+ADC = 3
+
+
+class I2CBus:
+    """Owns the process' SMBus handle and serialises access to it.
+
+    Every call below is one bus transaction and runs under the bus lock. Wrap a
+    multi-transaction sequence in transaction() to keep other threads off the bus
+    until it is finished.
+    """
+    def __init__(self, busnum=1):
+        self.busnum = busnum
+        self.bus = SMBus(busnum)
+        self.lock = threading.RLock()
+        self.depth = 0
+        self.scheduler = None
+        self.reset_stats()
+
+    def reset_stats(self):
+        with self.lock:
+            self.since = time.monotonic()
+            self.count = 0          # bus transactions
+            self.busy = 0.0         # seconds spent holding the bus
+            self.waited = 0.0       # seconds spent waiting for another thread to release it
+            self.contended = 0      # lock acquisitions that had to wait
+            self.failed = 0         # requests whose work raised
+            self.threads = {}       # thread name -> [transactions, busy, waited, contended]
+
+    @contextmanager
+    def transaction(self):
+        requested = time.monotonic()
+        contended = not self.lock.acquire(blocking=False)
+        if contended:
+            self.lock.acquire()
+        acquired = time.monotonic()
+        self.depth += 1
+        try:
+            yield self
+        finally:
+            self.depth -= 1
+            if self.depth == 0:
+                busy = time.monotonic() - acquired
+                waited = acquired - requested
+                self.busy += busy
+                self.waited += waited
+                self.contended += contended
+                entry = self.threads.setdefault(threading.current_thread().name, [0, 0.0, 0.0, 0])
+                entry[1] += busy
+                entry[2] += waited
+                entry[3] += contended
+            self.lock.release()
+
+    def _call(self, method, *args):
+        with self.transaction():
+            self.count += 1
+            self.threads.setdefault(threading.current_thread().name, [0, 0.0, 0.0, 0])[0] += 1
+            return method(*args)
+
+    def write_byte(self, address, value):
+        return self._call(self.bus.write_byte, address, value)
+
+    def read_byte(self, address):
+        return self._call(self.bus.read_byte, address)
+
+    def write_byte_data(self, address, reg, value):
+        return self._call(self.bus.write_byte_data, address, reg, value)
+
+    def read_byte_data(self, address, reg):
+        return self._call(self.bus.read_byte_data, address, reg)
+
+    def write_i2c_block_data(self, address, reg, data):
+        return self._call(self.bus.write_i2c_block_data, address, reg, data)
+
+    def read_i2c_block_data(self, address, reg, length):
+        return self._call(self.bus.read_i2c_block_data, address, reg, length)
+
+    def stats(self):
+        """Return bus utilisation and contention since the last reset_stats()."""
+        with self.lock:
+            elapsed = max(time.monotonic() - self.since, 1e-9)
+            return {
+                'elapsed': elapsed,
+                'transactions': self.count,
+                'utilisation': self.busy / elapsed,
+                'waited': self.waited,
+                'contended': self.contended,
+                'failed': self.failed,
+                'threads': {name: {'transactions': entry[0], 'busy': entry[1],
+                                   'waited': entry[2], 'contended': entry[3]}
+                            for name, entry in self.threads.items()},
+            }
+
+    def submit(self, priority, key, func, *args):
+        """Run func(*args) on the bus through the scheduler, or right away if there is none.
+
+        Returns an I2CRequest, wait() on it for the result.
+        """
+        scheduler = self.scheduler
+        if scheduler is None or scheduler.is_current():
+            request = I2CRequest(priority, key, func, args)
+            request.run(self)
+            return request
+        return scheduler.submit(priority, key, func, *args)
+
+    def start_scheduler(self):
+        with self.lock:
+            if self.scheduler is None:
+                self.scheduler = I2CScheduler(self)
+                self.scheduler.start()
+        return self.scheduler
+
+    def stop_scheduler(self):
+        with self.lock:
+            scheduler, self.scheduler = self.scheduler, None
+        if scheduler is not None:
+            scheduler.stop()
+
+    def close(self):
+        self.stop_scheduler()
+        self.bus.close()
+
+
+class I2CRequest:
+    """One queued unit of bus work and, once it has run, its result."""
+    def __init__(self, priority, key, func, args):
+        self.priority = priority
+        self.key = key
+        self.func = func
+        self.args = args
+        self.submitted = time.monotonic()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+    def run(self, bus):
+        try:
+            with bus.transaction():
+                self.result = self.func(*self.args)
+        except Exception as e:
+            self.error = e
+            with bus.lock:
+                bus.failed += 1
+            if not self.waiters:    # a frame nobody will wait() on: don't let the error vanish
+                print("I2C request %r failed: %r" % (self.key, e))
+        self.done.set()
+
+    def wait(self, timeout=None):
+        self.waiters += 1
+        if not self.done.wait(timeout):
+            raise TimeoutError("I2C request %r timed out" % (self.key,))
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class I2CScheduler:
+    """Thread that owns the bus and runs queued requests, most urgent priority first.
+
+    Requests are keyed. A request submitted while one with the same key is still
+    queued replaces its work but keeps its place and receipt time, and everyone
+    waiting on either gets the newer result. Keep requests short (a frame write,
+    one conversion) and the wait of an urgent request is bounded by one of them.
+    """
+    def __init__(self, bus):
+        self.bus = bus
+        self.cond = threading.Condition()
+        self.queues = [OrderedDict() for _ in range(ADC + 1)]
+        self.latency = [Histogram() for _ in range(ADC + 1)]    # receipt to completion, per priority
+        self.replaced = [0] * (ADC + 1)
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name="i2c", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify()
+        if self.thread is not None and not self.is_current():
+            self.thread.join()
+
+    def is_current(self):
+        return threading.current_thread() is self.thread
+
+    def submit(self, priority, key, func, *args):
+        with self.cond:
+            request = self.queues[priority].get(key)
+            if request is None:
+                request = I2CRequest(priority, key, func, args)
+                self.queues[priority][key] = request
+                self.cond.notify()
+            else:
+                request.func, request.args = func, args
+                self.replaced[priority] += 1
+        return request
+
+    def cancel(self, priority, key):
+        """Drop a queued request; it completes with a None result."""
+        with self.cond:
+            request = self.queues[priority].pop(key, None)
+        if request is not None:
+            request.done.set()
+
+    def _next(self):
+        with self.cond:
+            while True:
+                for queue in self.queues:
+                    if queue:
+                        return queue.popitem(last=False)[1]
+                if not self.running:    # drained, nobody is left waiting
+                    return None
+                self.cond.wait()
+
+    def run(self):
+        while True:
+            request = self._next()
+            if request is None:
+                break
+            request.run(self.bus)
+            self.latency[request.priority].add(time.monotonic() - request.submitted)
+
+
+_buses = {}
+_buses_lock = threading.Lock()
+
+
+def get_bus(busnum=1):
+    """Return the shared I2CBus for busnum, opening it on first use."""
+    with _buses_lock:
+        if busnum not in _buses:
+            _buses[busnum] = I2CBus(busnum)
+        return _buses[busnum]
@@ -1,6 +1,9 @@
 # -*-coding: utf-8 -*-
 import time
-from rpi_ws281x import *
+import threading
+from array import array
+import numpy as np
+from Hardware import Adafruit_NeoPixel, Color
 import os
 
 # LED strip configuration:
@@ -13,9 +16,37 @@ LED_DMA        = 10      # DMA channel to use for generating signal (try 10)
 LED_BRIGHTNESS = 255     # Set to 0 for darkest and 255 for brightest
 LED_INVERT     = False   # True to invert the signal (when using NPN transistor level shift)
 LED_CHANNEL    = 0       # set to '1' for GPIOs 13, 19, 41, 45 or 53
+LED_MAX_FPS    = 60      # update() renders at most this often
+LED_FPS        = 50      # frame rate of the animations ledMode() plays
+def order_shifts(order):
+    """Where each component sent in order, e.g. "GRB", sits in a Color(R, G, B) value."""
+    return tuple({'R': 16, 'G': 8, 'B': 0}[c] for c in order)
+def reorder(shifts, color):
+    """color, or an array of them, with the components in the order shifts gives."""
+    return ((color >> shifts[0]) & 255) << 16 | ((color >> shifts[1]) & 255) << 8 | ((color >> shifts[2]) & 255)
+def wheel_table():
+    """Color(r, g, b) for the 256 positions of the rainbow wheel."""
+    pos = np.arange(256)
+    r = np.select([pos < 85, pos < 170], [pos * 3, 255 - (pos - 85) * 3], 0)
+    g = np.select([pos < 85, pos < 170], [255 - pos * 3, 0], (pos - 170) * 3)
+    b = np.select([pos < 85, pos < 170], [0, (pos - 85) * 3], 255 - (pos - 170) * 3)
+    return (r << 16 | g << 8 | b).astype(np.uint32)
 # Define functions which animate LEDs in various ways.
 class Led:
+    """The LED strip, drawn through a frame buffer.
+
+    setPixel() and fill() only change the buffer. show() commits it in one
+    render, or none if nothing changed since the last one. One render
+    thread does the rest. update() hands it the buffer, for callers that
+    don't pace themselves like CMD_LED: it renders at most LED_MAX_FPS
+    times a second, with whatever the buffer holds by then. ledMode()
+    posts a pattern to its mailbox. The thread picks it up at once and
+    renders the pattern's frames, NumPy arrays looked up in the wheel
+    table, at LED_FPS until the next one arrives.
+    """
     def __init__(self):
+        #Control the sending order of color data
+        self.ORDER = "RGB"  
         self.result = os.popen('cat /proc/device-tree/model')
         self.s=self.result.read()
         if "Raspberry Pi 5 Model " in self.s:
@@ -24,119 +55,195 @@ class Led:
         else :
             print("Hardware supported")
             self.Ledsupported = 1
-            #Control the sending order of color data
-            self.ORDER = "RGB"  
             # Create NeoPixel object with appropriate configuration.
             self.strip = Adafruit_NeoPixel(LED_COUNT, LED_PIN, LED_FREQ_HZ, LED_DMA, LED_INVERT, LED_BRIGHTNESS, LED_CHANNEL)
             # Intialize the library (must be called once before other functions).
             self.strip.begin()
-            
-        
+        self.shifts = order_shifts(self.ORDER)
+        self.WHEEL = reorder(self.shifts, wheel_table())
+        self.WIPES = [self.LED_TYPR(self.ORDER, Color(255, 0, 0)), self.LED_TYPR(self.ORDER, Color(0, 255, 0)),
+                      self.LED_TYPR(self.ORDER, Color(0, 0, 255)), 0]
+        self.index = np.arange(LED_COUNT)
+        self.patterns = {'2': self.wipeFrame, '3': self.chaseFrame, '4': self.rainbowFrame, '5': self.cycleFrame}
+        self.bulk=hasattr(getattr(self,'strip',None),'setPixelBuffer')  #the bundled rpi_ws281x copies a frame in one call
+        self.frame = [0] * LED_COUNT    # strip order colors, what the next show() commits
+        self.dirty = True               # the strip's contents are unknown until the first show()
+        self.lock = threading.Lock()
+        self.cond = threading.Condition(self.lock)
+        self.mailbox = None             # the pattern the render thread is to switch to
+        self.mode = None
+        self.thread = None
+        self.rendered = 0.0             # monotonic time of the last render
+        self.renders = 0
+    def numPixels(self):
+        return len(self.frame)
+    def setPixel(self,i,color):
+        """Set pixel i in the frame buffer to a color already in strip order."""
+        if self.frame[i] != color:
+            self.frame[i] = color
+            self.dirty = True
+    def fill(self,color):
+        for i in range(len(self.frame)):
+            self.setPixel(i, color)
+    def setFrame(self,frame):
+        """Replace the frame buffer with an array of strip order colors."""
+        frame = frame.tolist()
+        if frame != self.frame:
+            self.frame = frame
+            self.dirty = True
+    def show(self):
+        """Commit the frame buffer in one render. Returns False if it was already showing."""
+        with self.lock:
+            if not self.Ledsupported:
+                self.dirty = False  # nothing to render to, and the render thread mustn't keep retrying
+                return False
+            if not self.dirty:
+                return False
+            self.dirty = False
+            if self.bulk:
+                self.strip.setPixelBuffer(array('I', self.frame))
+            else:
+                for i, color in enumerate(self.frame):
+                    self.strip.setPixelColor(i, color)
+            self.strip.show()
+            self.rendered = time.monotonic()
+            self.renders += 1
+            return True
+    def update(self):
+        """Have the render thread commit the frame buffer, as soon as LED_MAX_FPS allows."""
+        with self.cond:
+            self.cond.notify()
+        self.start()
     def LED_TYPR(self,order,R_G_B):
-        B=R_G_B & 255
-        G=R_G_B >> 8 & 255
-        R=R_G_B >> 16 & 255 
-        Led_type=["GRB","GBR","RGB", "RBG","BRG","BGR"]
-        color = [Color(G,R,B),Color(G,B,R),Color(R,G,B),Color(R,B,G),Color(B,R,G),Color(B,G,R)]
-        if order in Led_type:
-            return color[Led_type.index(order)]
+        if order == self.ORDER:
+            return reorder(self.shifts, R_G_B)
+        if order in ("GRB","GBR","RGB","RBG","BRG","BGR"):
+            return reorder(order_shifts(order), R_G_B)
     def colorWipe(self,strip, color, wait_ms=50):
         """Wipe color across display a pixel at a time."""
         color=self.LED_TYPR(self.ORDER,color)
-        for i in range(self.strip.numPixels()):
-            self.strip.setPixelColor(i, color)
-            self.strip.show()
-            time.sleep(wait_ms/1000.0)
+        for i in range(self.numPixels()):
+            self.setPixel(i, color)
+            if self.show():     # wiping over pixels that already have the color shows nothing
+                time.sleep(wait_ms/1000.0)
 
     def theaterChase(self,strip, color, wait_ms=50, iterations=10):
         """Movie theater light style chaser animation."""
         color=self.LED_TYPR(self.ORDER,color)
         for j in range(iterations):
             for q in range(3):
-                for i in range(0,self.strip.numPixels(), 3):
-                    self.strip.setPixelColor(i+q, color)
-                self.strip.show()
+                for i in range(0,self.numPixels()-q, 3):
+                    self.setPixel(i+q, color)
+                self.show()
                 time.sleep(wait_ms/1000.0)
-                for i in range(0, self.strip.numPixels(), 3):
-                    self.strip.setPixelColor(i+q, 0)
+                for i in range(0, self.numPixels()-q, 3):
+                    self.setPixel(i+q, 0)
 
     def wheel(self,pos):
         """Generate rainbow colors across 0-255 positions."""
         if pos<0 or pos >255:
-            r=g=b=0
-        elif pos < 85:
-            r=pos * 3
-            g=255 - pos * 3
-            b=0
-        elif pos < 170:
-            pos -= 85
-            r=255 - pos * 3
-            g=0
-            b=pos * 3
-        else:
-            pos -= 170
-            r=0
-            g=pos * 3
-            b=255 - pos * 3
-        return self.LED_TYPR(self.ORDER,Color(r,g,b))
+            return 0
+        return int(self.WHEEL[pos])
 
     def rainbow(self,strip, wait_ms=20, iterations=1):
         """Draw rainbow that fades across all pixels at once."""
         for j in range(256*iterations):
-            for i in range(self.strip.numPixels()):
-                 self.strip.setPixelColor(i, self.wheel((i+j) & 255))
-            self.strip.show()
+            for i in range(self.numPixels()):
+                 self.setPixel(i, self.wheel((i+j) & 255))
+            self.show()
             time.sleep(wait_ms/1000.0)
 
     def rainbowCycle(self,strip, wait_ms=20, iterations=5):
         """Draw rainbow that uniformly distributes itself across all pixels."""
         for j in range(256*iterations):
-            for i in range(self.strip.numPixels()):
-                self.strip.setPixelColor(i, self.wheel((int(i * 256 / self.strip.numPixels()) + j) & 255))
-            self.strip.show()
+            for i in range(self.numPixels()):
+                self.setPixel(i, self.wheel((int(i * 256 / self.numPixels()) + j) & 255))
+            self.show()
             time.sleep(wait_ms/1000.0)
 
     def theaterChaseRainbow(self,strip, wait_ms=50):
         """Rainbow movie theater light style chaser animation."""
         for j in range(256):
             for q in range(3):
-                for i in range(0, self.strip.numPixels(), 3):
-                    self.strip.setPixelColor(i+q, self.wheel((i+j) % 255))
-                self.strip.show()
+                for i in range(0, self.numPixels()-q, 3):
+                    self.setPixel(i+q, self.wheel((i+j) % 255))
+                self.show()
                 time.sleep(wait_ms/1000.0)
-                for i in range(0, strip.numPixels(), 3):
-                    strip.setPixelColor(i+q, 0)
+                for i in range(0, self.numPixels()-q, 3):
+                    self.setPixel(i+q, 0)
     def ledIndex(self,index,R,G,B):
         color=self.LED_TYPR(self.ORDER,Color(R,G,B))
         for i in range(8):
             if index & 0x01 == 1:
-                self.strip.setPixelColor(i,color)
-                self.strip.show()
+                self.setPixel(i,color)
             index=index >> 1
+        self.update()
     def ledMode(self,n):
-        self.mode=n
+        """Play animation n ('2'-'5') on the render thread, any other n clears the strip. Returns at once."""
+        with self.cond:
+            self.mode = n
+            self.mailbox = n
+            self.cond.notify()
+        self.start()
+    def start(self):
+        if not self.Ledsupported:
+            return
+        with self.cond:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name="led", daemon=True)
+                self.thread.start()
+    def run(self):
+        pattern = None
         while True:
-            if self.mode=='2':
-                self.colorWipe(self.strip, Color(255, 0, 0))  # Red wipe
-                self.colorWipe(self.strip, Color(0, 255, 0))  # Green wipe
-                self.colorWipe(self.strip, Color(0, 0, 255))  # Blue wipe
-                self.colorWipe(self.strip, Color(0,0,0),10)
-            elif self.mode=='3':
-                self.theaterChaseRainbow(self.strip)
-                self.colorWipe(self.strip, Color(0,0,0),10)
-            elif self.mode=='4':
-                self.rainbow(self.strip)
-                self.colorWipe(self.strip, Color(0,0,0),10)
-            elif self.mode=='5':
-                self.rainbowCycle(self.strip)
-                self.colorWipe(self.strip, Color(0,0,0),10)
-            else:
-                self.colorWipe(self.strip, Color(0,0,0),10)
-                break
-led=Led()                 
+            with self.cond:
+                while self.mailbox is None:
+                    now = time.monotonic()
+                    if pattern is not None:
+                        wait = deadline - now
+                    elif self.dirty:
+                        wait = self.rendered + 1.0 / LED_MAX_FPS - now
+                    else:
+                        wait = None     # until there is mail or update()
+                    if wait is not None and wait <= 0:
+                        break
+                    self.cond.wait(wait)
+                mode, self.mailbox = self.mailbox, None
+            now = time.monotonic()
+            if mode is not None:
+                pattern = self.patterns.get(mode)
+                started = deadline = now
+                if pattern is None:
+                    self.fill(0)    # '0' and '1' end with the strip dark, as the old ledMode()'s black wipe did
+            if pattern is not None:
+                self.setFrame(pattern(now - started))
+                deadline += 1.0 / LED_FPS
+                if deadline < now:
+                    deadline = now + 1.0 / LED_FPS     # fell behind, drop the frames
+            self.show()
+    # Animation frames at t seconds in, as arrays of strip order colors
+    def wipeFrame(self, t):
+        """Red, green, blue and then black wiped across a pixel at a time."""
+        n = self.numPixels()
+        wipe, lit = divmod(int(t / 0.05) % (4 * n), n)
+        frame = np.full(n, self.WIPES[wipe - 1], np.uint32)
+        frame[:lit + 1] = self.WIPES[wipe]
+        return frame
+    def chaseFrame(self, t):
+        """Every third pixel lit from the wheel, stepping along, the wheel turning every third step."""
+        step = int(t / 0.05)
+        j, q = (step // 3) % 256, step % 3
+        offset = self.index - q
+        return np.where((offset >= 0) & (offset % 3 == 0), self.WHEEL[(offset + j) % 255], 0)
+    def rainbowFrame(self, t):
+        j = int(t / 0.02) & 255
+        return self.WHEEL[(self.index + j) & 255]
+    def cycleFrame(self, t):
+        j = int(t / 0.02) & 255
+        return self.WHEEL[(self.index * 256 // self.numPixels() + j) & 255]
 # Main program logic follows:
 if __name__ == '__main__':
     print ('Program is starting ... ')
+    led=Led()
     if(led.Ledsupported == 1):       
         try:
             while True:
@@ -1,37 +1,81 @@
 import time
+import threading
 from Motor import *
 from ADC import *
+import Devices
 
 class Light:
+    # Light seeking as a fixed-rate controller on the ADC sampler's cache. Brightness is
+    # measured from the ambient level of each photoresistor, taken once at the start.
+    # Dark on both sides: creep forward. Lit and balanced: stop, the light is ahead.
+    # Lit and unbalanced: turn towards the brighter side, harder the bigger the difference.
+    RATE=10         #Hz
+    LIT=0.3         #volts above ambient that count as seeing the light
+    BALANCED=0.15   #volts between the sides that count as facing it
+    GAIN=2800       #duty per volt of difference
+    STEP=100        #duty steps the turn is rounded to, so noise doesn't rewrite the motors
+    MAX_TURN=1400
+    def __init__(self):
+        self.stopped=threading.Event()
+        self.ambient=None
+        self.ticks=0
+        self.updates=0
+    def calibrate(self,seconds=1.0):
+        """Average both photoresistors over seconds as their ambient level, with the car still"""
+        self.adc=Devices.adc()
+        self.adc.start_sampler()
+        samples=[]
+        deadline=time.monotonic()+seconds
+        while time.monotonic()<deadline and not self.stopped.is_set():
+            self.adc.wait_sample(1)
+            samples.append((self.adc.recvADC(0),self.adc.recvADC(1)))
+        if not samples:
+            return None
+        self.ambient=(sum(L for L,R in samples)/len(samples),sum(R for L,R in samples)/len(samples))
+        return self.ambient
+    def steer(self,L,R):
+        """Wheel duties for the photoresistor voltages L and R"""
+        left=L-self.ambient[0]
+        right=R-self.ambient[1]
+        if left<self.LIT and right<self.LIT:
+            return (600,600,600,600)
+        difference=left-right
+        if abs(difference)<self.BALANCED:
+            return (0,0,0,0)
+        turn=min(self.GAIN*abs(difference),self.MAX_TURN)
+        turn=int(round(turn/self.STEP))*self.STEP
+        if difference>0:
+            return (-turn,-turn,turn,turn)  #brighter on the left
+        return (turn,turn,-turn,-turn)
     def run(self):
+        self.adc=Devices.adc()
+        self.PWM=Devices.motor()
+        self.PWM.setMotorModel(0,0,0,0)
+        self.adc.start_sampler()
+        if self.ambient is None and self.calibrate() is None:
+            return
+        self.duties=(0,0,0,0)
         try:
-            self.adc=Adc()
-            self.PWM=Motor()
-            self.PWM.setMotorModel(0,0,0,0)
-            while True:
-                L = self.adc.recvADC(0)
-                R = self.adc.recvADC(1)
-                if L < 2.99 and R < 2.99 :
-                    self.PWM.setMotorModel(600,600,600,600)
-                elif abs(L-R)<0.15:
-                    self.PWM.setMotorModel(0,0,0,0)
-                    
-                elif L > 3 or R > 3:
-                    if L > R :
-                        self.PWM.setMotorModel(-1200,-1200,1400,1400)
-                        
-                    elif R > L :
-                        self.PWM.setMotorModel(1400,1400,-1200,-1200)
-                    
+            Devices.scheduler().run_until('light',self.RATE,self.step,self.stopped)
         except KeyboardInterrupt:
-           led_Car.PWM.setMotorModel(0,0,0,0) 
+           self.PWM.setMotorModel(0,0,0,0)
+    def step(self):     #one pass of run(), run by the control scheduler
+        update=self.steer(self.adc.recvADC(0),self.adc.recvADC(1))
+        self.ticks+=1
+        if update!=self.duties:
+            self.PWM.setMotorModel(*update)
+            self.updates+=1
+            self.duties=update
+    def reset(self):
+        #ready for another run(). Called before its thread starts, not from it, so a
+        #stop() that lands before the thread gets going still ends the run. The lighting
+        #may have changed since the last run, so that run measures the ambient level again
+        self.stopped.clear()
+        self.ambient=None
+    def stop(self):
+        self.stopped.set()
 
 if __name__=='__main__':
     print ('Program is starting ... ')
     led_Car=Light()
     led_Car.run()
-
-
-        
-    
-
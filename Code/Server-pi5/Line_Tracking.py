@@ -1,56 +1,139 @@
+import math
 import time
+import threading
 from Motor import *
-from gpiozero import LineSensor
+from Hardware import LineSensor
+from Pid import Pid
+import Devices
 IR01 = 14
 IR02 = 15
 IR03 = 23
-IR01_sensor = LineSensor(IR01)
-IR02_sensor = LineSensor(IR02)
-IR03_sensor = LineSensor(IR03)
+#where the line is under the sensor bar for each pattern, -1 under the left sensor to 1 under the right
+PATTERN_POSITION={4:-1.0,6:-0.5,2:0.0,3:0.5,1:1.0}
+LOST_POSITION=1.5   #past the sensor on the side it was last seen
+def position_table():
+    """Line position for every (last pattern that placed the line, pattern) pair, indexed last << 3 | pattern.
+
+    A pattern that doesn't place the line (none, both outer sensors, all three)
+    keeps the last position; losing the line puts it just past the side it left by.
+    """
+    table=[]
+    for last in range(8):
+        previous=PATTERN_POSITION.get(last,0.0)
+        for pattern in range(8):
+            if pattern in PATTERN_POSITION:
+                table.append(PATTERN_POSITION[pattern])
+            elif pattern==0 and previous:
+                table.append(math.copysign(LOST_POSITION,previous))
+            else:
+                table.append(previous)
+    return table
 class Line_Tracking:
+    #sensor state (left, middle, right bits) -> wheel duties; other states keep the wheels as they are
+    DUTIES={2:(800,800,800,800),
+            4:(-1500,-1500,2500,2500),
+            6:(-2000,-2000,4000,4000),
+            1:(2500,2500,-1500,-1500),
+            3:(4000,4000,-2000,-2000),
+            7:(0,0,0,0)}
+    TICK=0.1    #seconds between reads when no edge comes, in case one was missed
+    POSITION=position_table()
+    RATE=100    #Hz the follower steers at
     def __init__(self):
-        pass
+        self.IR01_sensor = LineSensor(IR01)
+        self.IR02_sensor = LineSensor(IR02)
+        self.IR03_sensor = LineSensor(IR03)
+        self.changed=threading.Event()
+        self.stopped=threading.Event()
+        self.reads=0
+        self.updates=0
+        for sensor in (self.IR01_sensor,self.IR02_sensor,self.IR03_sensor):
+            sensor.when_activated=self.edge
+            sensor.when_deactivated=self.edge
+    def edge(self):
+        self.changed.set()
+    def read(self):
+        LMR=0x00
+        if self.IR01_sensor.value == True:
+            LMR=(LMR | 4)
+        if self.IR02_sensor.value == True:
+            LMR=(LMR | 2)
+        if self.IR03_sensor.value == True:
+            LMR=(LMR | 1)
+        return LMR
 
     def test_Infrared(self):
         try:
             while True:
-                if IR01_sensor.value !=True and IR02_sensor.value == True and IR03_sensor.value !=True:
+                if self.IR01_sensor.value !=True and self.IR02_sensor.value == True and self.IR03_sensor.value !=True:
                     print ('Middle')
-                elif IR01_sensor.value !=True and IR02_sensor.value != True and IR03_sensor.value ==True:
+                elif self.IR01_sensor.value !=True and self.IR02_sensor.value != True and self.IR03_sensor.value ==True:
                     print ('Right')
-                elif IR01_sensor.value ==True and IR02_sensor.value != True and IR03_sensor.value !=True:
+                elif self.IR01_sensor.value ==True and self.IR02_sensor.value != True and self.IR03_sensor.value !=True:
                     print ('Left')
         except KeyboardInterrupt:
             print ("\nEnd of program")
         
     def run(self):
-        while True:
-            self.LMR=0x00
-            if IR01_sensor.value == True:
-                self.LMR=(self.LMR | 4)
-            if R02_sensor.value == True:
-                self.LMR=(self.LMR | 2)
-            if IR03_sensor.value == True:
-                self.LMR=(self.LMR | 1)
-            if self.LMR==2:
-                PWM.setMotorModel(800,800,800,800)
-            elif self.LMR==4:
-                PWM.setMotorModel(-1500,-1500,2500,2500)
-            elif self.LMR==6:
-                PWM.setMotorModel(-2000,-2000,4000,4000)
-            elif self.LMR==1:
-                PWM.setMotorModel(2500,2500,-1500,-1500)
-            elif self.LMR==3:
-                PWM.setMotorModel(4000,4000,-2000,-2000)
-            elif self.LMR==7:
-                #pass
-                PWM.setMotorModel(0,0,0,0)
+        #sleeps until a sensor changes and writes the motors only when the state does
+        self.PWM=Devices.motor()
+        self.LMR=None
+        while not self.stopped.is_set():
+            self.changed.clear()    #before reading, so an edge during the read wakes the next wait
+            LMR=self.read()
+            self.reads+=1
+            if LMR!=self.LMR and LMR in self.DUTIES:
+                self.PWM.setMotorModel(*self.DUTIES[LMR])
+                self.updates+=1
+                self.LMR=LMR
+            self.changed.wait(self.TICK)
+    def follow(self,speed=1500,kp=1.0,ki=0.0,kd=0.1,slow=0.4,lost=1.0):
+        #steers on a continuous line position instead of the pattern: PID at a fixed rate,
+        #slowing by up to slow of speed as the line nears the sensors' ends. The gains are
+        #in units of speed, so one tuning holds across speeds. Stops on all three sensors,
+        #like run(), or after lost seconds without the line.
+        self.PWM=Devices.motor()
+        self.pid=Pid(kp,ki,kd,limit=2.0,tau=0.1)
+        self.speed,self.slow,self.lost=speed,slow,lost
+        self.last=2
+        self.seen=time.monotonic()
+        self.duties=None
+        Devices.scheduler().run_until('follow',self.RATE,self.steer,self.stopped)
+    def steer(self):    #one step of follow(), run by the control scheduler
+        pattern=self.read()
+        now=time.monotonic()
+        self.reads+=1
+        if pattern in PATTERN_POSITION:
+            self.seen=now
+        if pattern==7 or now-self.seen>self.lost:
+            self.pid.reset()
+            update=(0,0,0,0)
+        else:
+            position=self.POSITION[self.last<<3|pattern]
+            forward=self.speed*(1-self.slow*min(abs(position),1))
+            turn=self.speed*self.pid.step(position,1.0/self.RATE)
+            left=int(forward+turn)
+            right=int(forward-turn)
+            update=(left,left,right,right)
+        if pattern in PATTERN_POSITION:
+            self.last=pattern
+        if update!=self.duties:
+            self.PWM.setMotorModel(*update)
+            self.updates+=1
+            self.duties=update
+    def reset(self):
+        #ready for another run() or follow(). Called before its thread starts, not
+        #from it, so a stop() that lands before the thread gets going still ends the run
+        self.stopped.clear()
+    def stop(self):
+        self.stopped.set()
+        self.changed.set()
             
-infrared=Line_Tracking()
 # Main program logic follows:
 if __name__ == '__main__':
     print ('Program is starting ... ')
+    infrared=Line_Tracking()
     try:
         infrared.test_Infrared()
     except KeyboardInterrupt:  # When 'Ctrl+C' is pressed, the child program  will be  executed.
-        PWM.setMotorModel(0,0,0,0)
+        Devices.motor().setMotorModel(0,0,0,0)
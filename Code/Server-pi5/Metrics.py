@@ -0,0 +1,53 @@
+class Histogram:
+    """Log2-bucketed histogram of durations in seconds.
+
+    Bucket i counts samples below 2**i microseconds, the last one (~16 s) is
+    open-ended. Adding a sample is constant time, so it can sit on a control path.
+    """
+    BUCKETS = 25
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.buckets = [0] * self.BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = 0.0
+
+    def add(self, seconds):
+        index = min(int(seconds * 1e6).bit_length(), self.BUCKETS - 1)
+        self.buckets[index] += 1
+        self.count += 1
+        self.total += seconds
+        if self.min is None or seconds < self.min:
+            self.min = seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, p):
+        """Return the upper bound in seconds of the bucket holding the p-th percentile."""
+        if not self.count:
+            return 0.0
+        target = self.count * p / 100.0
+        seen = 0
+        for index, n in enumerate(self.buckets):
+            seen += n
+            if seen >= target:
+                return min((1 << index) / 1e6, self.max)
+        return self.max
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def __str__(self):
+        return "n=%d mean=%.0fus p50<=%.0fus p99<=%.0fus max=%.0fus" % (
+            self.count, self.mean() * 1e6, self.percentile(50) * 1e6,
+            self.percentile(99) * 1e6, self.max * 1e6)
+
+    def rows(self):
+        """Yield (upper bound in microseconds, count) for every non-empty bucket."""
+        for index, n in enumerate(self.buckets):
+            if n:
+                yield 1 << index, n
@@ -1,14 +1,28 @@
 import time
 import math
+import threading
 from PCA9685 import PCA9685
 from ADC import *
+from Metrics import Histogram
+from Kinematics import Mecanum
+import Devices
 
 class Motor:
+    WHEEL_GAINS=(1.0,1.0,1.0,1.0)    #FL, BL, FR, BR. Lower a wheel that runs faster than the others.
+    ROTATE_SPIN=2000
+    ROTATE_SPEED=2000
+    ROTATE_RATE=50      #Hz
     def __init__(self):
         self.pwm = PCA9685(0x40, debug=True)
         self.pwm.setPWMFreq(50)
         self.time_proportion = 3     #Depend on your own car,If you want to get the best out of the rotation mode, change the value by experimenting.
-        self.adc = Adc()
+        self.adc = Devices.adc()
+        self.stop_latency = Histogram()
+        self.kinematics=Mecanum(self.WHEEL_GAINS)
+        self.rotate_duties=self.kinematics.table(self.ROTATE_SPIN,self.ROTATE_SPEED)    #by whole degree of travel
+        self.duties=(0,0,0,0)   #as last set, clamped
+        self.rotate_lock=threading.Lock()
+        self.rotate_task=None
     def duty_range(self,duty1,duty2,duty3,duty4):
         if duty1>4095:
             duty1=4095
@@ -31,75 +45,87 @@ class Motor:
             duty4=-4095
         return duty1,duty2,duty3,duty4
         
-    def left_Upper_Wheel(self,duty):
+    @staticmethod
+    def wheel_duty(duty,forward_channel,backward_channel):
+        """Return the H-bridge channel duties that drive one wheel at duty."""
         if duty>0:
-            self.pwm.setMotorPwm(0,0)
-            self.pwm.setMotorPwm(1,duty)
+            return {backward_channel:0,forward_channel:duty}
         elif duty<0:
-            self.pwm.setMotorPwm(1,0)
-            self.pwm.setMotorPwm(0,abs(duty))
+            return {forward_channel:0,backward_channel:abs(duty)}
         else:
-            self.pwm.setMotorPwm(0,4095)
-            self.pwm.setMotorPwm(1,4095)
+            return {forward_channel:4095,backward_channel:4095}
+    def left_Upper_Wheel(self,duty):
+        self.pwm.setMotorFrame(self.wheel_duty(duty,1,0))
     def left_Lower_Wheel(self,duty):
-        if duty>0:
-            self.pwm.setMotorPwm(3,0)
-            self.pwm.setMotorPwm(2,duty)
-        elif duty<0:
-            self.pwm.setMotorPwm(2,0)
-            self.pwm.setMotorPwm(3,abs(duty))
-        else:
-            self.pwm.setMotorPwm(2,4095)
-            self.pwm.setMotorPwm(3,4095)
+        self.pwm.setMotorFrame(self.wheel_duty(duty,2,3))
     def right_Upper_Wheel(self,duty):
-        if duty>0:
-            self.pwm.setMotorPwm(6,0)
-            self.pwm.setMotorPwm(7,duty)
-        elif duty<0:
-            self.pwm.setMotorPwm(7,0)
-            self.pwm.setMotorPwm(6,abs(duty))
-        else:
-            self.pwm.setMotorPwm(6,4095)
-            self.pwm.setMotorPwm(7,4095)
+        self.pwm.setMotorFrame(self.wheel_duty(duty,7,6))
     def right_Lower_Wheel(self,duty):
-        if duty>0:
-            self.pwm.setMotorPwm(4,0)
-            self.pwm.setMotorPwm(5,duty)
-        elif duty<0:
-            self.pwm.setMotorPwm(5,0)
-            self.pwm.setMotorPwm(4,abs(duty))
-        else:
-            self.pwm.setMotorPwm(4,4095)
-            self.pwm.setMotorPwm(5,4095)
+        self.pwm.setMotorFrame(self.wheel_duty(duty,5,4))
             
  
     def setMotorModel(self,duty1,duty2,duty3,duty4):
         duty1,duty2,duty3,duty4=self.duty_range(duty1,duty2,duty3,duty4)
-        self.left_Upper_Wheel(duty1)
-        self.left_Lower_Wheel(duty2)
-        self.right_Upper_Wheel(duty3)
-        self.right_Lower_Wheel(duty4)
+        self.duties=(duty1,duty2,duty3,duty4)
+        #Channels 0-7 are contiguous, so all four wheels go out in one block write
+        frame=self.wheel_duty(duty1,1,0)
+        frame.update(self.wheel_duty(duty2,2,3))
+        frame.update(self.wheel_duty(duty3,7,6))
+        frame.update(self.wheel_duty(duty4,5,4))
+        return self.pwm.setMotorFrame(frame)
+    def stop(self):
+        """Brake all four wheels in one bus transaction, ahead of anything queued."""
+        t0=time.monotonic()
+        request=self.pwm.emergencyFrame({channel:(0,4095) for channel in range(8)})
+        self.duties=(0,0,0,0)
+        request.wait()
+        self.stop_latency.add(time.monotonic()-t0)
+        return request
             
-    def Rotate(self,n):
-        angle = n
-        bat_compensate =7.5/(self.adc.recvADC(2)*3)
-        while True:
-            W = 2000
-
-            VY = int(2000 * math.cos(math.radians(angle)))
-            VX = -int(2000 * math.sin(math.radians(angle)))
-
-            FR = VY - VX + W
-            FL = VY + VX - W
-            BL = VY - VX - W
-            BR = VY + VX + W
+    def wheel_load(self):
+        """Sum of the wheels' drive, 0 to 4, as last written to the chip. Braked wheels count 0."""
+        shadow=self.pwm.shadow
+        load=0
+        for forward,backward in ((1,0),(2,3),(7,6),(5,4)):
+            if shadow[forward] is not None and shadow[backward] is not None:
+                load+=abs(shadow[forward][1]-shadow[backward][1])
+        return load/4095.0
+    def Rotate(self,n):     #spins while translating towards n degrees until interrupted, then stops
+        self.start_rotate(n)
+        try:
+            while True:
+                time.sleep(0.1)
+        finally:
+            self.stop_rotate()
+            self.setMotorModel(0,0,0,0)
+    def start_rotate(self,angle):
+        """Spin while translating towards angle, on the control scheduler until stop_rotate().
 
-            PWM.setMotorModel(FL, BL, FR, BR)
-            print("rotating")
-            time.sleep(5*self.time_proportion*bat_compensate/1000)
-            angle -= 5
+        The spin turns the translation away from where the car faces, so each tick
+        drives towards angle minus the heading turned so far. The heading is dead
+        reckoned: the spin rate follows the battery voltage, sampled every tick. If
+        the car is already rotating only the direction changes.
+        """
+        with self.rotate_lock:
+            self.rotate_angle=angle
+            if self.rotate_task is None:
+                self.heading=0.0
+                self.rotate_stamp=time.monotonic()
+                self.rotate_task=Devices.scheduler().add('rotate',self.ROTATE_RATE,self.rotate_step)
+    def stop_rotate(self):  #the wheels keep the last duties, the caller stops or brakes them
+        with self.rotate_lock:
+            task,self.rotate_task=self.rotate_task,None
+        if task is not None:
+            Devices.scheduler().remove(task)
+    def rotating(self):
+        return self.rotate_task is not None
+    def rotate_step(self):
+        now=time.monotonic()
+        rate=1000.0*Devices.battery().voltage()/(7.5*self.time_proportion)    #degrees per second the spin turns the car, as calibrated at 7.5 V
+        self.heading=(self.heading+rate*(now-self.rotate_stamp))%360
+        self.rotate_stamp=now
+        self.setMotorModel(*self.rotate_duties[int(round(self.rotate_angle-self.heading))%360])
 
-PWM=Motor()          
 def loop(): 
     PWM.setMotorModel(2000,2000,2000,2000)       #Forward
     time.sleep(3)
@@ -114,6 +140,7 @@ def loop():
 def destroy():
     PWM.setMotorModel(0,0,0,0)                   
 if __name__=='__main__':
+    PWM=Motor()
     try:
         loop()
     except KeyboardInterrupt:  # When 'Ctrl+C' is pressed, the child program destroy() will be  executed.
@@ -0,0 +1,96 @@
+import math
+import threading
+import time
+import numpy as np
+
+
+class OccupancyMap:
+    """Polar occupancy grid around the car, fed by (pan angle, distance, time) samples.
+
+    Rows are bearing bins over the pan servo's 0-180 degrees (90 is straight
+    ahead), columns are range cells out to max_distance. Each cell holds the
+    log-odds of being occupied. An echo at r marks the cells before r free and
+    the cell at r occupied across the sensor's beam. A sample beyond range
+    marks the whole row free. Old evidence fades over tau seconds as new
+    samples fold in, so a moved obstacle is forgotten quickly, and a row not
+    sampled for tau seconds counts as unknown.
+    """
+    L_OCCUPIED = 0.85
+    L_FREE = -0.4
+    L_MAX = 3.5
+    OCCUPIED = 0.5      # log-odds above which a cell counts as an obstacle
+
+    def __init__(self, max_distance=300, bearing_step=5, range_step=5, beam=15, tau=2.0):
+        self.max_distance = max_distance
+        self.bearing_step = bearing_step
+        self.range_step = range_step
+        self.beam = beam
+        self.tau = tau
+        self.bearings = np.arange(0, 180 + bearing_step, bearing_step)
+        self.cells = int(math.ceil(max_distance / float(range_step)))
+        self.odds = np.zeros((len(self.bearings), self.cells), np.float32)
+        self.updated = np.full(len(self.bearings), -np.inf)     # monotonic time of each row's last sample
+        self.lock = threading.Lock()
+
+    def rows(self, bearing):
+        """Slice of the rows the beam covers when the sensor points at bearing."""
+        half = self.beam / 2.0
+        first = max(int(math.ceil((bearing - half) / self.bearing_step)), 0)
+        last = min(int(math.floor((bearing + half) / self.bearing_step)), len(self.bearings) - 1)
+        return slice(first, max(last, first) + 1)
+
+    def add(self, bearing, cm, stamp=None):
+        stamp = time.monotonic() if stamp is None else stamp
+        rows = self.rows(bearing)
+        with self.lock:
+            fade = np.exp(-np.clip(stamp - self.updated[rows], 0, None) / self.tau)
+            odds = self.odds[rows] * fade[:, None]
+            if 0 < cm < self.max_distance:
+                hit = int(cm / self.range_step)
+                odds[:, :hit] += self.L_FREE
+                odds[:, hit] += self.L_OCCUPIED
+            else:
+                odds += self.L_FREE
+            self.odds[rows] = np.clip(odds, -self.L_MAX, self.L_MAX)
+            self.updated[rows] = np.maximum(self.updated[rows], stamp)
+
+    def clear(self):
+        with self.lock:
+            self.odds[:] = 0
+            self.updated[:] = -np.inf
+
+    def clearance(self, now=None):
+        """Free distance in cm along every bearing, NaN where the map has nothing recent."""
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            age = now - self.updated
+            occupied = self.odds > self.OCCUPIED
+        first = np.where(occupied.any(axis=1), occupied.argmax(axis=1), self.cells)
+        clear = np.minimum(first * float(self.range_step), self.max_distance)
+        clear[age > self.tau] = np.nan
+        return clear
+
+    def clearance_at(self, bearing, now=None):
+        """Free distance in cm along bearing, None if unknown."""
+        rows = self.rows(bearing)
+        clear = self.clearance(now)[rows]
+        if np.isnan(clear).all():
+            return None
+        return float(np.nanmin(clear))
+
+    def free_bearings(self, min_clear=30, now=None):
+        """Bearings known to be clear for at least min_clear cm."""
+        clear = self.clearance(now)
+        return self.bearings[np.nan_to_num(clear, nan=0.0) >= min_clear]
+
+    def encode(self, now=None):
+        """The clearance as hex, one byte per bearing: range cells, ff where unknown."""
+        clear = self.clearance(now)
+        cells = np.where(np.isnan(clear), 255, np.nan_to_num(clear) / self.range_step).astype(np.uint8)
+        return cells.tobytes().hex()
+
+
+def decode(bearing_step, range_step, cells):
+    """Inverse of OccupancyMap.encode: [(bearing, cm or None), ...]."""
+    return [(i * bearing_step, None if cell == 255 else cell * range_step)
+            for i, cell in enumerate(bytes.fromhex(cells))]
@@ -2,7 +2,8 @@
 
 import time
 import math
-import smbus
+import threading
+from I2CBus import get_bus, ESTOP, MOTOR, SERVO
 
 # ============================================================================
 # Raspi PCA9685 16-Channel PWM Servo Driver
@@ -24,16 +25,39 @@ class PCA9685:
   __ALLLED_ON_H        = 0xFB
   __ALLLED_OFF_L       = 0xFC
   __ALLLED_OFF_H       = 0xFD
+  __MODE1_AI           = 0x20    # register auto-increment
+  __BLOCK_MAX          = 32      # SMBus block write limit (8 channels)
+
+  # Shadow copy of the channel registers, one per chip address and shared by every
+  # instance in the process, so a write that would not change anything can be skipped
+  _shadows = {}
 
   def __init__(self, address=0x40, debug=False):
-    self.bus = smbus.SMBus(1)
+    self.bus = get_bus(1)
     self.address = address
     self.debug = debug
-    self.write(self.__MODE1, 0x00)
+    with self.bus.transaction():
+      if address not in PCA9685._shadows:
+        PCA9685._shadows[address] = {
+          'channels': [None] * 16,    # last (on, off) written per channel, None if unknown
+          'pending': {},              # priority -> channel -> (on, off) waiting for the bus
+          'lock': threading.Lock(),   # guards 'pending' only, never held across bus I/O
+          'stats': {'writes': 0, 'skips': 0, 'transactions': 0},
+        }
+    shadow = PCA9685._shadows[address]
+    self.shadow = shadow['channels']
+    self.pending = shadow['pending']
+    self.pending_lock = shadow['lock']
+    self.stats = shadow['stats']
+    self.write(self.__MODE1, self.__MODE1_AI)
     
   def write(self, reg, value):
     "Writes an 8-bit value to the specified register/address"
     self.bus.write_byte_data(self.address, reg, value)
+
+  def writeBlock(self, reg, data):
+    "Writes a list of bytes starting at the specified register, relies on auto-increment"
+    self.bus.write_i2c_block_data(self.address, reg, data)
       
   def read(self, reg):
     "Read an unsigned byte from the I2C device"
@@ -49,26 +73,94 @@ class PCA9685:
     prescale = math.floor(prescaleval + 0.5)
 
 
-    oldmode = self.read(self.__MODE1);
-    newmode = (oldmode & 0x7F) | 0x10        # sleep
-    self.write(self.__MODE1, newmode)        # go to sleep
-    self.write(self.__PRESCALE, int(math.floor(prescale)))
-    self.write(self.__MODE1, oldmode)
-    time.sleep(0.005)
-    self.write(self.__MODE1, oldmode | 0x80)
+    with self.bus.transaction():
+      oldmode = self.read(self.__MODE1);
+      if not (oldmode & 0x10) and self.read(self.__PRESCALE) == prescale:
+        return                                 # already running at this rate, skip the restart
+      newmode = (oldmode & 0x7F) | 0x10        # sleep
+      self.write(self.__MODE1, newmode)        # go to sleep
+      self.write(self.__PRESCALE, int(math.floor(prescale)))
+      self.write(self.__MODE1, oldmode)
+      time.sleep(0.005)
+      self.write(self.__MODE1, oldmode | 0x80)
 
   def setPWM(self, channel, on, off):
-    "Sets a single PWM channel"
-    self.write(self.__LED0_ON_L+4*channel, on & 0xFF)
-    self.write(self.__LED0_ON_H+4*channel, on >> 8)
-    self.write(self.__LED0_OFF_L+4*channel, off & 0xFF)
-    self.write(self.__LED0_OFF_H+4*channel, off >> 8)
+    "Sets a single PWM channel, one register at a time"
+    with self.bus.transaction():
+      self.write(self.__LED0_ON_L+4*channel, on & 0xFF)
+      self.write(self.__LED0_ON_H+4*channel, on >> 8)
+      self.write(self.__LED0_OFF_L+4*channel, off & 0xFF)
+      self.write(self.__LED0_OFF_H+4*channel, off >> 8)
+      self.shadow[channel] = (on, off)
+      self.stats['writes'] += 1
+      self.stats['transactions'] += 4
+
+  def setPWMFrame(self, frame, priority=SERVO):
+    "Queues several PWM channels for the bus at the given priority, frame maps channel -> (on, off)"
+    # Frames still waiting at the same priority are merged, the newest value of a channel wins
+    with self.pending_lock:
+      self.pending.setdefault(priority, {}).update(frame)
+    return self.bus.submit(priority, (self.address, priority), self.flush, priority)
+
+  def emergencyFrame(self, frame):
+    "Writes frame ahead of everything queued, in full, and drops queued writes to the same channels"
+    with self.pending_lock:
+      for pending in self.pending.values():
+        for channel in frame:
+          pending.pop(channel, None)
+      self.pending.setdefault(ESTOP, {}).update(frame)
+    return self.bus.submit(ESTOP, (self.address, ESTOP), self.flush, ESTOP, True)
+
+  def flush(self, priority, force=False):
+    "Writes out the frame queued at the given priority"
+    with self.bus.transaction():
+      with self.pending_lock:
+        frame = self.pending.pop(priority, {})
+      self.writeFrame(frame, force)
+
+  def writeFrame(self, frame, force=False):
+    "Sets several PWM channels now. Unchanged channels are skipped unless forced, nearby ones share one block write"
+    with self.bus.transaction():
+      channels = [channel for channel in sorted(frame) if force or self.shadow[channel] != tuple(frame[channel])]
+      self.stats['skips'] += len(frame) - len(channels)
+      for channel in channels:
+        self.shadow[channel] = None
+      i = 0
+      while i < len(channels):
+        # One block runs from the first dirty channel up to the last one that still fits,
+        # gaps are refilled from the shadow as long as their contents are known
+        start = end = channels[i]
+        i += 1
+        while i < len(channels) and (channels[i] - start + 1) * 4 <= self.__BLOCK_MAX and \
+            all(self.shadow[gap] is not None for gap in range(end + 1, channels[i])):
+          end = channels[i]
+          i += 1
+        data = []
+        for channel in range(start, end + 1):
+          on, off = frame[channel] if channel in frame else self.shadow[channel]
+          data += [on & 0xFF, on >> 8, off & 0xFF, off >> 8]
+        self.writeBlock(self.__LED0_ON_L+4*start, data)
+        for channel in range(start, end + 1):
+          if channel in frame:
+            self.shadow[channel] = tuple(frame[channel])
+        self.stats['writes'] += end - start + 1
+        self.stats['transactions'] += 1
+
+  def invalidate(self):
+    "Forgets the shadow registers so the next write of every channel goes to the chip"
+    with self.bus.transaction():
+      for channel in range(16):
+        self.shadow[channel] = None
+
   def setMotorPwm(self,channel,duty):
-    self.setPWM(channel,0,duty)
+    return self.setPWMFrame({channel: (0, duty)}, MOTOR)
+  def setMotorFrame(self, duties):
+    "Sets several motor channels at once, duties maps channel -> duty"
+    return self.setPWMFrame({channel: (0, duty) for channel, duty in duties.items()}, MOTOR)
   def setServoPulse(self, channel, pulse):
     "Sets the Servo Pulse,The PWM frequency must be 50HZ"
     pulse = pulse*4096/20000        #PWM frequency is 50HZ,the period is 20000us
-    self.setPWM(channel, 0, int(pulse))
+    return self.setPWMFrame({channel: (0, int(pulse))}, SERVO)
 
 if __name__=='__main__':
     pass
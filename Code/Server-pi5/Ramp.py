@@ -0,0 +1,89 @@
+import math
+import threading
+import Devices
+
+
+class MotorRamp:
+    """Smooths wheel duty commands before they reach the motors.
+
+    drive() only records the latest target, so commands that arrive faster
+    than the update rate coalesce and the bus carries the ramp alone. A step
+    on the control scheduler moves each wheel towards its target by at most
+    slew duty per second. With jerk set, each wheel's rate of change is
+    itself limited to jerk duty per second squared and eases in ahead of
+    the target. The step only runs while a wheel is moving, and a new ramp
+    starts from whatever the motors were last set to, by anyone. An all-zero
+    command is a stop and goes straight through. halt() is for braking and
+    handing the motors to something else: it drops the ramp.
+    """
+    def __init__(self, motor, slew=16000, jerk=None, rate=50):
+        self.motor = motor
+        self.slew = slew
+        self.jerk = jerk
+        self.rate = rate
+        self.lock = threading.Lock()
+        self.target = [0.0] * 4
+        self.current = [0.0] * 4
+        self.velocity = [0.0] * 4       # duty per second, used with jerk
+        self.written = None
+        self.task = None
+        self.commands = 0
+        self.writes = 0
+
+    def drive(self, duty1, duty2, duty3, duty4):
+        target = [float(duty) for duty in self.motor.duty_range(duty1, duty2, duty3, duty4)]
+        if not any(target):     # a stop isn't smoothed, the wheels stop at once as they always have
+            self.halt()
+            with self.lock:
+                self.commands += 1
+                self.target = self.current = target
+                self.velocity = [0.0] * 4
+                self.written = (0, 0, 0, 0)
+                self.writes += 1
+                self.motor.setMotorModel(0, 0, 0, 0)
+            return
+        with self.lock:
+            self.target = target
+            self.commands += 1
+            if self.task is None or not self.task.active:
+                self.current = [float(duty) for duty in self.motor.duties]
+                self.velocity = [0.0] * 4
+                self.written = self.motor.duties
+                self.task = Devices.scheduler().add('ramp', self.rate, self.step)
+
+    def halt(self):
+        """End any ramp where it is. The wheels keep their duties, the caller stops or brakes them."""
+        with self.lock:
+            task, self.task = self.task, None
+        if task is not None:
+            Devices.scheduler().remove(task)
+
+    def advance(self, wheel, dt):
+        error = self.target[wheel] - self.current[wheel]
+        if self.jerk is None:
+            self.current[wheel] += max(-self.slew * dt, min(self.slew * dt, error))
+            return
+        # The fastest rate that can still ease to zero by the target, within the slew limit
+        wanted = math.copysign(min(self.slew, math.sqrt(2 * self.jerk * abs(error))), error)
+        change = self.jerk * dt
+        velocity = self.velocity[wheel] + max(-change, min(change, wanted - self.velocity[wheel]))
+        if (velocity * error >= 0 and abs(velocity * dt) >= abs(error)) or (abs(error) < 1 and abs(velocity) <= change):
+            self.current[wheel] = self.target[wheel]
+            self.velocity[wheel] = 0.0
+        else:
+            self.current[wheel] += velocity * dt
+            self.velocity[wheel] = velocity
+
+    def step(self):
+        with self.lock:
+            for wheel in range(4):
+                self.advance(wheel, 1.0 / self.rate)
+            duties = tuple(int(round(duty)) for duty in self.current)
+            settled = self.current == self.target and not any(self.velocity)
+            if settled:
+                self.task = None
+            if duties != self.written:
+                self.motor.setMotorModel(*duties)
+                self.written = duties
+                self.writes += 1
+        return not settled
@@ -0,0 +1,178 @@
+import os
+import heapq
+import threading
+import time
+from Metrics import Histogram
+
+
+class ControlTask:
+    """A control step registered with the Scheduler, and the record of its timing."""
+    def __init__(self, name, rate, step):
+        self.name = name
+        self.period = 1.0 / rate
+        self.step = step
+        self.deadline = None
+        self.active = True
+        self.started = None
+        self.runs = 0
+        self.overruns = 0               # steps that ended past the task's next deadline
+        self.skipped = 0                # periods dropped after an overrun
+        self.errors = 0
+        self.lateness = Histogram()     # start - deadline
+        self.jitter = Histogram()       # |start to start - period|
+        self.execution = Histogram()
+
+    def stats(self):
+        return {'runs': self.runs, 'overruns': self.overruns, 'skipped': self.skipped,
+                'errors': self.errors, 'lateness': str(self.lateness),
+                'jitter': str(self.jitter), 'execution': str(self.execution)}
+
+
+class Scheduler:
+    """Runs control steps at their declared rates on one thread, on monotonic deadlines.
+
+    Due steps run in deadline order. A step that ends past its next deadline
+    counts as an overrun and its missed periods are dropped, keeping the
+    phase, rather than run back to back. A step that returns False or raises
+    ends its task. start() can put the thread under SCHED_FIFO and pin it to
+    CPUs, so on the Pi the control path keeps its timing while the video
+    encoder loads the other cores.
+    """
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.heap = []              # (deadline, seq, task)
+        self.seq = 0
+        self.stopped = threading.Event()
+        self.thread = None
+        self.current = None         # the task whose step is running
+        self.priority = None
+        self.cpus = None
+        self.realtime = False       # whether the SCHED_FIFO request took
+        self.pinned = False
+
+    def add(self, name, rate, step):
+        task = ControlTask(name, rate, step)
+        with self.cond:
+            task.deadline = time.monotonic()
+            self._push(task)
+            self.cond.notify()
+        self.start()
+        return task
+
+    def remove(self, task):
+        """End task. Once this returns its step isn't running and won't run again."""
+        with self.cond:
+            task.active = False     # dropped from the heap when it comes up
+            self.cond.notify_all()
+            if threading.current_thread() is not self.thread:
+                self.cond.wait_for(lambda: self.current is not task)
+
+    def run_until(self, name, rate, step, stopped=None):
+        """Run step at rate until stopped is set or the task ends, from the caller's thread.
+
+        Behaviour loops call this in place of their own sleep loop. It waits in short
+        slices, so stop_thread() can still end the caller, and the task goes with it.
+        """
+        stopped = stopped if stopped is not None else threading.Event()
+        task = self.add(name, rate, step)
+        try:
+            while task.active and not stopped.wait(0.1):
+                pass
+        finally:
+            self.remove(task)
+        return task
+
+    def tasks(self):
+        with self.cond:
+            running = [self.current] if self.current is not None and self.current.active else []
+            return running + [task for deadline, seq, task in self.heap if task.active]
+
+    def stats(self):
+        return dict((task.name, task.stats()) for task in self.tasks())
+
+    def start(self, priority=None, cpus=None):
+        """Start the thread if it isn't running. priority (1-99) asks for SCHED_FIFO, cpus pins it."""
+        with self.cond:
+            if priority is not None:
+                self.priority = priority
+            if cpus is not None:
+                self.cpus = set(cpus)
+            if self.thread is None or not self.thread.is_alive():
+                self.stopped.clear()
+                self.thread = threading.Thread(target=self.run, name="control", daemon=True)
+                self.thread.start()
+                return
+        if priority is not None or cpus is not None:
+            self.isolate()
+
+    def stop(self):
+        self.stopped.set()
+        with self.cond:
+            self.cond.notify()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+
+    def isolate(self):
+        """Apply the requested priority and CPUs to the thread, as far as the OS allows."""
+        tid = self.thread.native_id if self.thread is not threading.current_thread() else 0
+        if self.priority is not None and hasattr(os, 'sched_setscheduler'):
+            try:
+                os.sched_setscheduler(tid, os.SCHED_FIFO, os.sched_param(self.priority))
+                self.realtime = True
+            except OSError as e:
+                print("control thread stays SCHED_OTHER: %s" % e)
+        if self.cpus and hasattr(os, 'sched_setaffinity'):
+            try:
+                os.sched_setaffinity(tid, self.cpus)
+                self.pinned = True
+            except OSError as e:
+                print("control thread not pinned to CPUs %s: %s" % (sorted(self.cpus), e))
+
+    def _push(self, task):
+        self.seq += 1
+        heapq.heappush(self.heap, (task.deadline, self.seq, task))
+
+    def run(self):
+        self.isolate()
+        while not self.stopped.is_set():
+            with self.cond:
+                while self.heap and not self.heap[0][2].active:
+                    heapq.heappop(self.heap)
+                if not self.heap:
+                    self.cond.wait(0.5)
+                    continue
+                deadline, seq, task = self.heap[0]
+                delay = deadline - time.monotonic()
+                if delay > 0:
+                    self.cond.wait(delay)   # and look again: a task added meanwhile may be due first
+                    continue
+                heapq.heappop(self.heap)
+                self.current = task
+            start = time.monotonic()
+            task.lateness.add(start - deadline)
+            if task.started is not None:
+                task.jitter.add(abs(start - task.started - task.period))
+            task.started = start
+            try:
+                result = task.step()
+            except Exception as e:
+                print("control task %s: %s" % (task.name, e))
+                task.errors += 1
+                result = False
+            end = time.monotonic()
+            task.execution.add(end - start)
+            task.runs += 1
+            with self.cond:
+                self.current = None
+                self.cond.notify_all()
+                if result is False or not task.active:
+                    task.active = False
+                    continue
+                task.deadline = deadline + task.period
+                if end > task.deadline:
+                    task.overruns += 1
+                    missed = int((end - task.deadline) / task.period) + 1
+                    task.skipped += missed
+                    task.deadline += missed * task.period
+                    task.started = None     # the next start to start isn't a period
+                self._push(task)
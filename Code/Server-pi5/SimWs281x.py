@@ -0,0 +1,239 @@
+import time
+import numpy as np
+import Simulator
+
+# ============================================================================
+# Simulated _rpi_ws281x: the SWIG surface of the native rpi_ws281x library,
+# for the bundled rpi_ws281x package to drive off the car. Hardware.py
+# registers it as _rpi_ws281x under CAR_BACKEND=sim, so Led runs through the
+# real PixelStrip and its bulk copy and dirty tracking. ws2811_render() keeps
+# the library's timing: it encodes every LED through brightness and gamma,
+# waits out the previous frame's bit stream and reset, then returns while
+# the new frame goes out, 24 or 32 bits per LED at the channel frequency.
+# ============================================================================
+
+WS2811_TARGET_FREQ = 800000
+SK6812_STRIP_RGBW = 0x18100800
+SK6812_STRIP_RBGW = 0x18100008
+SK6812_STRIP_GRBW = 0x18081000
+SK6812_STRIP_GBRW = 0x18080010
+SK6812_STRIP_BRGW = 0x18001008
+SK6812_STRIP_BGRW = 0x18000810
+SK6812_SHIFT_WMASK = 0xf0000000
+WS2811_STRIP_RGB = 0x00100800
+WS2811_STRIP_RBG = 0x00100008
+WS2811_STRIP_GRB = 0x00081000
+WS2811_STRIP_GBR = 0x00080010
+WS2811_STRIP_BRG = 0x00001008
+WS2811_STRIP_BGR = 0x00000810
+WS2812_STRIP = WS2811_STRIP_GRB
+SK6812_STRIP = WS2811_STRIP_GRB
+SK6812W_STRIP = SK6812_STRIP_GRBW
+RPI_PWM_CHANNELS = 2
+LED_RESET_WAIT_TIME = 300e-6    # seconds the library leaves after a frame for the latch
+
+_RETURN_STATES = ((0, 'WS2811_SUCCESS', "Success"),
+                  (-1, 'WS2811_ERROR_GENERIC', "Generic failure"),
+                  (-2, 'WS2811_ERROR_OUT_OF_MEMORY', "Out of memory"),
+                  (-3, 'WS2811_ERROR_HW_NOT_SUPPORTED', "Hardware revision is not supported"),
+                  (-4, 'WS2811_ERROR_MEM_LOCK', "Memory lock failed"),
+                  (-5, 'WS2811_ERROR_MMAP', "mmap() failed"),
+                  (-6, 'WS2811_ERROR_MAP_REGISTERS', "Unable to map registers into userspace"),
+                  (-7, 'WS2811_ERROR_GPIO_INIT', "Unable to initialize GPIO"),
+                  (-8, 'WS2811_ERROR_PWM_SETUP', "Unable to initialize PWM"),
+                  (-9, 'WS2811_ERROR_MAILBOX_DEVICE', "Failed to create mailbox device"),
+                  (-10, 'WS2811_ERROR_DMA', "DMA error"),
+                  (-11, 'WS2811_ERROR_ILLEGAL_GPIO', "Selected GPIO not possible"),
+                  (-12, 'WS2811_ERROR_PCM_SETUP', "Unable to initialize PCM"),
+                  (-13, 'WS2811_ERROR_SPI_SETUP', "Unable to initialize SPI"),
+                  (-14, 'WS2811_ERROR_SPI_TRANSFER', "SPI transfer error"))
+for _state, _name, _text in _RETURN_STATES:
+    globals()[_name] = _state
+WS2811_RETURN_STATE_COUNT = len(_RETURN_STATES)
+
+
+class ws2811_channel_t:
+    """One PWM channel, its fields as the C struct has them, and what its LEDs show."""
+    def __init__(self):
+        self.gpionum = 0
+        self.invert = 0
+        self.count = 0
+        self.strip_type = 0
+        self.leds = None                # uint32 array of count once initialised
+        self.brightness = 0
+        self.wshift = 0
+        self.rshift = 0
+        self.gshift = 0
+        self.bshift = 0
+        self.gamma = None
+        self.frame = []                 # the colors as of the last render
+        self.levels = np.zeros((0, 3), np.uint8)    # bytes per LED the last render sent, R G B (W)
+
+    def bits(self):
+        return self.count * (32 if self.strip_type & SK6812_SHIFT_WMASK else 24)
+
+
+class ws2811_t:
+    def __init__(self):
+        self.render_wait_time = 0
+        self.device = None
+        self.rpi_hw = None
+        self.freq = 0
+        self.dmanum = 0
+        self.channel = [ws2811_channel_t() for channum in range(RPI_PWM_CHANNELS)]
+        self.busy_until = 0.0           # monotonic end of the frame on the wire
+        self.ready_at = 0.0             # and of its reset, when the next render may start
+        self.renders = 0
+        self.world = Simulator.get_world()
+
+
+def _field(kind, name):
+    def getter(obj):
+        return getattr(obj, name)
+
+    def setter(obj, value):
+        setattr(obj, name, value)
+    globals()['%s_%s_get' % (kind, name)] = getter
+    globals()['%s_%s_set' % (kind, name)] = setter
+
+
+for _name in ('gpionum', 'invert', 'count', 'strip_type', 'leds', 'brightness',
+              'wshift', 'rshift', 'gshift', 'bshift'):
+    _field('ws2811_channel_t', _name)
+for _name in ('render_wait_time', 'device', 'rpi_hw', 'freq', 'dmanum', 'channel'):
+    _field('ws2811_t', _name)
+
+
+def ws2811_channel_t_gamma_set(channel, gamma):
+    channel.gamma = np.array(gamma, np.uint8)
+
+
+def ws2811_channel_t_gamma_get(channel):
+    return channel.gamma
+
+
+def new_ws2811_t():
+    return ws2811_t()
+
+
+def delete_ws2811_t(ws):
+    pass
+
+
+def new_ws2811_channel_t():
+    return ws2811_channel_t()
+
+
+def delete_ws2811_channel_t(channel):
+    pass
+
+
+def ws2811_channel_get(ws, channelnum):
+    return ws.channel[channelnum]
+
+
+def ws2811_init(ws):
+    for channel in ws.channel:
+        channel.leds = np.zeros(channel.count, np.uint32)
+        channel.wshift = (channel.strip_type >> 24) & 0xff
+        channel.rshift = (channel.strip_type >> 16) & 0xff
+        channel.gshift = (channel.strip_type >> 8) & 0xff
+        channel.bshift = channel.strip_type & 0xff
+        if channel.gamma is None:
+            channel.gamma = np.arange(256, dtype=np.uint8)
+    return WS2811_SUCCESS
+
+
+def ws2811_fini(ws):
+    ws2811_wait(ws)
+    for channel in ws.channel:
+        channel.leds = None
+
+
+def _sleep_until(ws, deadline):
+    if ws.world.realtime:
+        delay = deadline - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+
+def ws2811_wait(ws):
+    _sleep_until(ws, ws.busy_until)
+    return WS2811_SUCCESS
+
+
+def ws2811_render(ws):
+    protocol_time = 0.0
+    for channel in ws.channel:
+        if channel.leds is None or not channel.count:
+            continue
+        scale = (channel.brightness & 0xff) + 1
+        shifts = [channel.rshift, channel.gshift, channel.bshift, channel.wshift]
+        if not channel.strip_type & SK6812_SHIFT_WMASK:
+            shifts = shifts[:3]
+        raw = (channel.leds[:, None] >> np.array(shifts, np.uint32)) & 0xff
+        channel.levels = channel.gamma[(raw * scale) >> 8]
+        channel.frame = channel.leds.tolist()
+        # Both channels go out in parallel, so the longer one sets the time
+        protocol_time = max(protocol_time, channel.bits() / float(ws.freq or WS2811_TARGET_FREQ))
+    _sleep_until(ws, ws.ready_at)
+    now = time.monotonic()
+    ws.busy_until = now + protocol_time
+    ws.ready_at = ws.busy_until + LED_RESET_WAIT_TIME
+    ws.render_wait_time = int((protocol_time + LED_RESET_WAIT_TIME) * 1e6)
+    ws.renders += 1
+    return WS2811_SUCCESS
+
+
+def ws2811_get_return_t_str(state):
+    for value, name, text in _RETURN_STATES:
+        if value == state:
+            return text
+    return ""
+
+
+def _check(channel, start, count):
+    if channel.leds is None:
+        raise RuntimeError("LEDs not allocated, call begin() first")
+    if start < 0 or start + count > channel.count:
+        raise IndexError("Colors run past the LEDs of the channel")
+
+
+def ws2811_led_get(channel, lednum):
+    if lednum >= channel.count:
+        return 0xffffffff       # the library's -1, as a uint32_t
+    _check(channel, lednum, 1)
+    return int(channel.leds[lednum])
+
+
+def ws2811_led_set(channel, lednum, color):
+    if lednum >= channel.count:
+        return -1
+    _check(channel, lednum, 1)
+    channel.leds[lednum] = color
+    return 0
+
+
+def _colors(colors, writable=False):
+    view = memoryview(colors)
+    if view.itemsize != 4:
+        raise TypeError("Expecting a buffer of 32-bit colors")
+    if writable and view.readonly:
+        raise TypeError("Expecting a writable buffer")
+    return np.frombuffer(view.cast('B'), np.uint32)
+
+
+def ws2811_leds_set(channel, start, colors):
+    colors = _colors(colors)
+    _check(channel, start, len(colors))
+    leds = channel.leds[start:start + len(colors)]
+    if np.array_equal(leds, colors):
+        return False
+    leds[:] = colors
+    return True
+
+
+def ws2811_leds_get(channel, start, colors):
+    colors = _colors(colors, writable=True)
+    _check(channel, start, len(colors))
+    colors[:] = channel.leds[start:start + len(colors)]
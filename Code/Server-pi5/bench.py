@@ -0,0 +1,1402 @@
+# Benchmarks: python bench.py <name>. Run them on the car, or anywhere with CAR_BACKEND=sim
+import math
+import time
+import sys
+import threading
+import numpy as np
+from I2CBus import get_bus, MOTOR, SERVO, ADC
+from Metrics import Histogram
+
+
+def legacy_setMotorModel(motor, duty1, duty2, duty3, duty4):
+    # The pre-frame write path: every channel register written on its own
+    duty1, duty2, duty3, duty4 = motor.duty_range(duty1, duty2, duty3, duty4)
+    for duty, forward, backward in ((duty1, 1, 0), (duty2, 2, 3), (duty3, 7, 6), (duty4, 5, 4)):
+        for channel, value in motor.wheel_duty(duty, forward, backward).items():
+            motor.pwm.setPWM(channel, 0, value)
+
+
+def print_bus_stats(stats):
+    print("bus: %d transactions in %.2f s, utilisation %.1f%%, %d contended, %.1f ms waiting"
+          % (stats['transactions'], stats['elapsed'], stats['utilisation'] * 100,
+             stats['contended'], stats['waited'] * 1000))
+    for name, entry in sorted(stats['threads'].items()):
+        print("  %-12s %6d transactions  %7.1f ms busy  %7.1f ms waiting  %5d contended"
+              % (name, entry['transactions'], entry['busy'] * 1000, entry['waited'] * 1000,
+                 entry['contended']))
+
+
+def bench_PCA9685(updates=200):
+    from Motor import Motor
+    motor = Motor()
+    bus = get_bus()
+    changing = [(1000 + i, -1000 - i, 1500 + i, -1500 - i) for i in range(updates)]
+    steady = [(800, 800, 800, 800)] * updates    # e.g. Line_Tracking holding a straight line
+    for name, duties, update in (("per-register", changing, lambda d: legacy_setMotorModel(motor, *d)),
+                                 ("frame", changing, lambda d: motor.setMotorModel(*d)),
+                                 ("frame steady", steady, lambda d: motor.setMotorModel(*d))):
+        motor.pwm.invalidate()
+        bus.reset_stats()
+        skips = motor.pwm.stats['skips']
+        t0 = time.perf_counter()
+        for d in duties:
+            update(d)
+        elapsed = time.perf_counter() - t0
+        print("%-13s %5.2f transactions/update  %5.2f channels skipped/update  %7.1f us/update"
+              % (name, bus.stats()['transactions'] / updates,
+                 (motor.pwm.stats['skips'] - skips) / updates, elapsed / updates * 1e6))
+    motor.setMotorModel(0, 0, 0, 0)
+
+
+def bench_Bus(seconds=5.0):
+    # A 100 Hz control thread against the server's telemetry timers
+    from Motor import Motor
+    from ADC import Adc
+    motor = Motor()
+    adc = Adc()
+    bus = get_bus()
+    running = True
+
+    def periodic(period, work):
+        while running:
+            work()
+            time.sleep(period)
+
+    i = [0]
+
+    def control():
+        i[0] += 1
+        motor.setMotorModel(1000 + i[0] % 50, 1000, 1000, 1000)
+
+    threads = [threading.Thread(target=periodic, args=(0.01, control), name="control"),
+               threading.Thread(target=periodic, args=(0.17, lambda: (adc.recvADC(0), adc.recvADC(1))),
+                                name="light"),
+               threading.Thread(target=periodic, args=(3, lambda: adc.recvADC(2)), name="power")]
+    bus.reset_stats()
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stats = bus.stats()
+    running = False
+    for t in threads:
+        t.join()
+    print_bus_stats(stats)
+    motor.setMotorModel(0, 0, 0, 0)
+
+
+def print_histogram(name, histogram):
+    print("%-7s %s" % (name, histogram))
+    for bound, n in histogram.rows():
+        print("        <%7d us %6d" % (bound, n))
+
+
+def bench_Scheduler(seconds=5.0):
+    # Command receipt to motor register write while telemetry hammers the ADC,
+    # first with every thread on the bus lock, then through the scheduler
+    from Motor import Motor
+    from ADC import Adc
+    motor = Motor()
+    adc = Adc()
+    bus = get_bus()
+    for scheduled in (False, True):
+        if scheduled:
+            scheduler = bus.start_scheduler()
+        running = [True]
+        latency = Histogram()
+
+        def poll(channel):
+            while running[0]:
+                adc.recvADC(channel)
+
+        pollers = [threading.Thread(target=poll, args=(channel,)) for channel in (0, 1, 2)]
+        for t in pollers:
+            t.start()
+        i = 0
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            i += 1
+            t0 = time.monotonic()
+            request = motor.setMotorModel(1000 + i % 50, 1000, 1000, 1000)
+            request.wait()
+            latency.add(time.monotonic() - t0)
+            time.sleep(0.01)
+        running[0] = False
+        for t in pollers:
+            t.join()
+        if scheduled:
+            print_histogram("sched", latency)
+            for name, priority in (("motor", MOTOR), ("servo", SERVO), ("adc", ADC)):
+                print("  %-6s queue latency %s, %d coalesced"
+                      % (name, scheduler.latency[priority], scheduler.replaced[priority]))
+            bus.stop_scheduler()
+        else:
+            print_histogram("locked", latency)
+    motor.setMotorModel(0, 0, 0, 0)
+
+
+def bench_Stop(stops=100):
+    # Time and bus transactions from the stop call until all eight motor channels are braked
+    from Motor import Motor
+    from ADC import Adc
+    motor = Motor()
+    adc = Adc()
+    bus = get_bus()
+    legacy = Histogram()
+    for i in range(stops):
+        motor.setMotorModel(1000, 1000, 1000, 1000)
+        bus.reset_stats()
+        t0 = time.monotonic()
+        legacy_setMotorModel(motor, 0, 0, 0, 0)
+        legacy.add(time.monotonic() - t0)
+    print_histogram("legacy", legacy)
+    print("        %d transactions/stop" % bus.stats()['transactions'])
+    for i in range(stops):
+        motor.setMotorModel(1000, 1000, 1000, 1000)
+        bus.reset_stats()
+        motor.stop()
+    print_histogram("brake", motor.stop_latency)
+    print("        %d transactions/stop" % bus.stats()['transactions'])
+    # With ADC telemetry queued on the scheduler the brake still goes out first
+    bus.start_scheduler()
+    motor.stop_latency.reset()
+    running = [True]
+
+    def poll():
+        while running[0]:
+            adc.recvADC(2)
+
+    poller = threading.Thread(target=poll)
+    poller.start()
+    for i in range(stops):
+        motor.setMotorModel(1000, 1000, 1000, 1000)
+        motor.stop()
+        time.sleep(0.005)
+    running[0] = False
+    poller.join()
+    print_histogram("loaded", motor.stop_latency)
+    bus.stop_scheduler()
+
+
+def bench_ADC(seconds=3.0):
+    # What recvADC costs its caller: a bus read per call, then the sampler's cache
+    from ADC import Adc
+    adc = Adc()
+    bus = get_bus()
+    bus.start_scheduler()
+    for name in ("bus", "cached"):
+        if name == "cached":
+            sampler = adc.start_sampler()
+            adc.wait_sample()
+        calls = Histogram()
+        ages = Histogram()
+        bus.reset_stats()
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            t0 = time.monotonic()
+            value, age = adc.recvADC(2, age=True)
+            calls.add(time.monotonic() - t0)
+            ages.add(age)
+            time.sleep(0.01)
+        stats = bus.stats()
+        print_histogram(name, calls)
+        print("        reading age %s" % ages)
+        print("        bus utilisation %.1f%%" % (stats['utilisation'] * 100))
+    print("sampler: %d cycles, %d overruns, %d errors" % (sampler.cycles, sampler.overruns, sampler.errors))
+    adc.stop_sampler()
+    bus.stop_scheduler()
+
+
+def bench_Battery(seconds=6.0):
+    # State of charge while the wheels switch between stopped and full duty every second:
+    # straight from the loaded voltage the way the client used to, and from the model
+    import Devices
+    from Battery import soc_from_cell_voltage
+    bus = get_bus()
+    bus.start_scheduler()
+    motor = Devices.motor()
+    adc = Devices.adc()
+    battery = Devices.battery()
+    adc.wait_sample()
+    raw = []
+    model = []
+    t0 = time.monotonic()
+    while time.monotonic() - t0 < seconds:
+        duty = 4095 if int(time.monotonic() - t0) % 2 else 0
+        motor.setMotorModel(duty, duty, duty, duty)
+        adc.wait_sample()
+        raw.append(soc_from_cell_voltage(adc.recvADC(2) * 3 / battery.CELLS))
+        model.append(battery.percent())
+    motor.setMotorModel(0, 0, 0, 0)
+    print("raw    SoC %5.1f%% .. %5.1f%%" % (min(raw), max(raw)))
+    print("model  SoC %5.1f%% .. %5.1f%%, %.1f V open circuit, %.0f min left"
+          % (min(model), max(model), battery.ocv(), battery.time_remaining() / 60))
+    queries = Histogram()
+    for i in range(10000):
+        t = time.perf_counter()
+        battery.percent()
+        queries.add(time.perf_counter() - t)
+    print_histogram("query", queries)
+    adc.stop_sampler()
+    bus.stop_scheduler()
+
+
+def bench_Ranging(seconds=3.0):
+    # What get_distance costs its caller: pinging on the spot, then the ranging service's cache
+    import Devices
+    sonic = Devices.ultrasonic()
+    for name in ("pinging", "cached"):
+        if name == "cached":
+            ranger = sonic.start_ranging()
+            ranger.wait()
+        calls = Histogram()
+        ages = Histogram()
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            t0 = time.monotonic()
+            distance, age = sonic.get_distance(age=True)
+            calls.add(time.monotonic() - t0)
+            ages.add(age)
+            time.sleep(0.05)
+        print_histogram(name, calls)
+        print("        reading age %s" % ages)
+    print("ranging: %d pings, %d timeouts, %d rejected, %d overruns"
+          % (ranger.pings, ranger.timeouts, ranger.rejected, ranger.overruns))
+    sonic.stop_ranging()
+
+
+def legacy_avoid(sonic, running, decisions):
+    # The sweep-then-drive loop obstacle avoidance used to be, one decision per pass
+    while running[0]:
+        sonic.pwm_S.setServoPwm("0", 90)
+        time.sleep(0.1)
+        M = sonic.get_distance()
+        if M < 30:
+            sonic.pwm_S.setServoPwm("0", 30)
+            time.sleep(0.2)
+            L = sonic.get_distance()
+            sonic.pwm_S.setServoPwm("0", 151)
+            time.sleep(0.2)
+            R = sonic.get_distance()
+            sonic.run_motor(L, M, R)
+            sonic.pwm_S.setServoPwm("0", 90)
+        else:
+            sonic.run_motor(20, M, 20)
+        decisions[0] += 1
+
+
+def bench_Avoidance(seconds=3.0, trials=10):
+    # Decisions per second while cruising, then (simulator only) the time from an obstacle
+    # appearing 20 cm ahead to all four wheels reversing
+    import random
+    import Devices
+    import Hardware
+    world = Hardware.world
+    sonic = Devices.ultrasonic()
+    sonic.PWM = Devices.motor()
+    sonic.pwm_S = Devices.servo()
+    bus = get_bus()
+    bus.start_scheduler()
+
+    def clear(bearing):
+        return 150.0
+
+    def blocked(bearing):
+        return 20.0 if abs(bearing - 90) < 20 else 150.0
+
+    for name in ("legacy", "ticks"):
+        running = [True]
+        decisions = [0]
+        if world is not None:
+            world.range_fn = clear
+        if name == "legacy":
+            sonic.stop_ranging()
+            loop = threading.Thread(target=legacy_avoid, args=(sonic, running, decisions))
+        else:
+            def ticks():
+                sonic.start_avoiding()
+                deadline = time.monotonic()
+                while running[0]:
+                    sonic.tick()
+                    decisions[0] = sonic.decisions
+                    deadline += sonic.TICK
+                    time.sleep(max(deadline - time.monotonic(), 0))
+            loop = threading.Thread(target=ticks)
+        loop.start()
+        time.sleep(0.5)
+        first = decisions[0]
+        time.sleep(seconds)
+        print("%-7s %5.1f decisions/s" % (name, (decisions[0] - first) / seconds))
+        if world is not None:
+            reaction = Histogram()
+            for i in range(trials):
+                world.range_fn = clear
+                time.sleep(random.uniform(0.8, 1.2))
+                t0 = time.monotonic()
+                world.range_fn = blocked
+                while time.monotonic() - t0 < 3:
+                    if all(duty < 0 for duty in world.pca.wheel_duties()):
+                        reaction.add(time.monotonic() - t0)
+                        break
+                    time.sleep(0.001)
+            print_histogram("  react", reaction)
+        running[0] = False
+        loop.join()
+    sonic.PWM.setMotorModel(0, 0, 0, 0)
+    sonic.stop_ranging()
+    bus.stop_scheduler()
+
+
+def bench_Map(queries=2000, trials=5):
+    # What the occupancy map's queries cost, then (simulator only) a sweep past a box and
+    # the time from blocked to turning with the sides unknown and with them still mapped
+    import Devices
+    import Hardware
+    from OccupancyMap import OccupancyMap, decode
+    occupancy = OccupancyMap()
+    now = time.monotonic()
+    for bearing in range(0, 181, 5):
+        occupancy.add(bearing, 40 + bearing % 60, now)
+    for name, query in (("add", lambda: occupancy.add(90, 55.0)),
+                        ("side", lambda: occupancy.clearance_at(30)),
+                        ("free", lambda: occupancy.free_bearings(30)),
+                        ("encode", lambda: occupancy.encode())):
+        calls = Histogram()
+        for i in range(queries):
+            t0 = time.monotonic()
+            query()
+            calls.add(time.monotonic() - t0)
+        print_histogram(name, calls)
+    print("encoded: %d bytes for %d bearings" % (len(occupancy.encode()), len(occupancy.bearings)))
+    world = Hardware.world
+    if world is None:
+        return
+    sonic = Devices.ultrasonic()
+    servo = Devices.servo()
+    bus = get_bus()
+    bus.start_scheduler()
+    world.range_fn = lambda bearing: 40.0 if 60 <= bearing <= 100 else 150.0
+    sonic.start_ranging()
+    t0 = time.monotonic()
+    for angle in range(0, 181, 15):
+        servo.setServoPwm('0', angle)
+        sonic.wait_distance(servo.position('0')[1], samples=1)
+    print("sweep: %.2f s, free past 60 cm: %s"
+          % (time.monotonic() - t0, ' '.join(str(bearing) for bearing in sonic.map.free_bearings(60))))
+    print("  " + ' '.join('%d:%s' % (bearing, '-' if cm is None else cm)
+                          for bearing, cm in decode(5, 5, sonic.map.encode())))
+
+    def clear(bearing):
+        return 150.0
+
+    def blocked(bearing):
+        return 20.0 if abs(bearing - 90) < 20 else (40.0 if bearing < 90 else 150.0)
+
+    def turning():
+        duties = world.pca.wheel_duties()
+        return duties[0] * duties[2] < 0
+
+    running = [True]
+
+    def ticks():
+        sonic.start_avoiding()
+        deadline = time.monotonic()
+        while running[0]:
+            sonic.tick()
+            deadline += sonic.TICK
+            time.sleep(max(deadline - time.monotonic(), 0))
+    world.range_fn = clear
+    loop = threading.Thread(target=ticks)
+    loop.start()
+    time.sleep(0.5)
+    turns = {"unknown": Histogram(), "mapped": Histogram()}
+    for i in range(trials):
+        for name in ("unknown", "mapped"):
+            if name == "unknown":
+                sonic.map.clear()
+            t0 = time.monotonic()
+            world.range_fn = blocked
+            while time.monotonic() - t0 < 3 and not turning():
+                time.sleep(0.001)
+            turns[name].add(time.monotonic() - t0)
+            world.range_fn = clear
+            while time.monotonic() - t0 < 3 and sonic.state != 'cruise':
+                time.sleep(0.001)
+            time.sleep(0.3)
+    running[0] = False
+    loop.join()
+    for name in ("unknown", "mapped"):
+        print_histogram(name, turns[name])
+    Devices.motor().setMotorModel(0, 0, 0, 0)
+    sonic.stop_ranging()
+    bus.stop_scheduler()
+
+
+def legacy_track(tracker, running, calls):
+    # The spinning loop line tracking used to be: read the pins and write the motors every pass
+    while running[0]:
+        LMR = tracker.read()
+        if LMR in tracker.DUTIES:
+            tracker.PWM.setMotorModel(*tracker.DUTIES[LMR])
+            calls[1] += 1
+        calls[0] += 1
+
+
+def bench_Line(seconds=3.0, changes=10):
+    # Loop rate, CPU and motor writes of line tracking over a scripted track (simulator only):
+    # the spinning loop, then the edge-driven one, and the time from a sensor edge to the wheels
+    import Devices
+    import Hardware
+    world = Hardware.world
+    if world is None:
+        print("needs CAR_BACKEND=sim to drive the sensors")
+        return
+    tracker = Devices.infrared()
+    tracker.PWM = Devices.motor()
+    bus = get_bus()
+    bus.start_scheduler()
+    track = [2, 6, 2, 3, 2, 4, 2, 1, 0, 2, 7]
+
+    def show(LMR):
+        for bit, pin in ((4, 14), (2, 15), (1, 23)):
+            world.gpio.set_input(pin, 1 if LMR & bit else 0)
+
+    for name in ("legacy", "edges"):
+        show(7)
+        time.sleep(0.1)
+        running = [True]
+        calls = [0, 0]      # loops, setMotorModel calls
+        cpu = [0.0]
+
+        def loop():
+            t0 = time.thread_time()
+            if name == "legacy":
+                legacy_track(tracker, running, calls)
+            else:
+                tracker.reads = tracker.updates = 0
+                tracker.run()
+                calls[:] = [tracker.reads, tracker.updates]
+            cpu[0] = time.thread_time() - t0
+        tracker.reset()
+        thread = threading.Thread(target=loop)
+        bus.reset_stats()
+        t0 = time.monotonic()
+        thread.start()
+        react = Histogram()
+        for i in range(int(seconds * changes)):
+            slot = t0 + (i + 1.0) / changes
+            before = world.pca.wheel_duties()
+            sent = time.monotonic()
+            show(track[i % len(track)])
+            if track[i % len(track)] in tracker.DUTIES:
+                while time.monotonic() < slot and world.pca.wheel_duties() == before:
+                    time.sleep(0.0005)
+                if world.pca.wheel_duties() != before:
+                    react.add(time.monotonic() - sent)
+            time.sleep(max(slot - time.monotonic(), 0))
+        running[0] = False
+        tracker.stop()
+        thread.join()
+        elapsed = time.monotonic() - t0
+        print("%-7s %9.0f loops/s  %5.1f%% CPU  %7.0f setMotorModel/s  %4d bus transactions"
+              % (name, calls[0] / elapsed, cpu[0] / elapsed * 100, calls[1] / elapsed,
+                 bus.stats()['transactions']))
+        print_histogram("  react", react)
+    tracker.PWM.setMotorModel(0, 0, 0, 0)
+    bus.stop_scheduler()
+
+
+def legacy_light(light, running, calls, sampled):
+    # Light seeking before the fixed-rate controller, writing the motors on every pass:
+    # spinning on blocking ADC reads, or (sampled) once per pass of the ADC sampler
+    while running[0]:
+        if sampled:
+            light.adc.wait_sample(1)
+        L = light.adc.recvADC(0)
+        R = light.adc.recvADC(1)
+        calls[0] += 1
+        if L < 2.99 and R < 2.99:
+            light.PWM.setMotorModel(600, 600, 600, 600)
+        elif abs(L - R) < 0.15:
+            light.PWM.setMotorModel(0, 0, 0, 0)
+        elif L > 3 or R > 3:
+            if L > R:
+                light.PWM.setMotorModel(-1200, -1200, 1400, 1400)
+            elif R > L:
+                light.PWM.setMotorModel(1400, 1400, -1200, -1200)
+            else:
+                continue
+        else:
+            continue
+        calls[1] += 1
+
+
+def bench_Light(seconds=4.0):
+    # CPU, bus utilisation and motor writes of light seeking while a simulated lamp moves
+    # around the car (simulator only): dark, left, ahead, right, one phase a second
+    import Devices
+    import Hardware
+    world = Hardware.world
+    if world is None:
+        print("needs CAR_BACKEND=sim to drive the photoresistors")
+        return
+    light = Devices.light()
+    light.adc = Devices.adc()
+    light.PWM = Devices.motor()
+    bus = get_bus()
+    bus.start_scheduler()
+    phases = ([2.5, 2.5], [3.4, 2.9], [3.4, 3.4], [2.9, 3.5])
+    world.light = list(phases[0])
+    light.calibrate()
+    for name in ("spinning", "sampled", "fixed"):
+        if name == "spinning":
+            light.adc.stop_sampler()
+        else:
+            light.adc.start_sampler()
+        running = [True]
+        calls = [0, 0]      # controller passes, setMotorModel calls
+        cpu = [0.0]
+
+        def loop():
+            t0 = time.thread_time()
+            if name == "fixed":
+                light.ticks = light.updates = 0
+                light.run()
+                calls[:] = [light.ticks, light.updates]
+            else:
+                legacy_light(light, running, calls, name == "sampled")
+            cpu[0] = time.thread_time() - t0
+        light.reset()
+        if name == "fixed":
+            world.light = list(phases[0])
+            light.calibrate()   # reset() dropped the ambient level, measure it outside the timing
+        thread = threading.Thread(target=loop)
+        bus.reset_stats()
+        t0 = time.monotonic()
+        thread.start()
+        for i in range(int(seconds)):
+            world.light = list(phases[i % len(phases)])
+            time.sleep(max(t0 + i + 1 - time.monotonic(), 0))
+        running[0] = False
+        light.stop()
+        thread.join()
+        elapsed = time.monotonic() - t0
+        stats = bus.stats()
+        print("%-8s %7.0f passes/s  %5.1f%% CPU  %6.1f setMotorModel/s  bus %5.1f%% busy, %4d transactions"
+              % (name, calls[0] / elapsed, cpu[0] / elapsed * 100, calls[1] / elapsed,
+                 stats['utilisation'] * 100, stats['transactions']))
+        world.light = list(phases[0])
+    light.PWM.setMotorModel(0, 0, 0, 0)
+    light.adc.stop_sampler()
+    bus.stop_scheduler()
+
+
+class Track:
+    # A car on a taped oval, in the line's frame: y cm right of the line, psi radians
+    # clockwise of it, s cm along it. The oval runs anticlockwise, every bend turns left.
+    SPEED = 100.0       # cm/s at full duty
+    WIDTH = 14.0        # cm between the left and right wheels
+    LAG = 0.15          # seconds for the wheels to follow a new duty
+    SKID = 0.6          # fraction of the wheel speed difference a 4WD chassis turns by
+    AHEAD = 8.0         # cm from the axle forward to the sensor bar
+    SPACING = 1.5       # cm between sensors
+    TAPE = 1.8          # cm, width of the line
+
+    def __init__(self, straight=30.0, radius=15.0):
+        self.straight = straight
+        self.radius = radius
+        self.length = 2 * straight + 2 * math.pi * radius
+        self.s = self.y = self.psi = 0.0
+        self.wheels = [0.0, 0.0]
+
+    def curvature(self, s):
+        s %= self.length
+        half = self.straight + math.pi * self.radius
+        return 0.0 if s % half < self.straight else 1.0 / self.radius
+
+    def offset(self):
+        """The sensor bar's centre, cm right of the line."""
+        # The line bends away from the car's tangent by the integral of (AHEAD - u) * curvature
+        bend = sum((self.AHEAD - u) * self.curvature(self.s + u) for u in (0.5, 1.5, 2.5, 3.5, 4.5, 5.5, 6.5, 7.5))
+        return self.y + self.AHEAD * math.sin(self.psi) + bend
+
+    def pattern(self):
+        offset = self.offset()
+        LMR = 0
+        for bit, sensor in ((4, -self.SPACING), (2, 0.0), (1, self.SPACING)):
+            if abs(offset + sensor) < self.TAPE / 2:
+                LMR |= bit
+        return LMR
+
+    def step(self, duties, dt):
+        alpha = 1.0 - math.exp(-dt / self.LAG)
+        for i, duty in enumerate(((duties[0] + duties[1]) / 2, (duties[2] + duties[3]) / 2)):
+            self.wheels[i] += alpha * (duty * self.SPEED - self.wheels[i])
+        v = sum(self.wheels) / 2
+        omega = (self.wheels[1] - self.wheels[0]) / self.WIDTH * self.SKID
+        self.psi += (v * self.curvature(self.s) - omega) * dt
+        self.y += v * math.sin(self.psi) * dt
+        self.s += v * math.cos(self.psi) * dt
+
+
+def bench_Follow(speeds=(1500, 2500, 3500, 4000), laps=1):
+    # Lap time on a simulated oval (simulator only): the pattern table scaled to the speed,
+    # then the PID follower. A lap fails if the car stops or ends up 8 cm off the line.
+    import Devices
+    import Hardware
+    world = Hardware.world
+    if world is None:
+        print("needs CAR_BACKEND=sim to drive the sensors")
+        return
+    tracker = Devices.infrared()
+    bus = get_bus()
+    bus.start_scheduler()
+
+    def show(LMR):
+        for bit, pin in ((4, 14), (2, 15), (1, 23)):
+            world.gpio.set_input(pin, 1 if LMR & bit else 0)
+
+    for name in ("table", "pid"):
+        for speed in speeds:
+            track = Track()
+            LMR = track.pattern()
+            show(LMR)
+            time.sleep(0.05)
+            if name == "table":
+                tracker.DUTIES = dict((state, tuple(int(duty * speed / 800.0) for duty in duties))
+                                      for state, duties in type(tracker).DUTIES.items())
+                loop = threading.Thread(target=tracker.run)
+            else:
+                loop = threading.Thread(target=tracker.follow, args=(speed,))
+            tracker.reset()
+            loop.start()
+            worst = square = 0.0
+            reversals = 0
+            signs = None
+            t0 = last = time.monotonic()
+            result = "off the line"
+            while time.monotonic() - t0 < 30:
+                time.sleep(0.001)
+                now = time.monotonic()
+                track.step(world.pca.wheel_duties(), now - last)
+                worst = max(worst, abs(track.offset()))
+                square += track.offset() ** 2 * (now - last)
+                duties = world.pca.wheel_duties()
+                if signs is not None:
+                    reversals += sum(1 for duty, sign in zip(duties, signs) if duty * sign < 0)
+                signs = [duty if duty else sign for duty, sign in zip(duties, signs or duties)]
+                last = now
+                if track.pattern() != LMR:
+                    LMR = track.pattern()
+                    show(LMR)
+                if track.s >= laps * track.length:
+                    result = "%5.2f s lap  %5.1f cm/s" % ((now - t0) / laps, track.s / (now - t0))
+                    break
+                if worst > 8 or (now - t0 > 1 and max(abs(wheel) for wheel in track.wheels) < 1):
+                    break
+            tracker.stop()
+            loop.join()
+            tracker.PWM.setMotorModel(0, 0, 0, 0)
+            print("%-5s %4d  %-26s rms %4.1f cm  worst %4.1f cm off  %3d wheel reversals"
+                  % (name, speed, result, math.sqrt(square / (last - t0)), worst, reversals))
+        if name == "table":
+            del tracker.DUTIES
+    bus.stop_scheduler()
+
+
+def legacy_loop(task, running, work):
+    # How the behaviour loops paced themselves: do the work, then sleep a period
+    t0 = time.monotonic()
+    while running[0]:
+        start = time.monotonic()
+        task.lateness.add(max(start - (t0 + task.runs * task.period), 0))
+        if task.started is not None:
+            task.jitter.add(abs(start - task.started - task.period))
+        task.started = start
+        work()
+        task.execution.add(time.monotonic() - start)
+        task.runs += 1
+        time.sleep(task.period)
+
+
+def bench_Control(seconds=5.0):
+    # Three control steps at 100, 50 and 10 Hz, paced by sleeping in their own threads and
+    # by the scheduler, idle and with every core busy the way video encoding keeps them
+    import os
+    import subprocess
+    import Devices
+    from Scheduler import ControlTask
+
+    def work():
+        sum(range(2000))        # about the cost of a controller step
+    rates = (("follow", 100), ("avoid", 50), ("light", 10))
+    cores = os.cpu_count() or 1
+    for load in (False, True):
+        hogs = []
+        if load:
+            hogs = [subprocess.Popen([sys.executable, '-c', 'while True: pass']) for i in range(cores)]
+        modes = ("sleep", "scheduler") if not load else ("sleep", "scheduler", "isolated")
+        for mode in modes:
+            running = [True]
+            if mode == "sleep":
+                tasks = [ControlTask(name, rate, work) for name, rate in rates]
+                threads = [threading.Thread(target=legacy_loop, args=(task, running, work)) for task in tasks]
+                for thread in threads:
+                    thread.start()
+                time.sleep(seconds)
+                running[0] = False
+                for thread in threads:
+                    thread.join()
+            else:
+                scheduler = Devices.scheduler()
+                if mode == "isolated":
+                    scheduler.start(priority=10, cpus={cores - 1})
+                tasks = [scheduler.add(name, rate, work) for name, rate in rates]
+                time.sleep(seconds)
+                for task in tasks:
+                    scheduler.remove(task)
+            print("%s, %s%s" % ("loaded" if load else "idle", mode,
+                                " (SCHED_FIFO %s, pinned %s)" % (Devices.scheduler().realtime,
+                                                                  Devices.scheduler().pinned)
+                                if mode == "isolated" else ""))
+            for task in tasks:
+                print("  %-6s %5.1f Hz  %3d overruns  jitter %s" % (task.name, task.runs / seconds,
+                                                                    task.overruns, task.jitter))
+                print("  %-6s %24s late   %s" % ("", "", task.lateness))
+        for hog in hogs:
+            hog.kill()
+            hog.wait()
+    Devices.scheduler().stop()
+
+
+def legacy_rotate(motor, battery, n, running, steps):
+    # The open-loop Rotate: cos/sin every step, paced by a sleep timed from one battery reading
+    angle = n
+    bat_compensate = 7.5 / battery.voltage()
+    while running[0]:
+        W = 2000
+        VY = int(2000 * math.cos(math.radians(angle)))
+        VX = -int(2000 * math.sin(math.radians(angle)))
+        motor.setMotorModel(VY + VX - W, VY - VX - W, VY - VX + W, VY + VX + W)
+        time.sleep(5 * motor.time_proportion * bat_compensate / 1000)
+        angle -= 5
+        steps[0] += 1
+
+
+def bench_Rotate(seconds=4.0):
+    # Rotate mode: how far the spin the wheels are given drifts from the spin the battery
+    # drives over seconds, with the pack sagging halfway (simulator only), and what
+    # starting and stopping it costs
+    import Devices
+    import Hardware
+    from Thread import stop_thread
+    world = Hardware.world
+    if world is None:
+        print("needs CAR_BACKEND=sim to sag the battery")
+        return
+    motor = Devices.motor()
+    battery = Devices.battery()
+    bus = get_bus()
+    bus.start_scheduler()
+    for name in ("legacy", "ticks"):
+        world.battery_ocv = 8.2
+        time.sleep(0.5)
+        battery.update()
+        started = Histogram()
+        stopped = Histogram()
+        before = threading.active_count()
+        t0 = time.monotonic()
+        before_duties = world.pca.wheel_duties()
+        steps = [0]
+        running = [True]
+        if name == "legacy":
+            loop = threading.Thread(target=legacy_rotate, args=(motor, battery, 0, running, steps))
+            loop.start()
+        else:
+            motor.start_rotate(0)
+        while world.pca.wheel_duties() == before_duties and time.monotonic() - t0 < 1:
+            time.sleep(0.0002)
+        started.add(time.monotonic() - t0)
+        threads = threading.active_count() - before
+        # What the car actually turns: the battery's spin rate, integrated
+        turned = 0.0
+        last = time.monotonic()
+        while time.monotonic() - t0 < seconds:
+            if time.monotonic() - t0 > seconds / 2:
+                world.battery_ocv = 7.4
+            time.sleep(0.01)
+            now = time.monotonic()
+            turned += 1000.0 * battery.voltage() / (7.5 * motor.time_proportion) * (now - last)
+            last = now
+        t1 = time.monotonic()
+        if name == "legacy":
+            stop_thread(loop)
+            loop.join()
+            given = steps[0] * 5.0
+        else:
+            motor.stop_rotate()
+            given = motor.heading + 360 * round((turned - motor.heading) / 360.0)
+        motor.setMotorModel(0, 0, 0, 0)
+        stopped.add(time.monotonic() - t1)
+        print("%-7s turned %6.0f deg, wheels steered for %6.0f deg: %+5.0f deg off  %d thread(s) started"
+              % (name, turned, given, given - turned, threads))
+        print("        start to first wheel write %5.1f ms, stop %5.1f ms"
+              % (started.mean() * 1000, stopped.mean() * 1000))
+    cost = Histogram()
+    for i in range(2000):
+        t0 = time.monotonic()
+        angle = i * 5
+        W = 2000
+        VY = int(2000 * math.cos(math.radians(angle)))
+        VX = -int(2000 * math.sin(math.radians(angle)))
+        (VY + VX - W, VY - VX - W, VY - VX + W, VY + VX + W)
+        cost.add(time.monotonic() - t0)
+    print_histogram("trig", cost)
+    cost = Histogram()
+    for i in range(2000):
+        t0 = time.monotonic()
+        motor.rotate_duties[int(round(i * 5.0)) % 360]
+        cost.add(time.monotonic() - t0)
+    print_histogram("table", cost)
+    bus.stop_scheduler()
+
+
+def bench_Ramp(seconds=4.0, rate=100):
+    # A joystick streaming commands at rate, slammed between full forward, full reverse and
+    # stop twice a second: the steps that reach the wheels, the current they pull from the
+    # pack (simulator only), what the bus carries, and how long the wheels take to get there
+    import Devices
+    import Hardware
+    from Ramp import MotorRamp
+    world = Hardware.world
+    if world is None:
+        print("needs CAR_BACKEND=sim to watch the wheels")
+        return
+    motor = Devices.motor()
+    bus = get_bus()
+    bus.start_scheduler()
+    targets = (4095, -4095, 0, -4095, 4095, 0)
+    for name in ("direct", "ramp", "jerk"):
+        ramp = MotorRamp(motor, jerk=400000 if name == "jerk" else None)
+        drive = motor.setMotorModel if name == "direct" else ramp.drive
+        motor.setMotorModel(0, 0, 0, 0)
+        time.sleep(0.1)
+        samples = []        # (time, wheel duties)
+        running = [True]
+
+        def watch():
+            while running[0]:
+                samples.append((time.monotonic(), world.pca.wheel_duties()))
+                time.sleep(0.0005)
+
+        watcher = threading.Thread(target=watch)
+        watcher.start()
+        bus.reset_stats()
+        commands = 0
+        changes = []        # (time, target)
+        t0 = time.monotonic()
+        while time.monotonic() - t0 < seconds:
+            target = targets[int((time.monotonic() - t0) * 2) % len(targets)]
+            if not changes or changes[-1][1] != target:
+                changes.append((time.monotonic(), target))
+            jitter = commands % 7 - 3      # a real stick never reads the same twice
+            drive(target + jitter, target + jitter, target + jitter, target + jitter)
+            commands += 1
+            time.sleep(1.0 / rate)
+        stats = bus.stats()
+        time.sleep(0.5)
+        running[0] = False
+        watcher.join()
+        ramp.halt()
+        motor.setMotorModel(0, 0, 0, 0)
+        step = 0.0
+        surge = 0.0
+        for (t1, duties1), (t2, duties2) in zip(samples, samples[1:]):
+            step = max(step, max(abs(b - a) for a, b in zip(duties1, duties2)) * 4095)
+            surge = max(surge, (sum(map(abs, duties2)) - sum(map(abs, duties1))) * world.motor_current)
+        settle = Histogram()
+        for (t1, target), (t2, next_target) in zip(changes, changes[1:]):
+            reached = [t for t, duties in samples
+                       if t1 <= t < t2 and abs(duties[0] * 4095 - target) < 50]
+            if reached:
+                settle.add(reached[0] - t1)
+        print("%-7s %4d commands, %4d bus transactions; largest step %5.0f duty, current surge %4.1f A"
+              % (name, commands, stats['transactions'], step, surge))
+        print("        settle mean %5.1f ms  max %5.1f ms" % (settle.mean() * 1000, settle.max * 1000))
+    bus.stop_scheduler()
+
+
+def legacy_joystick(data1, data2, data3, data4):
+    # CMD_M_MOTOR as readdata computed it inline
+    LX = -int((data2 * math.sin(math.radians(data1))))
+    LY = int(data2 * math.cos(math.radians(data1)))
+    RX = int(data4 * math.sin(math.radians(data3)))
+    RY = int(data4 * math.cos(math.radians(data3)))
+    FR = LY - LX + RX
+    FL = LY + LX - RX
+    BL = LY - LX - RX
+    BR = LY + LX + RX
+    return FL, BL, FR, BR
+
+
+def bench_Kinematics(commands=20000):
+    # Per-command cost of turning a CMD_M_MOTOR into wheel duties, and of a batch at once
+    import random
+    from Kinematics import Mecanum
+    kinematics = Mecanum()
+    calibrated = Mecanum((1.0, 0.97, 1.0, 1.03))
+    args = [(random.randint(0, 359), random.randint(0, 4095), random.randint(0, 359), random.randint(0, 4095))
+            for i in range(commands)]
+    mismatches = sum(1 for command in args if kinematics.joystick(*command) != legacy_joystick(*command))
+    print("table and inline maths disagree on %d of %d commands" % (mismatches, commands))
+    for name, convert in (("inline", legacy_joystick), ("table", kinematics.joystick),
+                          ("gains", calibrated.joystick)):
+        cost = Histogram()
+        for command in args:
+            t0 = time.perf_counter()
+            convert(*command)
+            cost.add(time.perf_counter() - t0)
+        print_histogram(name, cost)
+        t0 = time.perf_counter()
+        for command in args:
+            convert(*command)
+        print("        %.3f us per command in a loop" % ((time.perf_counter() - t0) / commands * 1e6))
+    angle, speed = np.array(args)[:, 0], np.array(args)[:, 1]
+    t0 = time.perf_counter()
+    kinematics.steer_array(angle, speed)
+    print("array   %.3f us per command, %d at once" % ((time.perf_counter() - t0) / commands * 1e6, commands))
+
+
+def legacy_setServoPwm(servo, channel, angle, error=10):
+    # The if/elif chain, one pulse computed and queued per call
+    angle = int(angle)
+    if channel == '0':
+        servo.PwmServo.setServoPulse(8, 2500 - int((angle + error) / 0.09))
+    elif channel == '1':
+        servo.PwmServo.setServoPulse(9, 500 + int((angle + error) / 0.09))
+    elif channel == '2':
+        servo.PwmServo.setServoPulse(10, 500 + int((angle + error) / 0.09))
+    elif channel == '3':
+        servo.PwmServo.setServoPulse(11, 500 + int((angle + error) / 0.09))
+    elif channel == '4':
+        servo.PwmServo.setServoPulse(12, 500 + int((angle + error) / 0.09))
+    elif channel == '5':
+        servo.PwmServo.setServoPulse(13, 500 + int((angle + error) / 0.09))
+    elif channel == '6':
+        servo.PwmServo.setServoPulse(14, 500 + int((angle + error) / 0.09))
+    elif channel == '7':
+        servo.PwmServo.setServoPulse(15, 500 + int((angle + error) / 0.09))
+
+
+def bench_Servo(seconds=3.0, rate=30):
+    # Face tracking: pan and tilt commanded separately rate times a second, in 5-10 degree
+    # jumps. What the bus carries, and the largest jump the servos see (simulator only)
+    import random
+    import Devices
+    import Hardware
+    world = Hardware.world
+    servo = Devices.servo()
+    bus = get_bus()
+    bus.start_scheduler()
+    for name in ("legacy", "move"):
+        servo.setServoFrame({'0': 90, '1': 90})
+        time.sleep(0.1)
+        samples = []        # (pan, tilt) as the chip has them
+        running = [True]
+
+        def watch():
+            while running[0]:
+                samples.append((world.pca.servo_angle(8), world.pca.servo_angle(9)))
+                time.sleep(0.001)
+
+        if world is not None:
+            watcher = threading.Thread(target=watch)
+            watcher.start()
+        random.seed(1)
+        pan = tilt = 90
+        frames = servo.frames
+        bus.reset_stats()
+        t0 = time.monotonic()
+        commands = 0
+        while time.monotonic() - t0 < seconds:
+            pan = max(30, min(150, pan + random.choice((-1, 1)) * random.randint(5, 10)))
+            tilt = max(60, min(150, tilt + random.choice((-1, 1)) * random.randint(5, 10)))
+            for channel, angle in (('0', pan), ('1', tilt)):
+                if name == "legacy":
+                    legacy_setServoPwm(servo, channel, angle)
+                else:
+                    servo.move(channel, angle)
+                commands += 1
+            time.sleep(1.0 / rate)
+        time.sleep(0.3)
+        stats = bus.stats()
+        line = "%-7s %4d commands, %4d bus transactions" % (name, commands, stats['transactions'])
+        if name == "move":
+            line += ", %d frames" % (servo.frames - frames)
+        if world is not None:
+            running[0] = False
+            watcher.join()
+            jump = max(max(abs(b - a) for a, b in zip(first, second)) for first, second in zip(samples, samples[1:]))
+            line += "; largest jump %4.1f deg" % jump
+        print(line)
+    # A pan sweep at 150 degrees per second: stepped 5 degrees per command from the client,
+    # or given as its end points and interpolated here
+    for name in ("steps", "targets"):
+        servo.setServoFrame({'0': 30})
+        time.sleep(0.2)
+        bus.reset_stats()
+        commands = 0
+        t0 = time.monotonic()
+        angle = 30
+        for end in (150, 30, 150, 30):
+            if name == "steps":
+                while angle != end:
+                    angle += 5 if end > angle else -5
+                    legacy_setServoPwm(servo, '0', angle)
+                    commands += 1
+                    time.sleep(1.0 / rate)
+            else:
+                servo.move('0', end, 150)
+                commands += 1
+                while servo.targets:
+                    time.sleep(0.005)
+        stats = bus.stats()
+        print("%-7s %4d commands, %4d bus transactions, %.2f s" % (name, commands, stats['transactions'],
+                                                                   time.monotonic() - t0))
+    servo.stop()
+    for name, convert in (("formula", lambda angle: (0, int((500 + int((angle + 10) / 0.09)) * 4096 / 20000))),
+                          ("table", lambda angle: servo.tables['1'][angle])):
+        t0 = time.perf_counter()
+        for i in range(100000):
+            convert(i % 181)
+        print("%-7s %.3f us per angle" % (name, (time.perf_counter() - t0) / 100000 * 1e6))
+    bus.stop_scheduler()
+
+
+def legacy_ledIndex(led, index, R, G, B):
+    # One render per selected LED
+    from Hardware import Color
+    color = led.LED_TYPR(led.ORDER, Color(R, G, B))
+    for i in range(8):
+        if index & 0x01 == 1:
+            led.strip.setPixelColor(i, color)
+            led.strip.show()
+        index = index >> 1
+
+
+def legacy_colorWipe(led, color, wait_ms=50):
+    # One render per pixel, whether or not it changed
+    color = led.LED_TYPR(led.ORDER, color)
+    for i in range(led.strip.numPixels()):
+        led.strip.setPixelColor(i, color)
+        led.strip.show()
+        time.sleep(wait_ms / 1000.0)
+
+
+def legacy_theaterChaseRainbow(led, wait_ms=50):
+    for j in range(256):
+        for q in range(3):
+            for i in range(0, led.strip.numPixels() - q, 3):
+                led.strip.setPixelColor(i + q, led.wheel((i + j) % 255))
+            led.strip.show()
+            time.sleep(wait_ms / 1000.0)
+            for i in range(0, led.strip.numPixels() - q, 3):
+                led.strip.setPixelColor(i + q, 0)
+
+
+def bench_Led(commands=200, seconds=3.0):
+    # Renders per CMD_LED, sent in a burst and at 20 a second, then renders and CPU
+    # time per second of the wipe and chase modes
+    import random
+    import Devices
+    from Hardware import Color
+    from Thread import stop_thread
+    led = Devices.led()
+    random.seed(1)
+    picks = [(random.randint(1, 255), random.randint(0, 255), random.randint(0, 255), random.randint(0, 255))
+             for i in range(commands)]
+    for name, send in (("legacy", lambda pick: legacy_ledIndex(led, *pick)),
+                       ("frame", lambda pick: led.ledIndex(*pick))):
+        for rate in (None, 20):
+            led.fill(0)
+            led.show()
+            time.sleep(0.1)
+            renders = led.strip._leds.renders
+            t0 = time.monotonic()
+            for pick in picks[:commands if rate is None else commands // 10]:
+                send(pick)
+                if rate is not None:
+                    time.sleep(1.0 / rate)
+            time.sleep(0.1)     # for a deferred render
+            sent = commands if rate is None else commands // 10
+            print("%-7s %-6s %4d commands in %5.2f s, %.2f renders per command"
+                  % (name, "burst" if rate is None else "%d/s" % rate, sent, time.monotonic() - t0,
+                     (led.strip._leds.renders - renders) / float(sent)))
+
+    def wipes(wipe):
+        while True:
+            wipe(Color(255, 0, 0))
+            wipe(Color(0, 255, 0))
+            wipe(Color(0, 0, 255))
+            wipe(Color(0, 0, 0), 10)
+            wipe(Color(0, 0, 0), 10)   # what ledMode does when the animation ends, again
+
+    animations = (("legacy", "wipes", lambda: wipes(lambda color, wait_ms=50: legacy_colorWipe(led, color, wait_ms))),
+                  ("frame", "wipes", lambda: wipes(lambda color, wait_ms=50: led.colorWipe(led.strip, color, wait_ms))),
+                  ("legacy", "chase", lambda: legacy_theaterChaseRainbow(led)),
+                  ("frame", "chase", lambda: led.theaterChaseRainbow(led.strip)))
+    for name, mode, animate in animations:
+        led.fill(0)
+        led.show()
+        renders = led.strip._leds.renders
+        cpu = time.process_time()
+        t0 = time.monotonic()
+        thread = threading.Thread(target=animate)
+        thread.start()
+        time.sleep(seconds)
+        stop_thread(thread)
+        thread.join()
+        elapsed = time.monotonic() - t0
+        print("%-7s %-6s %5.1f renders/s, %5.2f ms CPU per second"
+              % (name, mode, (led.strip._leds.renders - renders) / elapsed,
+                 (time.process_time() - cpu) / elapsed * 1000))
+
+
+def legacy_LED_TYPR(order, R_G_B):
+    from Hardware import Color
+    B = R_G_B & 255
+    G = R_G_B >> 8 & 255
+    R = R_G_B >> 16 & 255
+    Led_type = ["GRB", "GBR", "RGB", "RBG", "BRG", "BGR"]
+    color = [Color(G, R, B), Color(G, B, R), Color(R, G, B), Color(R, B, G), Color(B, R, G), Color(B, G, R)]
+    if order in Led_type:
+        return color[Led_type.index(order)]
+
+
+def legacy_wheel(pos, order="RGB"):
+    from Hardware import Color
+    if pos < 0 or pos > 255:
+        r = g = b = 0
+    elif pos < 85:
+        r, g, b = pos * 3, 255 - pos * 3, 0
+    elif pos < 170:
+        pos -= 85
+        r, g, b = 255 - pos * 3, 0, pos * 3
+    else:
+        pos -= 170
+        r, g, b = 0, pos * 3, 255 - pos * 3
+    return legacy_LED_TYPR(order, Color(r, g, b))
+
+
+def legacy_cycle_frame(n, j):
+    return [legacy_wheel((int(i * 256 / n) + j) & 255) for i in range(n)]
+
+
+def legacy_ledMode(led, mode):
+    # rainbowCycle or rainbow forever, on its own thread, until stop_thread() kills it
+    while True:
+        for j in range(256 * 5):
+            for i in range(led.strip.numPixels()):
+                if mode == '5':
+                    led.strip.setPixelColor(i, legacy_wheel((int(i * 256 / led.strip.numPixels()) + j) & 255))
+                else:
+                    led.strip.setPixelColor(i, legacy_wheel((i + j) & 255))
+            led.strip.show()
+            time.sleep(0.02)
+
+
+def bench_Animation(frames=5000, seconds=3.0, switches=20):
+    # What a rainbowCycle frame costs to work out, CPU per second of animation, and how
+    # long a CMD_LED_MOD takes to change what the strip shows
+    import Devices
+    from Thread import stop_thread
+    led = Devices.led()
+    n = led.numPixels()
+    for name, frame in (("legacy", lambda j: legacy_cycle_frame(n, j)),
+                        ("table", lambda j: led.cycleFrame(j * 0.02 + 0.001))):
+        t0 = time.perf_counter()
+        for j in range(frames):
+            frame(j & 255)
+        print("%-7s %6.1f us per frame" % (name, (time.perf_counter() - t0) / frames * 1e6))
+    for name in ("legacy", "engine"):
+        led.ledMode('0')
+        time.sleep(0.2)
+        cpu = time.process_time()
+        t0 = time.monotonic()
+        if name == "legacy":
+            thread = threading.Thread(target=legacy_ledMode, args=(led, '5'))
+            thread.start()
+        else:
+            led.ledMode('5')
+        time.sleep(seconds)
+        elapsed = time.monotonic() - t0
+        used = time.process_time() - cpu
+        switch = Histogram()
+        mode = '5'
+        for i in range(switches):
+            mode = '4' if mode == '5' else '5'
+            before = list(led.strip._channel.frame)
+            t1 = time.monotonic()
+            if name == "legacy":
+                stop_thread(thread)     # what the server did, sleep included
+                time.sleep(0.1)
+                thread = threading.Thread(target=legacy_ledMode, args=(led, mode))
+                thread.start()
+            else:
+                led.ledMode(mode)
+            while led.strip._channel.frame == before and time.monotonic() - t1 < 1:
+                time.sleep(0.0002)
+            switch.add(time.monotonic() - t1)
+            time.sleep(0.1)
+        if name == "legacy":
+            stop_thread(thread)
+            thread.join()
+        print("%-7s %5.2f ms CPU per animation second; switch %s" % (name, used / elapsed * 1000, switch))
+    led.ledMode('0')
+
+
+def bench_Pixels(lengths=(8, 60, 300, 1000), number=200):
+    # Microseconds to load and read back a whole strip of each length, per pixel
+    # against the bulk buffer path, then what show() costs when nothing changed
+    import timeit
+    from array import array
+    from Hardware import PixelStrip, Color
+    for n in lengths:
+        strip = PixelStrip(n, 18)
+        if not hasattr(strip, 'setPixelBuffer'):
+            print("needs the bundled rpi_ws281x, %s has no setPixelBuffer" % type(strip).__name__)
+            return
+        strip.begin()
+        colors = [Color(i % 256, 255 - i % 256, (7 * i) % 256) for i in range(n)]
+        packed = array('I', colors)
+        numbers = np.array(colors, np.uint32)
+        pixels = strip.getPixels()
+
+        def per_pixel():
+            for i, color in enumerate(colors):
+                strip.setPixelColor(i, color)
+
+        def get_per_pixel():
+            return [strip.getPixelColor(i) for i in range(n)]
+
+        def us(f):
+            return min(timeit.repeat(f, number=number, repeat=5)) / number * 1e6
+        print("%4d pixels  set: per pixel %7.1f  slice %6.1f  list %6.1f  array('I') %5.1f  uint32 %5.1f us"
+              % (n, us(per_pixel), us(lambda: pixels.__setitem__(slice(0, n), colors)),
+                 us(lambda: strip.setPixelBuffer(colors)), us(lambda: strip.setPixelBuffer(packed)),
+                 us(lambda: strip.setPixelBuffer(numbers))))
+        print("             get: per pixel %7.1f  buffer %5.1f us"
+              % (us(get_per_pixel), us(lambda: strip.getPixelBuffer(packed))))
+        strip.show(force=True)
+        t0 = time.perf_counter()
+        for i in range(10):
+            strip.show(force=True)      # each waits out the frame before it
+        forced = (time.perf_counter() - t0) / 10
+        strip.setPixelBuffer(packed)
+        print("             show: back to back %7.1f us (%d bits at 800 kHz take %.0f us), unchanged %5.2f us"
+              % (forced * 1e6, 24 * n, 24 * n / 0.8, us(strip.show)))
+        strip._cleanup()
+
+
+# Started in a fresh interpreter, the way main.py -n brings the server up
+STARTUP = """
+import time
+marks = [time.monotonic()]
+from server import Server
+marks.append(time.monotonic())
+server = Server()
+marks.append(time.monotonic())
+server.StartTcpServer()
+marks.append(time.monotonic())
+print('marks ' + ' '.join(repr(mark) for mark in marks))
+server.readdata()
+"""
+
+
+def bench_Startup(runs=5):
+    # Process start to the first accepted command connection on port 5000
+    import os
+    import socket
+    import subprocess
+    phases = ("interpreter", "import", "devices", "listen", "accept")
+    totals = dict((name, Histogram()) for name in phases + ("total",))
+    for i in range(runs):
+        t0 = time.monotonic()
+        child = subprocess.Popen([sys.executable, '-u', '-c', STARTUP], stdout=subprocess.PIPE,
+                                 universal_newlines=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+        try:
+            host = marks = None
+            for line in child.stdout:
+                if line.startswith('Server address: '):
+                    host = line.split(': ', 1)[1].strip()
+                elif line.startswith('marks '):
+                    marks = [float(mark) for mark in line.split()[1:]]
+                    break
+            if marks is None:
+                print("server exited before listening")
+                return
+            connection = socket.create_connection((host, 5000), timeout=5)
+            for line in child.stdout:
+                if line.startswith('Client connection successful'):
+                    break
+            accepted = time.monotonic()
+            connection.close()
+        finally:
+            child.kill()
+            child.wait()
+        points = [t0] + marks + [accepted]
+        for name, start, end in zip(phases, points, points[1:]):
+            totals[name].add(end - start)
+        totals["total"].add(accepted - t0)
+    for name in phases + ("total",):
+        print("%-12s mean %7.1f ms  max %7.1f ms"
+              % (name, totals[name].mean() * 1000, totals[name].max * 1000))
+
+
+# Main program logic follows:
+if __name__ == '__main__':
+    print('Program is starting ... ')
+    if len(sys.argv) < 2:
+        print("Parameter error: Please assign the benchmark")
+        exit()
+    if sys.argv[1] == 'PCA9685':
+        bench_PCA9685()
+    elif sys.argv[1] == 'Bus':
+        bench_Bus()
+    elif sys.argv[1] == 'Scheduler':
+        bench_Scheduler()
+    elif sys.argv[1] == 'Stop':
+        bench_Stop()
+    elif sys.argv[1] == 'Startup':
+        bench_Startup()
+    elif sys.argv[1] == 'ADC':
+        bench_ADC()
+    elif sys.argv[1] == 'Battery':
+        bench_Battery()
+    elif sys.argv[1] == 'Ranging':
+        bench_Ranging()
+    elif sys.argv[1] == 'Map':
+        bench_Map()
+    elif sys.argv[1] == 'Line':
+        bench_Line()
+    elif sys.argv[1] == 'Follow':
+        bench_Follow()
+    elif sys.argv[1] == 'Light':
+        bench_Light()
+    elif sys.argv[1] == 'Control':
+        bench_Control()
+    elif sys.argv[1] == 'Rotate':
+        bench_Rotate()
+    elif sys.argv[1] == 'Ramp':
+        bench_Ramp()
+    elif sys.argv[1] == 'Kinematics':
+        bench_Kinematics()
+    elif sys.argv[1] == 'Servo':
+        bench_Servo()
+    elif sys.argv[1] == 'Led':
+        bench_Led()
+    elif sys.argv[1] == 'Animation':
+        bench_Animation()
+    elif sys.argv[1] == 'Pixels':
+        bench_Pixels()
+    elif sys.argv[1] == 'Avoidance':
+        bench_Avoidance()
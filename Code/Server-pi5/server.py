@@ -1,15 +1,17 @@
 #!/usr/bin/python 
 # -*- coding: utf-8 -*-
 import io
+import os
 import math
 import socket
 import  numpy as np
 import struct
 import time
-from picamera2 import Picamera2,Preview
-from picamera2.encoders import JpegEncoder
-from picamera2.outputs import FileOutput
-from picamera2.encoders import Quality
+from Hardware import Picamera2,Preview
+from Hardware import JpegEncoder
+from Hardware import FileOutput
+from Hardware import Quality
+from Hardware import BACKEND
 from threading import Condition
 import fcntl
 import  sys
@@ -23,9 +25,12 @@ from Thread import *
 from Light import *
 from Ultrasonic import *
 from Line_Tracking import *
+from Ramp import MotorRamp
 from threading import Timer
 from threading import Thread
 from Command import COMMAND as cmd
+from I2CBus import get_bus
+import Devices
 
 class StreamingOutput(io.BufferedIOBase):
     def __init__(self):
@@ -38,25 +43,40 @@ class StreamingOutput(io.BufferedIOBase):
             self.condition.notify_all()
 
 class Server:
+    CONTROL_PRIORITY=10     #SCHED_FIFO priority of the control loops' thread
     def __init__(self):
-        self.PWM=Motor()
-        self.servo=Servo()
-        self.led=Led()
-        self.ultrasonic=Ultrasonic()
-        self.buzzer=Buzzer()
-        self.adc=Adc()
-        self.light=Light()
-        self.infrared=Line_Tracking()
+        self.bus=get_bus()
+        self.bus.start_scheduler()    #motor frames go out before servo frames and ADC reads
+        self.control=Devices.scheduler()
+        self.control.start(priority=self.CONTROL_PRIORITY,cpus=self.control_cpus())
+        self.PWM=Devices.motor()
+        self.ramp=MotorRamp(self.PWM)    #joystick commands reach the wheels through this
+        self.servo=Devices.servo()
+        self.led=Devices.led()
+        self.ultrasonic=Devices.ultrasonic()
+        self.ultrasonic.start_ranging()    #sendUltrasonic and the modes read its latest distance
+        self.buzzer=Devices.buzzer()
+        self.adc=Devices.adc()
+        self.adc.start_sampler()    #light and battery readings come from its cache, not the bus
+        self.battery=Devices.battery()
+        self.light=Devices.light()
+        self.infrared=Devices.infrared()
         self.tcp_Flag = True
         self.sonic=False
         self.Light=False
         self.Light=False
         self.Line=False
+        self.Map=False
         self.Mode = 'one'
         self.endChar='\n'
         self.intervalChar='#'
         self.rotation_flag = False
+    def control_cpus(self):     #the last core for the control loops, the rest for the camera's encoder
+        count=os.cpu_count() or 1
+        return {count-1} if count>1 else None
     def get_interface_ip(self):
+        if BACKEND=='sim':
+            return '127.0.0.1'
         s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         return socket.inet_ntoa(fcntl.ioctl(s.fileno(),
                                             0x8915,
@@ -98,6 +118,8 @@ class Server:
             pass
         self.server_socket.close()
         print ("socket video connected ... ")
+        if self.control.pinned:   #the encoder threads started from here inherit this
+            os.sched_setaffinity(0,set(range(os.cpu_count()))-self.control.cpus)
         camera = Picamera2()
         camera.configure(camera.create_video_configuration(main={"size": (400, 300)}))
         output = StreamingOutput()
@@ -119,22 +141,33 @@ class Server:
                 print ("End transmit ... " )
                 break
 
+    def brake(self):
+        self.ramp.halt()
+        self.PWM.stop_rotate()
+        self.rotation_flag=False
+        self.PWM.stop()
     def stopMode(self):
+        self.ramp.halt()
+        self.PWM.stop_rotate()     #or the rotate task writes over the brake below
+        self.rotation_flag=False
+        self.PWM.stop()    #one transaction, before the mode threads are torn down
         try:
-            stop_thread(self.infraredRun)
-            self.PWM.setMotorModel(0,0,0,0)
+            self.infrared.stop()    #wakes it, no need to kill the thread
+            self.infraredRun.join()
+            self.PWM.stop()
         except:
             pass
         try:
-            stop_thread(self.lightRun)
-            self.PWM.setMotorModel(0,0,0,0)
+            self.light.stop()
+            self.lightRun.join()
+            self.PWM.stop()
         except:
             pass
         try:
-            stop_thread(self.ultrasonicRun)
-            self.PWM.setMotorModel(0,0,0,0)
-            self.servo.setServoPwm('0',90)
-            self.servo.setServoPwm('1',90)
+            self.ultrasonic.stop()
+            self.ultrasonicRun.join()
+            self.PWM.stop()
+            self.servo.setServoFrame({'0':90,'1':90})
         except:
             pass
         self.sonic=False
@@ -156,6 +189,7 @@ class Server:
                 try:
                     AllData=restCmd+self.connection1.recv(1024).decode('utf-8')
                 except:
+                    self.brake()    #lost the client, don't leave the car driving
                     if self.tcp_Flag:
                         self.Reset()
                     break
@@ -163,6 +197,7 @@ class Server:
                 if len(AllData) < 5:
                     restCmd=AllData
                     if restCmd=='' and self.tcp_Flag:
+                        self.brake()
                         self.Reset()
                         break
                 restCmd=""
@@ -185,6 +220,7 @@ class Server:
                         elif data[1]=='two' or data[1]=="1":
                             self.stopMode()
                             self.Mode='two'
+                            self.light.reset()
                             self.lightRun=Thread(target=self.light.run)
                             self.lightRun.start()
                             self.Light = True
@@ -193,6 +229,7 @@ class Server:
                         elif data[1]=='three' or data[1]=="3":
                             self.stopMode()
                             self.Mode='three'
+                            self.ultrasonic.reset()
                             self.ultrasonicRun=threading.Thread(target=self.ultrasonic.run)
                             self.ultrasonicRun.start()
                             self.sonic=True
@@ -201,12 +238,18 @@ class Server:
                         elif data[1]=='four' or data[1]=="2":
                             self.stopMode()
                             self.Mode='four'
-                            self.infraredRun=threading.Thread(target=self.infrared.run)
+                            self.infrared.reset()
+                            self.infraredRun=threading.Thread(target=self.infrared.follow)    #PID follower, run() is the old table
                             self.infraredRun.start()
                             self.Line=True
                             self.lineTimer = threading.Timer(0.4,self.sendLine)
                             self.lineTimer.start()
 
+                    elif cmd.CMD_BRAKE in data:
+                        self.brake()
+                        if self.Mode!='one':
+                            self.stopMode()
+                            self.Mode='one'
                     elif (cmd.CMD_MOTOR in data) and self.Mode=='one':
                         try:
                             data1=int(data[1])
@@ -215,7 +258,7 @@ class Server:
                             data4=int(data[4])
                             if data1==None or data2==None or data2==None or data3==None:
                                 continue
-                            self.PWM.setMotorModel(data1,data2,data3,data4)
+                            self.ramp.drive(data1,data2,data3,data4)
                         except:
                             pass
                     elif (cmd.CMD_M_MOTOR in data) and self.Mode=='one':
@@ -225,20 +268,10 @@ class Server:
                             data3=int(data[3])
                             data4=int(data[4])
 
-                            LX = -int((data2 * math.sin(math.radians(data1))))
-                            LY = int(data2 * math.cos(math.radians(data1)))
-                            RX = int(data4 * math.sin(math.radians(data3)))
-                            RY = int(data4 * math.cos(math.radians(data3)))
-
-                            FR = LY - LX + RX
-                            FL = LY + LX - RX
-                            BL = LY - LX - RX
-                            BR = LY + LX + RX
-
-
+                            FL,BL,FR,BR=self.PWM.kinematics.joystick(data1,data2,data3,data4)
                             if data1==None or data2==None or data2==None or data3==None:
                                 continue
-                            self.PWM.setMotorModel(FL,BL,FR,BR)
+                            self.ramp.drive(FL,BL,FR,BR)
                         except:
                             pass
                     elif (cmd.CMD_CAR_ROTATE in data) and self.Mode == 'one':
@@ -250,43 +283,27 @@ class Server:
                             data4 = int(data[4])
                             set_angle = data3
                             if data4 == 0:
-                                try:
-                                    stop_thread(Rotate_Mode)
-                                    self.rotation_flag = False
-                                except:
-                                    pass
-                                LX = -int((data2 * math.sin(math.radians(data1))))
-                                LY = int(data2 * math.cos(math.radians(data1)))
-                                RX = int(data4 * math.sin(math.radians(data3)))
-                                RY = int(data4 * math.cos(math.radians(data3)))
-
-                                FR = LY - LX + RX
-                                FL = LY + LX - RX
-                                BL = LY - LX - RX
-                                BR = LY + LX + RX
-
-
+                                self.PWM.stop_rotate()
+                                self.rotation_flag = False
+                                FL, BL, FR, BR = self.PWM.kinematics.joystick(data1, data2, data3, data4)
                                 if data1 == None or data2 == None or data2 == None or data3 == None:
                                     continue
-                                self.PWM.setMotorModel(FL, BL, FR, BR)
-                            elif self.rotation_flag == False:
+                                self.ramp.drive(FL, BL, FR, BR)
+                            else:
                                 self.angle = data[3]
-                                try:
-                                    stop_thread(Rotate_Mode)
-                                except:
-                                    pass
                                 self.rotation_flag = True
-                                Rotate_Mode = Thread(target=self.PWM.Rotate, args=(data3,))
-                                Rotate_Mode.start()
+                                self.ramp.halt()
+                                self.PWM.start_rotate(data3)    #while rotating, this just steers it
                         except:
                             pass
                     elif cmd.CMD_SERVO in data:
                         try:
                             data1 = data[1]
                             data2 = int(data[2])
+                            speed=int(data[3]) if len(data)>3 else None    #optional, degrees per second
                             if data1 == None or data2 == None:
                                 continue
-                            self.servo.setServoPwm(data1,data2)
+                            self.servo.move(data1,data2,speed)
                         except:
                             pass
 
@@ -298,7 +315,7 @@ class Server:
                             data4=int(data[4])
                             if data1==None or data2==None or data3==None or data4==None:
                                 continue
-                            if led.Ledsupported == 1 :
+                            if self.led.Ledsupported == 1 :
                                 self.led.ledIndex(data1,data2,data3,data4)
                             else:
                                 pass
@@ -306,29 +323,8 @@ class Server:
                             pass
                     elif cmd.CMD_LED_MOD in data:
                         self.LedMoD=data[1]
-                        if led.Ledsupported == 1 :
-                            if self.LedMoD== '0':
-                                try:
-                                    stop_thread(Led_Mode)
-                                except:
-                                    pass
-                            if self.LedMoD == '1':
-                                try:
-                                    stop_thread(Led_Mode)
-                                except:
-                                    pass
-                            
-                                self.led.ledMode(self.LedMoD)
-                                time.sleep(0.1)
-                                self.led.ledMode(self.LedMoD)
-                            else :
-                                try:
-                                    stop_thread(Led_Mode)
-                                except:
-                                    pass
-                                time.sleep(0.1)
-                                Led_Mode=Thread(target=self.led.ledMode,args=(data[1],))
-                                Led_Mode.start()
+                        if self.led.Ledsupported == 1 :
+                            self.led.ledMode(self.LedMoD)    #the render thread switches to it, '0' and '1' clear
                     elif cmd.CMD_SONIC in data:
                         if data[1]=='1':
                             self.sonic=True
@@ -336,6 +332,13 @@ class Server:
                             self.ultrasonicTimer.start()
                         else:
                             self.sonic=False
+                    elif cmd.CMD_MAP in data:
+                        if data[1]=='1':
+                            self.Map=True
+                            self.mapTimer = threading.Timer(0.5,self.sendMap)
+                            self.mapTimer.start()
+                        else:
+                            self.Map=False
                     elif cmd.CMD_BUZZER in data:
                         try:
                             self.buzzer.run(data[1])
@@ -349,9 +352,8 @@ class Server:
                         else:
                             self.Light=False
                     elif cmd.CMD_POWER in data:
-                        ADC_Power=self.adc.recvADC(2)*3
                         try:
-                            self.send(cmd.CMD_POWER+'#'+str(round(ADC_Power, 2))+'\n')
+                            self.send(self.powerMessage())
                         except:
                             pass
         except Exception as e:
@@ -367,6 +369,15 @@ class Server:
                 self.sonic=False
             self.ultrasonicTimer = threading.Timer(0.23,self.sendUltrasonic)
             self.ultrasonicTimer.start()
+    def sendMap(self):
+        if self.Map==True:
+            occupancy=self.ultrasonic.map
+            try:
+                self.send(cmd.CMD_MAP+'#'+str(occupancy.bearing_step)+'#'+str(occupancy.range_step)+'#'+occupancy.encode()+'\n')
+            except:
+                self.Map=False
+            self.mapTimer = threading.Timer(0.5,self.sendMap)
+            self.mapTimer.start()
     def sendLight(self):
         if self.Light==True:
             ADC_Light1=self.adc.recvADC(0)
@@ -379,20 +390,23 @@ class Server:
             self.lightTimer.start()
     def sendLine(self):
         if self.Line==True:
-            Line1= IR01_sensor.value
-            Line2= IR02_sensor.value
-            Line3= IR03_sensor.value
+            Line1= self.infrared.IR01_sensor.value
+            Line2= self.infrared.IR02_sensor.value
+            Line3= self.infrared.IR03_sensor.value
             try:
                 self.send("CMD_MODE#2"+'#'+str(Line1)+str(Line2)+str(Line3)+'\n')
             except:
                 self.Line=False
             self.LineTimer = threading.Timer(0.20,self.sendLine)
             self.LineTimer.start()
+    def powerMessage(self):
+        #pack voltage with the motors' sag added back, state of charge in %, minutes left
+        return cmd.CMD_POWER+'#'+str(round(self.battery.ocv(), 2))+'#'+str(int(round(self.battery.percent())))+'#'+str(int(self.battery.time_remaining()/60))+'\n'
     def Power(self):
         while True:
-            ADC_Power=self.adc.recvADC(2)*3
+            ADC_Power=self.battery.ocv()    #alarm on charge, not on sag while driving
             try:
-                self.send(cmd.CMD_POWER+'#'+str(round(ADC_Power, 2))+'\n')
+                self.send(self.powerMessage())
             except:
                 pass
             time.sleep(3)
@@ -1,29 +1,107 @@
 import time
+import threading
 from PCA9685 import PCA9685
+import Devices
+
+def pulse(angle,error=10,reverse=False):
+    """PCA9685 (on, off) at 50 Hz for angle, on a servo off by error degrees."""
+    if reverse:
+        width=2500-int((angle+error)/0.09)
+    else:
+        width=500+int((angle+error)/0.09)
+    return (0,int(width*4096/20000))    #PWM frequency is 50HZ,the period is 20000us
+def pulse_table(error=10,reverse=False):
+    """pulse() for every whole degree 0-180."""
+    return [pulse(angle,error,reverse) for angle in range(181)]
 class Servo:
+    """The servo outputs '0'-'7', on PCA9685 channels 8-15, driven from per-channel pulse tables.
+
+    setServoPwm() and setServoFrame() put servos at an angle now. move() sets
+    a target to reach at no more than speed degrees per second instead: a
+    step on the control scheduler moves every travelling servo at RATE and
+    writes them all in one frame, so pan and tilt share a block write, and
+    commands that arrive between steps only move the target.
+    """
+    CHANNELS={'0':8,'1':9,'2':10,'3':11,'4':12,'5':13,'6':14,'7':15}
+    ERRORS={'0':10,'1':10,'2':10,'3':10,'4':10,'5':10,'6':10,'7':10}    #calibration, degrees
+    REVERSED=('0',)     #the pan servo turns the other way
+    RATE=50             #Hz
+    SPEED=300           #degrees per second move() allows by default, a little under the servos' own
     def __init__(self):
         self.PwmServo = PCA9685(0x40, debug=True)
         self.PwmServo.setPWMFreq(50)
         self.PwmServo.setServoPulse(8,1500)
         self.PwmServo.setServoPulse(9,1500)
-    def setServoPwm(self,channel,angle,error=10):
-        angle=int(angle)
-        if channel=='0':
-            self.PwmServo.setServoPulse(8,2500-int((angle+error)/0.09))
-        elif channel=='1':
-            self.PwmServo.setServoPulse(9,500+int((angle+error)/0.09))
-        elif channel=='2':
-            self.PwmServo.setServoPulse(10,500+int((angle+error)/0.09))
-        elif channel=='3':
-            self.PwmServo.setServoPulse(11,500+int((angle+error)/0.09))
-        elif channel=='4':
-            self.PwmServo.setServoPulse(12,500+int((angle+error)/0.09))
-        elif channel=='5':
-            self.PwmServo.setServoPulse(13,500+int((angle+error)/0.09))
-        elif channel=='6':
-            self.PwmServo.setServoPulse(14,500+int((angle+error)/0.09))
-        elif channel=='7':
-            self.PwmServo.setServoPulse(15,500+int((angle+error)/0.09))
+        self.errors=dict(self.ERRORS)
+        self.tables=dict((channel,pulse_table(self.errors[channel],channel in self.REVERSED)) for channel in self.CHANNELS)
+        self.lock=threading.Lock()
+        self.positions={}   #channel -> (angle, monotonic time it should have settled by)
+        self.angles={}      #channel -> where move() has it now, in fractional degrees
+        self.targets={}     #channel -> (angle, degrees per second) for the servos still travelling
+        self.task=None
+        self.frames=0
+    def position(self,channel):
+        return self.positions.get(channel)
+    def setServoPwm(self,channel,angle,error=None):
+        """Put a servo at angle now. error, if given, replaces its calibration for this call only."""
+        self.setServoFrame({channel:int(angle)},error)
+    def setServoFrame(self,angles,error=None):
+        """Put several servos at their angles now, in one frame. angles maps channel -> degrees."""
+        with self.lock:
+            for channel in angles:
+                self.targets.pop(channel,None)
+                self.angles.pop(channel,None)
+            self.write(angles,error)
+    def move(self,channel,angle,speed=None):
+        """Send a servo towards angle at up to speed degrees per second, on the control scheduler."""
+        angle=max(0,min(180,int(angle)))
+        with self.lock:
+            if channel not in self.angles:
+                if channel not in self.positions:
+                    self.write({channel:angle})     #nowhere known to start from
+                    return
+                self.angles[channel]=float(self.positions[channel][0])
+            self.targets[channel]=(angle,speed or self.SPEED)
+            if self.task is None or not self.task.active:
+                self.task=Devices.scheduler().add('servo',self.RATE,self.step)
+    def stop(self):
+        """Hold every servo where it has got to."""
+        with self.lock:
+            task,self.task=self.task,None
+            self.targets.clear()
+        if task is not None:
+            Devices.scheduler().remove(task)
+    def write(self,angles,error=None):
+        now=time.monotonic()
+        frame={}
+        for channel,angle in angles.items():
+            angle=max(0,min(180,int(round(angle))))
+            previous=self.positions.get(channel)
+            travel=abs(angle-previous[0]) if previous is not None else 180
+            self.positions[channel]=(angle,now+0.05+0.002*travel)    #~0.12 s per 60 degrees
+            if error is None or error==self.errors[channel]:
+                frame[self.CHANNELS[channel]]=self.tables[channel][angle]
+            else:
+                frame[self.CHANNELS[channel]]=pulse(angle,error,channel in self.REVERSED)
+        self.frames+=1
+        self.PwmServo.setPWMFrame(frame)
+    def step(self):
+        with self.lock:
+            moved={}
+            for channel,(target,speed) in list(self.targets.items()):
+                limit=speed/float(self.RATE)
+                angle=self.angles[channel]
+                angle+=max(-limit,min(limit,target-angle))
+                self.angles[channel]=angle
+                if angle==target:
+                    del self.targets[channel]
+                if int(round(angle))!=self.positions[channel][0]:
+                    moved[channel]=angle
+            if moved:
+                self.write(moved)
+            if not self.targets:
+                self.task=None
+                return False
 
 # Main program logic follows:
 if __name__ == '__main__':
@@ -1,7 +1,8 @@
 import time
+import Devices
 from Led import *
-led=Led()
 def test_Led():
+    led=Devices.led()
     if(led.Ledsupported == 1):
         try:
             led.ledIndex(0x01,255,0,0)      #Red
@@ -28,8 +29,8 @@ def test_Led():
         
         
 from Motor import *            
-PWM=Motor()          
 def test_Motor(): 
+    PWM=Devices.motor()
     try:
         PWM.setMotorModel(1000,1000,1000,1000)         #Forward
         print ("The car is moving forward")
@@ -71,17 +72,19 @@ def test_Motor():
 
 
 from Ultrasonic import *
-ultrasonic=Ultrasonic()                
 def test_Ultrasonic():
+    ultrasonic=Devices.ultrasonic()
+    ultrasonic.start_ranging()
     try:
         while True:
-            data=ultrasonic.get_distance()   #Get the value
-            print ("Obstacle distance is "+str(data)+"CM")
+            data,age=ultrasonic.get_distance(age=True)   #Get the value
+            print ("Obstacle distance is "+str(data)+"CM, measured "+str(int(age*1000))+"ms ago")
             time.sleep(1)
     except KeyboardInterrupt:
         print ("\nEnd of program")
 
 def car_Rotate():
+    PWM=Devices.motor()
     try:
         while True:
           PWM.Rotate(0)
@@ -89,8 +92,8 @@ def car_Rotate():
         print ("\nEnd of program")
 
 from Line_Tracking import *
-line=Line_Tracking()
 def test_Infrared():
+    line=Devices.infrared()
     try:
         line.test_Infrared()
     except KeyboardInterrupt:
@@ -98,8 +101,8 @@ def test_Infrared():
 
 
 from servo import *
-pwm=Servo()
 def test_Servo():
+    pwm=Devices.servo()
     try:
         while True:
             for i in range(50,110,1):
@@ -121,8 +124,8 @@ def test_Servo():
         
         
 from ADC import *
-adc=Adc()
 def test_Adc():
+    adc=Devices.adc()
     try:
         while True:
             Left_IDR=adc.recvADC(0)
@@ -137,8 +140,8 @@ def test_Adc():
         print ("\nEnd of program")
 
 from Buzzer import *
-buzzer=Buzzer()
 def test_Buzzer():
+    buzzer=Devices.buzzer()
     try:
         buzzer.run('1')
         time.sleep(1)
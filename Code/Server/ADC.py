@@ -1,9 +1,11 @@
-import smbus
 import time
+import threading
+from collections import deque
+from I2CBus import get_bus, ADC
 class Adc:
     def __init__(self):
-        # Get I2C bus
-        self.bus = smbus.SMBus(1)
+        # Get the shared I2C bus
+        self.bus = get_bus(1)
         
         # I2C address of the device
         self.ADDRESS            = 0x48
@@ -20,10 +22,17 @@ class Adc:
                 self.Index="PCF8591"
             else:
                 self.Index="ADS7830" 
+        
+        # Background sampler, see start_sampler()
+        self.sampler=None
+        self.sampler_lock=threading.Lock()
     def analogReadPCF8591(self,chn):#PCF8591 read ADC value,chn:0,1,2,3
+        return self.bus.submit(ADC,('pcf8591',self.ADDRESS,chn),self.samplePCF8591,chn).wait()
+    def samplePCF8591(self,chn):
         value=[0,0,0,0,0,0,0,0,0]
-        for i in range(9):
-            value[i] = self.bus.read_byte_data(self.ADDRESS,self.PCF8591_CMD+chn)
+        with self.bus.transaction():    #each read returns the previous conversion, keep the channel ours
+            for i in range(9):
+                value[i] = self.bus.read_byte_data(self.ADDRESS,self.PCF8591_CMD+chn)
         value=sorted(value)
         return value[4]   
         
@@ -39,27 +48,140 @@ class Adc:
         voltage = value1 / 256.0 * 3.3  #calculate the voltage value
         voltage = round(voltage,2)
         return voltage
-    def recvADS7830(self,channel):
-        """Select the Command data from the given provided value above"""
+    def sampleADS7830(self,channel):
+        """Select the Command data from the given provided value above, then read it twice"""
         COMMAND_SET = self.ADS7830_CMD | ((((channel<<2)|(channel>>1))&0x07)<<4)
-        self.bus.write_byte(self.ADDRESS,COMMAND_SET)
+        with self.bus.transaction():    #keep other threads from re-selecting the channel in between
+            self.bus.write_byte(self.ADDRESS,COMMAND_SET)
+            return self.bus.read_byte(self.ADDRESS),self.bus.read_byte(self.ADDRESS)
+    def recvADS7830(self,channel):
+        #One attempt per bus request, so motor frames can go out between retries
         while(1):
-            value1 = self.bus.read_byte(self.ADDRESS)
-            value2 = self.bus.read_byte(self.ADDRESS)
+            value1,value2 = self.bus.submit(ADC,('ads7830',self.ADDRESS,channel),self.sampleADS7830,channel).wait()
             if value1==value2:
                 break;
         voltage = value1 / 255.0 * 3.3  #calculate the voltage value
         voltage = round(voltage,2)
         return voltage
         
-    def recvADC(self,channel):
+    def readRaw(self,channel):
+        """One conversion of channel as a raw code, no retries"""
+        if self.Index=="PCF8591":
+            with self.bus.transaction():    #the first read returns the previous conversion
+                self.bus.read_byte_data(self.ADDRESS,self.PCF8591_CMD+channel)
+                return self.bus.read_byte_data(self.ADDRESS,self.PCF8591_CMD+channel)
+        return self.sampleADS7830(channel)[1]
+    def codeToVoltage(self,code):
         if self.Index=="PCF8591":
-            data=self.recvPCF8591(channel)
-        elif self.Index=="ADS7830":
-            data=self.recvADS7830(channel)
-        return data
+            return code / 256.0 * 3.3
+        return code / 255.0 * 3.3
+    
+    def start_sampler(self,rate=20,channels=(0,1,2),window=5,alpha=0.5):
+        """Sample channels rate times a second on a background thread, recvADC then reads the cache"""
+        with self.sampler_lock:
+            if self.sampler is None:
+                self.sampler=AdcSampler(self,rate,channels,window,alpha)
+                self.sampler.start()
+            return self.sampler
+    def stop_sampler(self):
+        with self.sampler_lock:
+            sampler,self.sampler=self.sampler,None
+        if sampler is not None:
+            sampler.stop()
+    def wait_sample(self,timeout=None):
+        """Block until the sampler finishes its next pass over the channels"""
+        sampler=self.sampler
+        if sampler is None:
+            return False
+        return sampler.wait(timeout)
+        
+    def recvADC(self,channel,age=False):
+        """Voltage on channel, with age=True as (voltage, seconds since it was sampled).
+        
+        Comes from the sampler's cache when it covers the channel, otherwise from the bus now.
+        """
+        sampler=self.sampler
+        reading=sampler.read(channel) if sampler is not None else None
+        if reading is None:
+            if self.Index=="PCF8591":
+                data=self.recvPCF8591(channel)
+            elif self.Index=="ADS7830":
+                data=self.recvADS7830(channel)
+            return (data,0.0) if age else data
+        voltage,stamp=reading
+        data=round(voltage,2)
+        return (data,time.monotonic()-stamp) if age else data
     def i2cClose(self):
-        self.bus.close()
+        self.stop_sampler()    #the bus is shared with the other devices, it stays open
+
+class AdcSampler:
+    """Thread that cycles the ADC channels into per-channel ring buffers.
+    
+    Each reading is the median of the last window raw codes smoothed by an EMA,
+    stored with the time it was taken. Readers get it without touching the bus.
+    """
+    def __init__(self,adc,rate,channels,window,alpha):
+        self.adc=adc
+        self.period=1.0/rate
+        self.channels=tuple(channels)
+        self.alpha=alpha
+        self.rings=dict((channel,deque(maxlen=window)) for channel in self.channels)
+        self.filtered={}    #channel -> EMA of the median code
+        self.readings={}    #channel -> (voltage, monotonic time), replaced whole so reads need no lock
+        self.cond=threading.Condition()
+        self.stopped=threading.Event()
+        self.cycles=0
+        self.errors=0
+        self.overruns=0
+        self.thread=None
+    def start(self):
+        self.stopped.clear()
+        self.thread=threading.Thread(target=self.run,name="adc",daemon=True)
+        self.thread.start()
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+        with self.cond:
+            self.cond.notify_all()
+    def read(self,channel):
+        return self.readings.get(channel)
+    def wait(self,timeout=None):
+        with self.cond:
+            cycles=self.cycles
+            return self.cond.wait_for(lambda:self.cycles!=cycles or self.stopped.is_set(),timeout)
+    def sample(self,channel):
+        #One request per channel, so motor frames can go out between them. The key differs from
+        #recvADC's, whose queued request would otherwise take this one's function and result
+        code=self.adc.bus.submit(ADC,('sample',self.adc.ADDRESS,channel),self.adc.readRaw,channel).wait()
+        ring=self.rings[channel]
+        ring.append(code)
+        median=sorted(ring)[len(ring)//2]
+        previous=self.filtered.get(channel)
+        value=median if previous is None else previous+self.alpha*(median-previous)
+        self.filtered[channel]=value
+        self.readings[channel]=(self.adc.codeToVoltage(value),time.monotonic())
+    def run(self):
+        deadline=time.monotonic()
+        while not self.stopped.is_set():
+            for channel in self.channels:
+                try:
+                    self.sample(channel)
+                except OSError:
+                    self.errors+=1
+                except Exception as e:     #keep sampling, the readers only have this thread
+                    print("ADC sampler channel %d: %r"%(channel,e))
+                    self.errors+=1
+            with self.cond:
+                self.cycles+=1
+                self.cond.notify_all()
+            deadline+=self.period
+            delay=deadline-time.monotonic()
+            if delay>0:
+                self.stopped.wait(delay)
+            else:
+                self.overruns+=1    #fell behind, don't try to catch up
+                deadline=time.monotonic()
 
 def loop():
     adc=Adc()
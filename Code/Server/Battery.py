@@ -0,0 +1,89 @@
+import math
+import threading
+import time
+
+# Resting cell voltage -> state of charge in %, for the car's two 18650 cells in series
+OCV_CURVE = [(3.00, 0), (3.45, 5), (3.60, 15), (3.70, 30), (3.78, 45),
+             (3.85, 60), (3.95, 75), (4.05, 88), (4.20, 100)]
+
+
+def soc_from_cell_voltage(volts):
+    """Interpolate OCV_CURVE, clamped to 0-100."""
+    if volts <= OCV_CURVE[0][0]:
+        return 0.0
+    for (v0, s0), (v1, s1) in zip(OCV_CURVE, OCV_CURVE[1:]):
+        if volts <= v1:
+            return s0 + (s1 - s0) * (volts - v0) / (v1 - v0)
+    return 100.0
+
+
+class Battery:
+    """Load-compensated state of charge of the 2S pack.
+
+    The pack voltage on ADC channel 2 sags while the wheels draw current. The
+    model adds back the current the commanded duties draw through the pack's
+    internal resistance before looking the voltage up in the discharge curve,
+    then smooths the result over tau seconds. It advances only when the ADC
+    sampler has a new reading, so every query reads cached values and is cheap
+    enough for a control loop.
+    """
+    CELLS = 2
+    DIVIDER = 3     # the board feeds a third of the pack voltage to the ADC
+
+    def __init__(self, adc, motor, capacity=2.0, resistance=0.25, motor_current=1.2,
+                 idle_current=0.25, tau=20.0):
+        self.adc = adc
+        self.motor = motor
+        self.capacity = capacity                # amp hours
+        self.resistance = resistance            # ohm, cells plus wiring
+        self.motor_current = motor_current      # amps per wheel at full duty
+        self.idle_current = idle_current        # amps for the Pi and everything else
+        self.tau = tau
+        self.lock = threading.Lock()
+        self.stamp = None           # when the ADC reading last folded in was taken
+        self.loaded = None          # that reading, as pack volts
+        self.current = idle_current
+        self.open_circuit = None
+        self.soc = None
+        self.adc.start_sampler()
+
+    def update(self):
+        """Fold in the sampler's latest reading if it is new."""
+        voltage, age = self.adc.recvADC(2, age=True)
+        stamp = time.monotonic() - age
+        with self.lock:
+            if self.stamp is not None and stamp - self.stamp < 0.001:
+                return
+            current = self.idle_current + self.motor.wheel_load() * self.motor_current
+            loaded = voltage * self.DIVIDER
+            open_circuit = loaded + current * self.resistance
+            soc = soc_from_cell_voltage(open_circuit / self.CELLS)
+            if self.stamp is None:
+                self.current, self.open_circuit, self.soc = current, open_circuit, soc
+            else:
+                alpha = 1.0 - math.exp(-(stamp - self.stamp) / self.tau)
+                self.current += alpha * (current - self.current)
+                self.open_circuit += alpha * (open_circuit - self.open_circuit)
+                self.soc += alpha * (soc - self.soc)
+            self.stamp = stamp
+            self.loaded = loaded
+
+    def voltage(self):
+        """Pack voltage as last measured, under whatever load there was."""
+        self.update()
+        return self.loaded
+
+    def ocv(self):
+        """Smoothed pack voltage with the load's sag added back."""
+        self.update()
+        return self.open_circuit
+
+    def percent(self):
+        """Smoothed state of charge, 0-100."""
+        self.update()
+        return self.soc
+
+    def time_remaining(self):
+        """Seconds until empty at the smoothed current draw."""
+        self.update()
+        return self.soc / 100.0 * self.capacity * 3600.0 / self.current
@@ -1,11 +1,12 @@
 import time
-import RPi.GPIO as GPIO
+from Hardware import GPIO
 from Command import COMMAND as cmd
-GPIO.setwarnings(False)
 Buzzer_Pin = 17
-GPIO.setmode(GPIO.BCM)
-GPIO.setup(Buzzer_Pin,GPIO.OUT)
 class Buzzer:
+    def __init__(self):
+        GPIO.setwarnings(False)
+        GPIO.setmode(GPIO.BCM)
+        GPIO.setup(Buzzer_Pin,GPIO.OUT)
     def run(self,command):
         if command!="0":
             GPIO.output(Buzzer_Pin,True)
@@ -0,0 +1,75 @@
+import threading
+
+# ============================================================================
+# Shared device handles. Nothing touches the hardware at import time; each
+# device is built on first use and every caller gets the same instance:
+#     import Devices
+#     Devices.motor().setMotorModel(0, 0, 0, 0)
+# ============================================================================
+
+_devices = {}
+_lock = threading.RLock()    # re-entrant: building a Motor builds the Adc it uses
+
+
+def _shared(name, factory):
+    with _lock:
+        device = _devices.get(name)
+        if device is None:
+            device = _devices[name] = factory()
+        return device
+
+
+def motor():
+    from Motor import Motor
+    return _shared('motor', Motor)
+
+
+def servo():
+    from servo import Servo
+    return _shared('servo', Servo)
+
+
+def adc():
+    from ADC import Adc
+    return _shared('adc', Adc)
+
+
+def led():
+    from Led import Led
+    return _shared('led', Led)
+
+
+def battery():
+    from Battery import Battery
+    return _shared('battery', lambda: Battery(adc(), motor()))
+
+
+def buzzer():
+    from Buzzer import Buzzer
+    return _shared('buzzer', Buzzer)
+
+
+def ultrasonic():
+    from Ultrasonic import Ultrasonic
+    return _shared('ultrasonic', Ultrasonic)
+
+
+def infrared():
+    from Line_Tracking import Line_Tracking
+    return _shared('infrared', Line_Tracking)
+
+
+def light():
+    from Light import Light
+    return _shared('light', Light)
+
+
+def scheduler():
+    from Scheduler import Scheduler
+    return _shared('scheduler', Scheduler)
+
+
+def created():
+    """Return the names of the devices built so far."""
+    with _lock:
+        return list(_devices)
@@ -0,0 +1,66 @@
+import os
+import sys
+import importlib
+
+# ============================================================================
+# Hardware backend selection. Modules take their device libraries from here:
+#     from Hardware import GPIO, SMBus
+# CAR_BACKEND=sim swaps in the models from Simulator.py so the server runs on
+# any Linux box; otherwise the real library is imported on first use, so a
+# module only needs the libraries it actually touches. The LED strip is the
+# bundled rpi_ws281x package either way, over SimWs281x in place of the
+# native _rpi_ws281x under sim.
+# ============================================================================
+
+WS281X_LIBRARY = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              '..', 'Libs', 'rpi-ws281x-python', 'library')
+
+BACKEND = os.environ.get('CAR_BACKEND', 'hw')
+
+# name -> (module, attribute or None for the module itself)
+_HARDWARE = {
+    'SMBus': ('smbus', 'SMBus'),
+    'GPIO': ('RPi.GPIO', None),
+    'DistanceSensor': ('gpiozero', 'DistanceSensor'),
+    'LineSensor': ('gpiozero', 'LineSensor'),
+    'Buzzer': ('gpiozero', 'Buzzer'),
+    'Adafruit_NeoPixel': ('rpi_ws281x', 'Adafruit_NeoPixel'),
+    'PixelStrip': ('rpi_ws281x', 'PixelStrip'),
+    'Color': ('rpi_ws281x', 'Color'),
+    'Picamera2': ('picamera2', 'Picamera2'),
+    'Preview': ('picamera2', 'Preview'),
+    'JpegEncoder': ('picamera2.encoders', 'JpegEncoder'),
+    'Quality': ('picamera2.encoders', 'Quality'),
+    'FileOutput': ('picamera2.outputs', 'FileOutput'),
+}
+
+if BACKEND == 'sim':
+    import Simulator
+    import SimWs281x
+    world = Simulator.get_world()
+    SMBus = Simulator.SimBus
+    GPIO = world.gpio
+    DistanceSensor = Simulator.SimDistanceSensor
+    LineSensor = Simulator.SimLineSensor
+    Buzzer = Simulator.SimBuzzer
+    sys.modules['_rpi_ws281x'] = SimWs281x
+    if os.path.isdir(WS281X_LIBRARY):
+        sys.path.insert(0, WS281X_LIBRARY)
+    from rpi_ws281x import Adafruit_NeoPixel, PixelStrip, Color
+    Picamera2 = Simulator.Picamera2
+    Preview = Simulator.Preview
+    JpegEncoder = Simulator.JpegEncoder
+    Quality = Simulator.Quality
+    FileOutput = Simulator.FileOutput
+else:
+    world = None
+
+    def __getattr__(name):
+        if name not in _HARDWARE:
+            raise AttributeError("module 'Hardware' has no attribute %r" % name)
+        module, attr = _HARDWARE[name]
+        value = importlib.import_module(module)
+        if attr is not None:
+            value = getattr(value, attr)
+        globals()[name] = value
+        return value
@@ -0,0 +1,80 @@
+import math
+import numpy as np
+
+# sin and cos of every whole degree. Commands carry whole degrees, so a lookup
+# gives the same values math.sin(math.radians()) would
+SIN = [math.sin(math.radians(degree)) for degree in range(360)]
+COS = [math.cos(math.radians(degree)) for degree in range(360)]
+SIN_ARRAY = np.array(SIN)
+COS_ARRAY = np.array(COS)
+
+# Wheel duty per unit of body motion, rows FL, BL, FR, BR, columns
+# (vx to the right, vy forward, w anticlockwise)
+WHEELS = np.array([[-1, 1, -1],
+                   [1, 1, -1],
+                   [1, 1, 1],
+                   [-1, 1, 1]], np.float64)
+# And back: the least squares body motion for four wheel duties
+BODY = np.linalg.pinv(WHEELS)
+
+
+class Mecanum:
+    """Inverse and forward kinematics of the mecanum base, in duty units.
+
+    gains scale each wheel's duty (FL, BL, FR, BR), to even out motors that
+    don't turn equally fast at the same duty. The scalar methods serve one
+    command at a time and truncate to int as the handlers always have. The
+    _array methods take NumPy arrays of any shape and return a trailing
+    axis of four wheels, for building tables and for the benches.
+    """
+    def __init__(self, gains=(1.0, 1.0, 1.0, 1.0)):
+        self.gains = np.asarray(gains, np.float64)
+        self.unity = bool(np.all(self.gains == 1.0))
+        self.gain_list = self.gains.tolist()
+
+    def wheels(self, vx, vy, w):
+        """(FL, BL, FR, BR) for body motion vx, vy and spin w."""
+        if self.unity:
+            return vy - vx - w, vy + vx - w, vy + vx + w, vy - vx + w
+        FL, BL, FR, BR = self.gain_list
+        return (int((vy - vx - w) * FL), int((vy + vx - w) * BL),
+                int((vy + vx + w) * FR), int((vy - vx + w) * BR))
+
+    def polar(self, angle, speed):
+        """(vx, vy) for speed towards angle, whole degrees clockwise from straight ahead."""
+        angle = int(angle) % 360
+        return int(speed * SIN[angle]), int(speed * COS[angle])
+
+    def steer(self, angle, speed, spin=0):
+        """(FL, BL, FR, BR) to move at speed towards angle while spinning at spin."""
+        vx, vy = self.polar(angle, speed)
+        return self.wheels(vx, vy, spin)
+
+    def joystick(self, angle1, speed1, angle2, speed2):
+        """(FL, BL, FR, BR) for the client's two sticks as CMD_M_MOTOR sends them.
+
+        The left stick translates. Only the sideways part of the right one
+        counts, as spin.
+        """
+        vx, vy = self.polar(angle1, speed1)
+        return self.wheels(vx, vy, int(speed2 * SIN[int(angle2) % 360]))
+
+    def wheels_array(self, vx, vy, w):
+        body = np.stack(np.broadcast_arrays(vx, vy, w), axis=-1).astype(np.float64)
+        return body @ WHEELS.T * self.gains
+
+    def steer_array(self, angle, speed, spin=0):
+        angle = np.asarray(angle, int) % 360
+        return self.wheels_array(np.trunc(speed * SIN_ARRAY[angle]), np.trunc(speed * COS_ARRAY[angle]), spin)
+
+    def body(self, FL, BL, FR, BR):
+        """(vx, vy, w) that the wheel duties drive, undoing the gains."""
+        return tuple(float(value) for value in self.body_array(np.array([FL, BL, FR, BR])))
+
+    def body_array(self, duties):
+        return np.asarray(duties, np.float64) / self.gains @ BODY.T
+
+    def table(self, spin, speed):
+        """(FL, BL, FR, BR) for every whole degree, moving at speed towards it while spinning at spin."""
+        duties = self.steer_array(np.arange(360), speed, spin)
+        return [tuple(row) for row in np.trunc(duties).astype(int).tolist()]
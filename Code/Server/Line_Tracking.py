@@ -1,7 +1,46 @@
+import math
 import time
+import threading
 from Motor import *
-import RPi.GPIO as GPIO
+from Hardware import GPIO
+from Pid import Pid
+import Devices
+
+# Where the line is under the sensor bar for each pattern, -1 under the left sensor to 1 under the right
+PATTERN_POSITION = {4: -1.0, 6: -0.5, 2: 0.0, 3: 0.5, 1: 1.0}
+LOST_POSITION = 1.5     # past the sensor on the side it was last seen
+
+
+def position_table():
+    """Line position for every (last pattern that placed the line, pattern) pair, indexed last << 3 | pattern.
+
+    A pattern that doesn't place the line (none, both outer sensors, all three)
+    keeps the last position; losing the line puts it just past the side it left by.
+    """
+    table = []
+    for last in range(8):
+        previous = PATTERN_POSITION.get(last, 0.0)
+        for pattern in range(8):
+            if pattern in PATTERN_POSITION:
+                table.append(PATTERN_POSITION[pattern])
+            elif pattern == 0 and previous:
+                table.append(math.copysign(LOST_POSITION, previous))
+            else:
+                table.append(previous)
+    return table
+
+
 class Line_Tracking:
+    # Sensor state (left, middle, right bits) -> wheel duties; other states keep the wheels as they are
+    DUTIES = {2: (800, 800, 800, 800),
+              4: (-1500, -1500, 2500, 2500),
+              6: (-2000, -2000, 4000, 4000),
+              1: (2500, 2500, -1500, -1500),
+              3: (4000, 4000, -2000, -2000),
+              7: (0, 0, 0, 0)}
+    TICK = 0.1  # seconds between reads when no edge comes, in case one was missed
+    POSITION = position_table()
+    RATE = 100  # Hz the follower steers at
     def __init__(self):
         self.IR01 = 14
         self.IR02 = 15
@@ -10,34 +49,84 @@ class Line_Tracking:
         GPIO.setup(self.IR01,GPIO.IN)
         GPIO.setup(self.IR02,GPIO.IN)
         GPIO.setup(self.IR03,GPIO.IN)
+        self.changed = threading.Event()
+        self.stopped = threading.Event()
+        self.reads = 0
+        self.updates = 0
+        for pin in (self.IR01, self.IR02, self.IR03):
+            GPIO.add_event_detect(pin, GPIO.BOTH, callback=self.edge)
+    def edge(self, pin):
+        self.changed.set()
+    def read(self):
+        LMR=0x00
+        if GPIO.input(self.IR01)==True:
+            LMR=(LMR | 4)
+        if GPIO.input(self.IR02)==True:
+            LMR=(LMR | 2)
+        if GPIO.input(self.IR03)==True:
+            LMR=(LMR | 1)
+        return LMR
     def run(self):
-        while True:
-            self.LMR=0x00
-            if GPIO.input(self.IR01)==True:
-                self.LMR=(self.LMR | 4)
-            if GPIO.input(self.IR02)==True:
-                self.LMR=(self.LMR | 2)
-            if GPIO.input(self.IR03)==True:
-                self.LMR=(self.LMR | 1)
-            if self.LMR==2:
-                PWM.setMotorModel(800,800,800,800)
-            elif self.LMR==4:
-                PWM.setMotorModel(-1500,-1500,2500,2500)
-            elif self.LMR==6:
-                PWM.setMotorModel(-2000,-2000,4000,4000)
-            elif self.LMR==1:
-                PWM.setMotorModel(2500,2500,-1500,-1500)
-            elif self.LMR==3:
-                PWM.setMotorModel(4000,4000,-2000,-2000)
-            elif self.LMR==7:
-                #pass
-                PWM.setMotorModel(0,0,0,0)
+        # Sleeps until a sensor pin changes and writes the motors only when the state does
+        self.PWM=Devices.motor()
+        self.LMR=None
+        while not self.stopped.is_set():
+            self.changed.clear()    # before reading, so an edge during the read wakes the next wait
+            LMR=self.read()
+            self.reads += 1
+            if LMR!=self.LMR and LMR in self.DUTIES:
+                self.PWM.setMotorModel(*self.DUTIES[LMR])
+                self.updates += 1
+                self.LMR=LMR
+            self.changed.wait(self.TICK)
+    def follow(self, speed=1500, kp=1.0, ki=0.0, kd=0.1, slow=0.4, lost=1.0):
+        # Steers on a continuous line position instead of the pattern: PID at a fixed rate,
+        # slowing by up to slow of speed as the line nears the sensors' ends. The gains are
+        # in units of speed, so one tuning holds across speeds. Stops on all
+        # three sensors, like run(), or after lost seconds without the line.
+        self.PWM=Devices.motor()
+        self.pid = Pid(kp, ki, kd, limit=2.0, tau=0.1)
+        self.speed, self.slow, self.lost = speed, slow, lost
+        self.last = 2
+        self.seen = time.monotonic()
+        self.duties = None
+        Devices.scheduler().run_until('follow', self.RATE, self.steer, self.stopped)
+    def steer(self):
+        # One step of follow(), run by the control scheduler
+        pattern = self.read()
+        now = time.monotonic()
+        self.reads += 1
+        if pattern in PATTERN_POSITION:
+            self.seen = now
+        if pattern == 7 or now - self.seen > self.lost:
+            self.pid.reset()
+            update = (0, 0, 0, 0)
+        else:
+            position = self.POSITION[self.last << 3 | pattern]
+            forward = self.speed * (1 - self.slow * min(abs(position), 1))
+            turn = self.speed * self.pid.step(position, 1.0 / self.RATE)
+            left = int(forward + turn)
+            right = int(forward - turn)
+            update = (left, left, right, right)
+        if pattern in PATTERN_POSITION:
+            self.last = pattern
+        if update != self.duties:
+            self.PWM.setMotorModel(*update)
+            self.updates += 1
+            self.duties = update
+    def reset(self):
+        # Ready for another run() or follow(). Called before its thread starts, not
+        # from it, so a stop() that lands before the thread gets going still ends the run
+        self.stopped.clear()
+    def stop(self):
+        self.stopped.set()
+        self.changed.set()
             
-infrared=Line_Tracking()
 # Main program logic follows:
 if __name__ == '__main__':
     print ('Program is starting ... ')
+    infrared=Line_Tracking()
     try:
         infrared.run()
     except KeyboardInterrupt:  # When 'Ctrl+C' is pressed, the child program  will be  executed.
-        PWM.setMotorModel(0,0,0,0)
+        Devices.motor().setMotorModel(0,0,0,0)
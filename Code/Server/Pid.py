@@ -0,0 +1,36 @@
+import math
+
+
+class Pid:
+    """PID controller for loops stepped at a fixed rate.
+
+    step(error, dt) returns kp * error + ki * integral + kd * derivative,
+    clamped to +-limit. The integral holds still while the output is clamped,
+    so a long saturation doesn't leave it wound up. The derivative is
+    low-passed over tau seconds, which keeps the steps of a quantised error
+    from kicking the output.
+    """
+    def __init__(self, kp, ki=0.0, kd=0.0, limit=None, tau=0.0):
+        self.kp = kp
+        self.ki = ki
+        self.kd = kd
+        self.limit = limit
+        self.tau = tau
+        self.reset()
+
+    def reset(self):
+        self.integral = 0.0
+        self.derivative = 0.0
+        self.error = None
+
+    def step(self, error, dt):
+        if self.error is not None and dt > 0:
+            alpha = 1.0 - math.exp(-dt / self.tau) if self.tau > 0 else 1.0
+            self.derivative += alpha * ((error - self.error) / dt - self.derivative)
+        self.error = error
+        integral = self.integral + error * dt
+        output = self.kp * error + self.ki * integral + self.kd * self.derivative
+        if self.limit is not None and abs(output) > self.limit:
+            return math.copysign(self.limit, output)
+        self.integral = integral
+        return output
@@ -0,0 +1,122 @@
+import threading
+import time
+from collections import deque
+
+
+class RangingService:
+    """Thread that pings at a fixed rate and keeps a filtered distance ready.
+
+    measure() returns one raw range in cm; 0, or anything at or beyond
+    max_distance, means no usable echo. The last window echoes sit in a
+    timestamped ring buffer. The reading is the mean of the echoes within
+    tolerance of their median, so a missed ping or a stray echo off the floor
+    does not move it. It carries the time of the newest echo it used, so its
+    age says how stale it is. Once none of the window's echoes is usable the
+    reading becomes no_echo, timed now, rather than the last obstacle seen.
+    on_echo(time, cm), if given, sees every raw echo.
+    """
+    def __init__(self, measure, rate=15, window=5, max_distance=300, tolerance=0.15, on_echo=None, no_echo=0):
+        self.measure = measure
+        self.no_echo = no_echo
+        self.on_echo = on_echo
+        self.period = 1.0 / rate
+        self.max_distance = max_distance
+        self.tolerance = tolerance
+        self.ring = deque(maxlen=window)    # (monotonic time, cm)
+        self.reading = None                 # (cm, monotonic time), replaced whole so reads need no lock
+        self.cond = threading.Condition()
+        self.stopped = threading.Event()
+        self.pings = 0
+        self.timeouts = 0       # no echo, or out of range
+        self.rejected = 0       # echoes too far from the median to be used
+        self.errors = 0
+        self.overruns = 0
+        self.thread = None
+
+    def start(self):
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.run, name="ranging", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+        with self.cond:
+            self.cond.notify_all()
+
+    def read(self):
+        return self.reading
+
+    def filter(self, echoes):
+        """Return (cm, time of the newest echo used) for echoes, None if none are usable."""
+        valid = [(t, cm) for t, cm in echoes if 0 < cm < self.max_distance]
+        if not valid:
+            return None
+        ranges = sorted(cm for t, cm in valid)
+        median = ranges[len(ranges) // 2]
+        limit = max(median * self.tolerance, 1.0)
+        inliers = [(t, cm) for t, cm in valid if abs(cm - median) <= limit]
+        return sum(cm for t, cm in inliers) / len(inliers), max(t for t, cm in inliers)
+
+    def distance_after(self, after, samples=3, timeout=1.0):
+        """Wait for samples usable echoes taken at or after the monotonic time after, and filter those.
+
+        For a reading that must not include echoes from before something moved, e.g. the
+        pan servo. Filters whatever arrived if timeout runs out first, None if nothing did.
+        """
+        def ready():
+            return self.stopped.is_set() or sum(
+                1 for t, cm in self.ring if t >= after and 0 < cm < self.max_distance) >= samples
+        with self.cond:
+            self.cond.wait_for(ready, timeout + max(after - time.monotonic(), 0))
+            result = self.filter([(t, cm) for t, cm in self.ring if t >= after])
+        return result[0] if result is not None else None
+
+    def latest_after(self, after, samples=1):
+        """Filter the echoes taken at or after the monotonic time after, once there are samples of them.
+
+        Never blocks: None until enough echoes are in. If none of them is usable nothing
+        is in range, which reads as max_distance.
+        """
+        with self.cond:
+            echoes = [(t, cm) for t, cm in self.ring if t >= after]
+        if len(echoes) < samples:
+            return None
+        result = self.filter(echoes)
+        return result[0] if result is not None else self.max_distance
+
+    def wait(self, timeout=None):
+        """Block until the next ping has been folded in."""
+        with self.cond:
+            pings = self.pings
+            return self.cond.wait_for(lambda: self.pings != pings or self.stopped.is_set(), timeout)
+
+    def run(self):
+        deadline = time.monotonic()
+        while not self.stopped.is_set():
+            try:
+                cm = self.measure()
+            except Exception:
+                self.errors += 1
+                cm = 0
+            stamp = time.monotonic()
+            if self.on_echo is not None:
+                self.on_echo(stamp, cm)     # first, so whoever waits on the ring finds it there too
+            with self.cond:
+                self.ring.append((stamp, cm))
+                self.pings += 1
+                result = self.filter(self.ring)
+                if not 0 < cm < self.max_distance:
+                    self.timeouts += 1
+                elif result is None or abs(cm - result[0]) > max(result[0] * self.tolerance, 1.0):
+                    self.rejected += 1
+                self.reading = result if result is not None else (self.no_echo, stamp)
+                self.cond.notify_all()
+            deadline += self.period
+            delay = deadline - time.monotonic()
+            if delay > 0:
+                self.stopped.wait(delay)
+            else:
+                self.overruns += 1      # fell behind, don't try to catch up
+                deadline = time.monotonic()
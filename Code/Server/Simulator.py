@@ -0,0 +1,614 @@
+import heapq
+import math
+import random
+import struct
+import threading
+import time
+
+# ============================================================================
+# Simulated car: the I2C chips, GPIO pins and camera the server drives,
+# modelled closely enough to run and benchmark it off the car. The LED strip's
+# native library is in SimWs281x. Select it with CAR_BACKEND=sim (see
+# Hardware.py).
+# ============================================================================
+
+
+class SimPCA9685:
+    """Register model of the PCA9685 PWM driver."""
+    MODE1 = 0x00
+    PRESCALE = 0xFE
+    LED0_ON_L = 0x06
+    ALLLED_ON_L = 0xFA
+
+    def __init__(self):
+        self.regs = [0] * 256
+        self.regs[self.MODE1] = 0x11        # power-on: SLEEP | ALLCALL
+        self.regs[self.PRESCALE] = 0x1E
+        self.writes = [0] * 16              # register writes that landed on each channel
+
+    def write(self, reg, value):
+        value &= 0xFF
+        if reg == self.PRESCALE and not self.regs[self.MODE1] & 0x10:
+            return                          # PRESCALE is only writable while asleep
+        if self.ALLLED_ON_L <= reg <= self.ALLLED_ON_L + 3:
+            for channel in range(16):
+                self.regs[self.LED0_ON_L + 4 * channel + reg - self.ALLLED_ON_L] = value
+                self.writes[channel] += 1
+            return
+        self.regs[reg] = value
+        if self.LED0_ON_L <= reg < self.LED0_ON_L + 64:
+            self.writes[(reg - self.LED0_ON_L) // 4] += 1
+
+    def write_block(self, reg, data):
+        auto_increment = self.regs[self.MODE1] & 0x20
+        for value in data:
+            self.write(reg, value)
+            if auto_increment:
+                reg = (reg + 1) & 0xFF
+
+    def read(self, reg):
+        if reg >= self.ALLLED_ON_L and reg != self.PRESCALE:
+            return 0                        # ALL_LED registers read back as zero
+        return self.regs[reg]
+
+    def channel(self, channel):
+        """Return the (on, off) counts of a channel, full-on/full-off bits applied."""
+        base = self.LED0_ON_L + 4 * channel
+        on = self.regs[base] | (self.regs[base + 1] & 0x1F) << 8
+        off = self.regs[base + 2] | (self.regs[base + 3] & 0x1F) << 8
+        if off & 0x1000:
+            return 0, 0
+        if on & 0x1000:
+            return 0, 4096
+        return on & 0xFFF, off & 0xFFF
+
+    def duty(self, channel):
+        on, off = self.channel(channel)
+        return ((off - on) % 4096) / 4096.0 if off != on else 0.0
+
+    def wheel_duties(self):
+        """Signed duty of each wheel (-1..1), in setMotorModel order FL, BL, FR, BR."""
+        return [self.duty(forward) - self.duty(backward)
+                for forward, backward in ((1, 0), (2, 3), (7, 6), (5, 4))]
+
+    def pulse_us(self, channel):
+        prescale = self.regs[self.PRESCALE]
+        period = (prescale + 1) * 4096 / 25e6 * 1e6
+        on, off = self.channel(channel)
+        return ((off - on) % 4096) * period / 4096.0
+
+    def servo_angle(self, channel):
+        """Commanded angle of a servo, inverting the formula in servo.pulse_table."""
+        pulse = self.pulse_us(channel)
+        if channel == 8:
+            return (2500 - pulse) * 0.09 - 10
+        return (pulse - 500) * 0.09 - 10
+
+
+class SimADS7830:
+    """ADS7830 8-channel ADC: a command byte selects the channel, reads return its conversion."""
+    def __init__(self, world):
+        self.world = world
+        self.selected = 0
+        self.decode = {}
+        for channel in range(8):
+            self.decode[((channel << 2) | (channel >> 1)) & 0x07] = channel
+
+    def write_byte(self, value):
+        self.selected = self.decode[(value >> 4) & 0x07]
+
+    def read_byte(self):
+        return self.world.adc_code(self.selected, 255)
+
+    def read_byte_data(self, reg):
+        self.write_byte(reg)
+        return self.read_byte()
+
+    def write_byte_data(self, reg, value):
+        self.write_byte(reg)
+
+
+class SimPCF8591:
+    """PCF8591 4-channel ADC: a read returns the conversion started by the previous one."""
+    def __init__(self, world):
+        self.world = world
+        self.control = 0x40
+        self.last = 0x80
+
+    def read_byte(self):
+        value, self.last = self.last, self.world.adc_code(self.control & 0x03, 256)
+        return value
+
+    def read_byte_data(self, reg):
+        self.control = reg
+        return self.read_byte()
+
+    def write_byte(self, value):
+        self.control = value
+
+    def write_byte_data(self, reg, value):
+        self.control = reg
+
+
+class SimBus:
+    """smbus.SMBus stand-in dispatching to the world's chips.
+
+    Bus time is modelled from the bytes on the wire at the world's I2C clock and,
+    when world.realtime is set, spent for real so timings stay representative.
+    """
+    def __init__(self, busnum=1, world=None):
+        self.world = world or get_world()
+        self.busnum = busnum
+        self.transactions = 0
+        self.bus_time = 0.0
+
+    def _device(self, address):
+        device = self.world.i2c.get(address)
+        if device is None:
+            raise OSError(121, "Remote I/O error")
+        return device
+
+    def _transfer(self, nbytes):
+        # start + bytes with ACK + stop
+        seconds = (2 + 9 * nbytes) / self.world.i2c_clock
+        self.transactions += 1
+        self.bus_time += seconds
+        if self.world.realtime:
+            deadline = time.perf_counter() + seconds
+            while time.perf_counter() < deadline:
+                pass
+
+    def write_byte(self, address, value):
+        self._transfer(2)
+        self._device(address).write_byte(value)
+
+    def read_byte(self, address):
+        self._transfer(2)
+        return self._device(address).read_byte()
+
+    def write_byte_data(self, address, reg, value):
+        self._transfer(3)
+        device = self._device(address)
+        if isinstance(device, SimPCA9685):
+            device.write(reg, value)
+        else:
+            device.write_byte_data(reg, value)
+
+    def read_byte_data(self, address, reg):
+        self._transfer(4)
+        device = self._device(address)
+        if isinstance(device, SimPCA9685):
+            return device.read(reg)
+        return device.read_byte_data(reg)
+
+    def write_i2c_block_data(self, address, reg, data):
+        if len(data) > 32:
+            raise ValueError("Data length cannot exceed 32 bytes")
+        self._transfer(2 + len(data))
+        self._device(address).write_block(reg, data)
+
+    def read_i2c_block_data(self, address, reg, length):
+        self._transfer(3 + length)
+        device = self._device(address)
+        return [device.read(reg + i) for i in range(length)]
+
+    def close(self):
+        pass
+
+
+class SimGPIO:
+    """RPi.GPIO stand-in. Input pins follow programmable edges, edge callbacks run on one thread."""
+    BCM = 11
+    BOARD = 10
+    IN = 1
+    OUT = 0
+    HIGH = 1
+    LOW = 0
+    RISING = 31
+    FALLING = 32
+    BOTH = 33
+    PUD_OFF = 20
+    PUD_DOWN = 21
+    PUD_UP = 22
+
+    def __init__(self):
+        self.lock = threading.Condition()
+        self.levels = {}
+        self.edges = []             # heap of (time, seq, pin, level)
+        self.seq = 0
+        self.detect = {}            # pin -> [edge, callbacks, detected]
+        self.output_hooks = {}      # pin -> fn(level), the world reacting to an output
+        self.thread = None
+
+    def setwarnings(self, flag):
+        pass
+
+    def setmode(self, mode):
+        pass
+
+    def setup(self, pin, direction, pull_up_down=None, initial=None):
+        with self.lock:
+            self.levels.setdefault(pin, 1 if pull_up_down == self.PUD_UP else 0)
+            if initial is not None:
+                self.levels[pin] = initial
+
+    def cleanup(self, pin=None):
+        with self.lock:
+            if pin is None:
+                self.detect.clear()
+            else:
+                self.detect.pop(pin, None)
+
+    def output(self, pin, level):
+        level = 1 if level else 0
+        with self.lock:
+            self.levels[pin] = level
+            hook = self.output_hooks.get(pin)
+        if hook is not None:
+            hook(level)
+
+    def input(self, pin):
+        now = time.monotonic()
+        with self.lock:
+            level = self.levels.get(pin, 0)
+            latest = None
+            for t, seq, edge_pin, edge_level in self.edges:
+                if edge_pin == pin and t <= now and (latest is None or (t, seq) > latest[:2]):
+                    latest = (t, seq, edge_level)
+            return latest[2] if latest is not None else level
+
+    def schedule(self, pin, level, delay=0.0, at=None):
+        """Drive an input pin to level after delay seconds (or at a monotonic time)."""
+        with self.lock:
+            self.seq += 1
+            heapq.heappush(self.edges, (at if at is not None else time.monotonic() + delay,
+                                        self.seq, pin, 1 if level else 0))
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="sim-gpio", daemon=True)
+                self.thread.start()
+            self.lock.notify()
+
+    def set_input(self, pin, level):
+        self.schedule(pin, level)
+
+    def add_event_detect(self, pin, edge, callback=None, bouncetime=None):
+        with self.lock:
+            if pin in self.detect:
+                raise RuntimeError("Conflicting edge detection already enabled for this GPIO channel")
+            self.detect[pin] = [edge, [callback] if callback else [], False]
+
+    def add_event_callback(self, pin, callback):
+        with self.lock:
+            self.detect[pin][1].append(callback)
+
+    def remove_event_detect(self, pin):
+        with self.lock:
+            self.detect.pop(pin, None)
+
+    def event_detected(self, pin):
+        with self.lock:
+            entry = self.detect.get(pin)
+            if entry is None or not entry[2]:
+                return False
+            entry[2] = False
+            return True
+
+    def _run(self):
+        while True:
+            with self.lock:
+                while not self.edges or self.edges[0][0] > time.monotonic():
+                    self.lock.wait(self.edges[0][0] - time.monotonic() if self.edges else None)
+                t, seq, pin, level = heapq.heappop(self.edges)
+                previous = self.levels.get(pin, 0)
+                self.levels[pin] = level
+                entry = self.detect.get(pin)
+                callbacks = []
+                if entry is not None and level != previous:
+                    edge = entry[0]
+                    if edge == self.BOTH or (edge == self.RISING) == (level == 1):
+                        entry[2] = True
+                        callbacks = list(entry[1])
+            for callback in callbacks:
+                callback(pin)
+
+
+class SimDistanceSensor:
+    """gpiozero.DistanceSensor stand-in, ranges the world along the pan servo's bearing."""
+    def __init__(self, echo=None, trigger=None, max_distance=1, **kwargs):
+        self.echo = echo
+        self.trigger = trigger
+        self.max_distance = max_distance
+        self.world = get_world()
+
+    @property
+    def distance(self):
+        return min(self.world.range_cm() / 100.0, self.max_distance)
+
+    @property
+    def value(self):
+        return self.distance / self.max_distance
+
+    def close(self):
+        pass
+
+
+class SimDigitalInputDevice:
+    """Shared part of the gpiozero input stand-ins: value follows the simulated pin."""
+    def __init__(self, pin, **kwargs):
+        self.pin = pin
+        self.gpio = get_world().gpio
+        self.gpio.setup(pin, SimGPIO.IN)
+        self.when_activated = None
+        self.when_deactivated = None
+        self.gpio.add_event_detect(pin, SimGPIO.BOTH, callback=self._edge)
+
+    def _edge(self, pin):
+        callback = self.when_activated if self.gpio.input(pin) else self.when_deactivated
+        if callback is not None:
+            callback()
+
+    @property
+    def value(self):
+        return self.gpio.input(self.pin)
+
+    @property
+    def is_active(self):
+        return bool(self.value)
+
+    def close(self):
+        self.gpio.remove_event_detect(self.pin)
+
+
+class SimLineSensor(SimDigitalInputDevice):
+    """gpiozero.LineSensor stand-in; as in gpiozero, 'line' is the inactive state."""
+    when_line = property(lambda self: self.when_deactivated,
+                         lambda self, fn: setattr(self, 'when_deactivated', fn))
+    when_no_line = property(lambda self: self.when_activated,
+                            lambda self, fn: setattr(self, 'when_activated', fn))
+
+
+class SimBuzzer:
+    """gpiozero.Buzzer stand-in."""
+    def __init__(self, pin, **kwargs):
+        self.pin = pin
+        self.gpio = get_world().gpio
+        self.gpio.setup(pin, SimGPIO.OUT)
+
+    def on(self):
+        self.gpio.output(self.pin, 1)
+
+    def off(self):
+        self.gpio.output(self.pin, 0)
+
+    @property
+    def is_active(self):
+        return bool(self.gpio.levels.get(self.pin, 0))
+
+    value = is_active
+
+
+class JpegFrames:
+    """Encodes greyscale baseline JPEG frames of a moving gradient, no imaging library needed.
+
+    Every 8x8 block is flat, so a block is its DC difference plus an end-of-block
+    code; both Huffman tables are minimal custom ones the decoder reads from DHT.
+    """
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.blocks_x = (width + 7) // 8
+        self.blocks_y = (height + 7) // 8
+        self.header = self._header()
+
+    def _segment(self, marker, payload):
+        return struct.pack('>BBH', 0xFF, marker, len(payload) + 2) + payload
+
+    def _header(self):
+        dqt = self._segment(0xDB, b'\x00' + b'\x01' * 64)
+        sof = self._segment(0xC0, struct.pack('>BHHBBBB', 8, self.height, self.width, 1, 1, 0x11, 0))
+        dc = self._segment(0xC4, b'\x00' + bytes([0, 0, 0, 12] + [0] * 12) + bytes(range(12)))
+        ac = self._segment(0xC4, b'\x10' + bytes([1] + [0] * 15) + b'\x00')
+        sos = self._segment(0xDA, bytes([1, 1, 0x00, 0, 63, 0]))
+        return b'\xFF\xD8' + dqt + sof + dc + ac + sos
+
+    def frame(self, n):
+        bits = 0
+        nbits = 0
+        out = bytearray()
+        previous = 0
+        for by in range(self.blocks_y):
+            for bx in range(self.blocks_x):
+                level = (bx * 4 + by * 2 + n * 3) % 256
+                dc = (level - 128) * 8
+                diff = dc - previous
+                previous = dc
+                size = abs(diff).bit_length()
+                magnitude = diff if diff >= 0 else diff + (1 << size) - 1
+                # DC code (4 bits, the category), magnitude, then EOB ('0')
+                bits = (((bits << 4 | size) << size | magnitude) << 1)
+                nbits += 5 + size
+                while nbits >= 8:
+                    nbits -= 8
+                    byte = (bits >> nbits) & 0xFF
+                    out.append(byte)
+                    if byte == 0xFF:
+                        out.append(0)
+                bits &= (1 << nbits) - 1
+        if nbits:
+            byte = ((bits << (8 - nbits)) | ((1 << (8 - nbits)) - 1)) & 0xFF
+            out.append(byte)
+            if byte == 0xFF:
+                out.append(0)
+        return self.header + bytes(out) + b'\xFF\xD9'
+
+
+class Preview:
+    NULL = 0
+    DRM = 1
+    QT = 2
+    QTGL = 3
+
+
+class Quality:
+    VERY_LOW = 0
+    LOW = 1
+    MEDIUM = 2
+    HIGH = 3
+    VERY_HIGH = 4
+
+
+class JpegEncoder:
+    def __init__(self, q=None, **kwargs):
+        self.q = q
+
+
+class FileOutput:
+    def __init__(self, file=None):
+        self.fileoutput = file
+
+    def outputframe(self, frame):
+        self.fileoutput.write(frame)
+
+
+class Picamera2:
+    """picamera2.Picamera2 stand-in producing JPEG frames at the configured frame rate."""
+    def __init__(self, camera_num=0):
+        self.config = None
+        self.thread = None
+        self.running = False
+        self.frames = 0
+
+    def create_video_configuration(self, main=None, controls=None, **kwargs):
+        main = dict(main or {})
+        main.setdefault('size', (640, 480))
+        controls = dict(controls or {})
+        controls.setdefault('FrameRate', 30)
+        return {'main': main, 'controls': controls}
+
+    def create_still_configuration(self, main=None, **kwargs):
+        return self.create_video_configuration(main=main, **kwargs)
+
+    def configure(self, config):
+        self.config = config
+
+    def start_recording(self, encoder, output, quality=None):
+        if self.config is None:
+            self.configure(self.create_video_configuration())
+        self.running = True
+        self.thread = threading.Thread(target=self._record, args=(output,), name="sim-camera", daemon=True)
+        self.thread.start()
+
+    def _record(self, output):
+        width, height = self.config['main']['size']
+        frames = JpegFrames(width, height)
+        period = 1.0 / self.config['controls']['FrameRate']
+        deadline = time.monotonic()
+        while self.running:
+            output.outputframe(frames.frame(self.frames))
+            self.frames += 1
+            deadline += period
+            time.sleep(max(0.0, deadline - time.monotonic()))
+
+    def stop_recording(self):
+        self.running = False
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+
+    def start(self, *args, **kwargs):
+        pass
+
+    def stop(self):
+        pass
+
+    def close(self):
+        self.stop_recording()
+
+    def start_and_capture_file(self, name, **kwargs):
+        with open(name, 'wb') as f:
+            f.write(JpegFrames(640, 480).frame(0))
+
+
+class World:
+    """Everything outside the Pi: the chips on the bus, the pins, the room and the battery.
+
+    Tweak the attributes to set up a scenario: range_fn(bearing in degrees, 90 is
+    straight ahead) returns centimetres, light holds the two photoresistor
+    voltages and battery_ocv the open-circuit pack voltage.
+    """
+    def __init__(self):
+        self.realtime = True
+        self.i2c_clock = 100000.0
+        self.adc_noise = 0.4            # LSB, standard deviation
+        self.adc_chip = 'ADS7830'
+        self.light = [2.5, 2.5]
+        self.battery_ocv = 8.2
+        self.battery_resistance = 0.25  # ohm
+        self.motor_current = 1.2        # amps per wheel at full duty
+        self.range_fn = lambda bearing: 100.0
+        self.speed_of_sound = 340.0     # m/s, what the sensor code assumes
+        self.pca = SimPCA9685()
+        self.gpio = SimGPIO()
+        self.trigger_pin = 27
+        self.echo_pin = 22
+        self.trigger_high = None
+        self.gpio.output_hooks[self.trigger_pin] = self._trigger
+        self.i2c = {0x40: self.pca}
+        self.set_adc_chip(self.adc_chip)
+
+    def set_adc_chip(self, chip):
+        self.adc_chip = chip
+        self.i2c[0x48] = SimPCF8591(self) if chip == 'PCF8591' else SimADS7830(self)
+
+    def battery_voltage(self):
+        load = sum(abs(duty) for duty in self.pca.wheel_duties()) * self.motor_current
+        return self.battery_ocv - load * self.battery_resistance
+
+    def adc_voltage(self, channel):
+        if channel < 2:
+            return self.light[channel]
+        if channel == 2:
+            return self.battery_voltage() / 3       # the board's divider
+        if channel == 7:
+            return 3.3                              # floating input, reads full scale
+        return 0.0
+
+    def adc_code(self, channel, full_scale):
+        code = self.adc_voltage(channel) / 3.3 * full_scale + random.gauss(0, self.adc_noise)
+        return max(0, min(255, int(round(code))))
+
+    def bearing(self):
+        return self.pca.servo_angle(8)
+
+    def range_cm(self):
+        return self.range_fn(self.bearing())
+
+    def _trigger(self, level):
+        # HC-SR04: the burst leaves on the falling edge of a >=10 us trigger pulse,
+        # echo goes high ~0.45 ms later and stays high for the round trip
+        now = time.monotonic()
+        if level:
+            self.trigger_high = now
+            return
+        if self.trigger_high is None:
+            return
+        self.trigger_high = None
+        distance = self.range_cm()
+        start = now + 0.00045
+        if distance > 400:                          # nothing in range: the module times out
+            width = 0.038
+        else:
+            width = distance / 100.0 * 2 / self.speed_of_sound
+        self.gpio.schedule(self.echo_pin, 1, at=start)
+        self.gpio.schedule(self.echo_pin, 0, at=start + width)
+
+
+_world = None
+_world_lock = threading.Lock()
+
+
+def get_world():
+    global _world
+    with _world_lock:
+        if _world is None:
+            _world = World()
+        return _world
@@ -1,8 +1,12 @@
 import time
+import threading
 from Motor import *
-import RPi.GPIO as GPIO
+from Hardware import GPIO
 from servo import *
 from PCA9685 import PCA9685
+from Ranging import RangingService
+from OccupancyMap import OccupancyMap
+import Devices
 
 
 class Ultrasonic:
@@ -15,6 +19,39 @@ class Ultrasonic:
         GPIO.setmode(GPIO.BCM)
         GPIO.setup(self.trigger_pin, GPIO.OUT)
         GPIO.setup(self.echo_pin, GPIO.IN)
+        self.lock = threading.Lock()  # one ping in flight at a time
+        self.edges = []  # time.monotonic_ns() of each echo edge seen since the last trigger
+        self.echoed = threading.Event()
+        GPIO.add_event_detect(self.echo_pin, GPIO.BOTH, callback=self.echo_edge)
+        self.ranger = None  # background ranging, see start_ranging()
+        self.ranger_lock = threading.Lock()
+        self.map = OccupancyMap(self.MAX_DISTANCE)  # fed with every echo taken while the pan servo was still
+        self.stopped = threading.Event()  # ends run()
+
+    def echo_edge(self, channel):  # runs on the GPIO callback thread
+        self.edges.append(time.monotonic_ns())
+        if len(self.edges) == 2:
+            self.echoed.set()
+
+    def ping(self):  # fire one ping, return the echo pulse width in us, 0 if it did not come back in time
+        with self.lock:
+            t0 = time.monotonic()
+            while GPIO.input(self.echo_pin) == GPIO.HIGH:  # the echo of an earlier, timed out ping
+                if time.monotonic() - t0 > 0.05:
+                    return 0
+                time.sleep(0.001)
+            self.edges = []
+            self.echoed.clear()
+            GPIO.output(self.trigger_pin, GPIO.HIGH)  # make trigger_pin output 10us HIGH level
+            time.sleep(0.00001)  # 10us
+            GPIO.output(self.trigger_pin, GPIO.LOW)  # make trigger_pin output LOW level
+            if not self.echoed.wait(self.timeOut * 0.000001 + 0.002):  # the echo starts ~0.5 ms after the burst
+                return 0
+            rise, fall = self.edges[:2]
+        pulseTime = (fall - rise) / 1000.0
+        if pulseTime > self.timeOut:
+            return 0
+        return pulseTime
 
     def pulseIn(self, pin, level, timeOut):  # obtain pulse time of a pin under timeOut
         t0 = time.time()
@@ -28,103 +65,180 @@ class Ultrasonic:
         pulseTime = (time.time() - t0) * 1000000
         return pulseTime
 
-    def get_distance(self):  # get the measurement results of ultrasonic module,with unit: cm
+    def measure(self):  # one ping, in cm
+        return self.ping() * 340.0 / 2.0 / 10000.0
+
+    def start_ranging(self, rate=15, window=5):  # ping rate times a second on a thread, get_distance then reads the cache
+        with self.ranger_lock:
+            if self.ranger is None:
+                self.ranger = RangingService(self.measure, rate, window, self.MAX_DISTANCE, on_echo=self.record)
+                self.ranger.start()
+            return self.ranger
+
+    def record(self, stamp, cm):  # runs on the ranging thread
+        position = Devices.servo().position('0')
+        if position is not None and stamp >= position[1]:
+            self.map.add(position[0], cm, stamp)
+
+    def stop_ranging(self):
+        with self.ranger_lock:
+            ranger, self.ranger = self.ranger, None
+        if ranger is not None:
+            ranger.stop()
+
+    def get_distance(self, age=False):  # latest distance in cm, with age=True as (cm, seconds since the echo)
+        ranger = self.ranger
+        reading = ranger.read() if ranger is not None else None
+        if reading is not None:
+            distance, stamp = reading
+            return (int(distance), time.monotonic() - stamp) if age else int(distance)
+        distance = self.scan_distance()
+        return (distance, 0.0) if age else distance
+
+    def wait_distance(self, after, samples=3, timeout=1.0):  # distance from echoes taken after the monotonic time after
+        ranger = self.ranger
+        if ranger is None:
+            time.sleep(max(after - time.monotonic(), 0))
+            return self.scan_distance()
+        distance = ranger.distance_after(after, samples, timeout)
+        return int(distance) if distance is not None else 0
+
+    def scan_distance(self):  # five pings back to back, the median in cm
         distance_cm = [0, 0, 0, 0, 0]
         for i in range(5):
-            GPIO.output(self.trigger_pin, GPIO.HIGH)  # make trigger_pin output 10us HIGH level
-            time.sleep(0.00001)  # 10us
-            GPIO.output(self.trigger_pin, GPIO.LOW)  # make trigger_pin output LOW level
-            pingTime = self.pulseIn(self.echo_pin, GPIO.HIGH, self.timeOut)  # read plus time of echo_pin
+            pingTime = self.ping()  # echo pulse time, timestamped by edge interrupts
             distance_cm[i] = pingTime * 340.0 / 2.0 / 10000.0  # calculate distance with sound speed 340m/s
         distance_cm = sorted(distance_cm)
         return int(distance_cm[2])
 
-    def run_motor(self, L, M, R):
+    def close(self):
+        self.stop_ranging()
+        GPIO.remove_event_detect(self.echo_pin)
+
+    def plan_motor(self, L, M, R):  # [(duties, seconds to hold them), ...] for the distances to the left, ahead and right
         if (L < 30 and M < 30 and R < 30) or M < 30:
-            self.PWM.setMotorModel(-1000, -1000, -1000, -1000)
-            time.sleep(0.1)
             if L < R:
-                self.PWM.setMotorModel(1000, 1000, -1000, -1000)
+                return [((-1000, -1000, -1000, -1000), 0.1), ((1000, 1000, -1000, -1000), 0)]
             else:
-                self.PWM.setMotorModel(-1000, -1000, 1000, 1000)
+                return [((-1000, -1000, -1000, -1000), 0.1), ((-1000, -1000, 1000, 1000), 0)]
         elif L < 30 and M < 30:
-            PWM.setMotorModel(1500, 1500, -1500, -1500)
+            return [((1500, 1500, -1500, -1500), 0)]
         elif R < 30 and M < 30:
-            PWM.setMotorModel(-1500, -1500, 1500, 1500)
+            return [((-1500, -1500, 1500, 1500), 0)]
         elif L < 20:
-            PWM.setMotorModel(1500, 1500, -500, -500)
             if L < 10:
-                PWM.setMotorModel(1500, 1500, -1000, -1000)
+                return [((1500, 1500, -1000, -1000), 0)]
+            return [((1500, 1500, -500, -500), 0)]
         elif R < 20:
-            PWM.setMotorModel(-500, -500, 1500, 1500)
             if R < 10:
-                PWM.setMotorModel(-1000, -1000, 1000, 1000)
+                return [((-1000, -1000, 1000, 1000), 0)]
+            return [((-500, -500, 1500, 1500), 0)]
         else:
-            self.PWM.setMotorModel(600, 600, 600, 600)
+            return [((600, 600, 600, 600), 0)]
 
-    def run(self):
-        self.PWM = Motor()
-        self.pwm_S = Servo()
-
-        while True:
-            self.pwm_S.setServoPwm("0", 90)
-            time.sleep(0.1)
-            M = self.get_distance()
-
-            if M < 30:
-                self.pwm_S.setServoPwm("0", 30)
-                time.sleep(0.2)
-                L = self.get_distance()
-                self.pwm_S.setServoPwm("0", 151)
-                time.sleep(0.2)
-                R = self.get_distance()
-                self.run_motor(L, M, R)
-                self.pwm_S.setServoPwm("0", 90)
-            else:
-                self.run_motor(20, M, 20)
-
-    def run0(self):
-        self.PWM = Motor()
-        self.pwm_S = Servo()
-
-        for i in range(30, 151, 60):
-            self.pwm_S.setServoPwm('0', i)
-            time.sleep(0.2)
-            if i == 30:
-                L = self.get_distance()
-            elif i == 90:
-                M = self.get_distance()
-            else:
-                R = self.get_distance()
-        while True:
-            for i in range(90, 30, -60):
-                self.pwm_S.setServoPwm('0', i)
-                time.sleep(0.2)
-                if i == 30:
-                    L = self.get_distance()
-                elif i == 90:
-                    M = self.get_distance()
+    def run_motor(self, L, M, R):
+        for duties, seconds in self.plan_motor(L, M, R):
+            self.PWM.setMotorModel(*duties)
+            time.sleep(seconds)
+
+    # Obstacle avoidance as a state machine stepped by tick(). Nothing in a tick waits:
+    # the servo travels and settles, the ranging thread pings and the motors run a
+    # maneuver while later ticks carry on, so the car decides on the freshest distance
+    # every tick instead of once per sweep. The sides come from the occupancy map.
+    #   cruise   servo ahead, drive on each new reading; too close starts a back-off, then
+    #   backoff  if the map knows both sides: turn away from the nearer one when it ends
+    #   scan     otherwise look left, then right, while backing off, and stop until both are in
+    #   turn     turn until the servo is back ahead and has read
+    TICK = 0.02  # seconds
+    BLOCKED = 30  # cm ahead that starts a back-off
+    TURN = 0.2  # seconds a turn is held at least
+
+    def start_avoiding(self):
+        self.PWM = Devices.motor()
+        self.pwm_S = Devices.servo()
+        self.start_ranging()
+        self.look(90)
+        self.state = 'cruise'
+        self.ahead = None
+        self.duties = None
+        self.hold_until = 0.0
+        self.decisions = 0
+
+    def look(self, angle):  # point the servo, readings count once it should have settled
+        self.pwm_S.setServoPwm('0', angle)
+        self.bearing, self.settled = self.pwm_S.position('0')
+
+    def drive(self, duties, seconds=0):
+        if duties != self.duties:
+            self.PWM.setMotorModel(*duties)
+            self.duties = duties
+        self.hold_until = time.monotonic() + seconds
+
+    def side(self, angle, now):  # unknown reads as clear
+        clear = self.map.clearance_at(angle, now)
+        return self.MAX_DISTANCE if clear is None else clear
+
+    def turn(self, now):
+        self.decisions += 1
+        self.drive(self.plan_motor(self.side(30, now), 0, self.side(151, now))[-1][0], self.TURN)
+        self.state = 'turn'
+        if self.bearing != 90:
+            self.look(90)
+
+    def tick(self):
+        now = time.monotonic()
+        # The last two echoes, both from after the servo settled: one stray echo can't stop the car
+        reading = self.ranger.latest_after(max(self.settled, now - 0.15), 2)
+        if self.state == 'cruise':
+            if reading is not None:
+                self.ahead = reading
+            if self.ahead is None or now < self.hold_until:
+                return
+            self.decisions += 1
+            if self.ahead < self.BLOCKED:
+                self.drive(self.plan_motor(0, 0, 0)[0][0], 0.1)  # back off right away
+                if self.map.clearance_at(30, now) is not None and self.map.clearance_at(151, now) is not None:
+                    self.state = 'backoff'
                 else:
-                    R = self.get_distance()
-                self.run_motor(L, M, R)
-            for i in range(30, 151, 60):
-                self.pwm_S.setServoPwm('0', i)
-                time.sleep(0.2)
-                if i == 30:
-                    L = self.get_distance()
-                elif i == 90:
-                    M = self.get_distance()
+                    self.state = 'scan'  # the scan overlaps the back-off
+                    self.look(30)
+            else:
+                self.drive(self.plan_motor(self.side(30, now), self.ahead, self.side(151, now))[-1][0])
+        elif self.state == 'backoff':
+            if now >= self.hold_until:
+                self.turn(now)
+        elif self.state == 'scan':
+            if reading is not None:
+                if self.bearing == 30:
+                    self.look(151)
                 else:
-                    R = self.get_distance()
-                self.run_motor(L, M, R)
+                    self.turn(now)
+            elif now >= self.hold_until and self.duties != (0, 0, 0, 0):
+                self.drive((0, 0, 0, 0))  # backed off, wait for the sides
+        elif self.state == 'turn':
+            if reading is not None and now >= self.hold_until:
+                self.ahead = reading
+                self.state = 'cruise'
+
+    def run(self):
+        self.start_avoiding()
+        Devices.scheduler().run_until('avoid', 1.0 / self.TICK, self.tick, self.stopped)
+
+    def reset(self):  # ready for another run(), called before its thread starts so an early stop() still counts
+        self.stopped.clear()
+
+    def stop(self):  # once run() has returned, tick() won't drive or look again
+        self.stopped.set()
 
+    def run0(self):  # the continuous sweep, now part of run()
+        self.run()
 
-ultrasonic = Ultrasonic()
 # Main program logic follows:
 if __name__ == '__main__':
     print('Program is starting ... ')
+    ultrasonic = Ultrasonic()
     try:
         ultrasonic.run()
     except KeyboardInterrupt:  # When 'Ctrl+C' is pressed, the child program destroy() will be  executed.
-        PWM.setMotorModel(0, 0, 0, 0)
+        ultrasonic.PWM.setMotorModel(0, 0, 0, 0)
         ultrasonic.pwm_S.setServoPwm('0', 90)
@@ -1,3 +1,3 @@
-from picamera2 import Picamera2
+from Hardware import Picamera2
 picam2 = Picamera2()
 picam2.start_and_capture_file("image.jpg")
\ No newline at end of file